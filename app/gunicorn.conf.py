@@ -0,0 +1,91 @@
+# gunicorn configuration for serving the app in production:
+#     gunicorn -c app/gunicorn.conf.py
+# 'manage.py runserver' is a development server (1 process, reloads on every change),
+# gunicorn runs several worker processes and each of them serves several requests at once.
+# every value can be changed with an environment variable without rebuilding the image.
+import os
+
+
+def _cpu_count():
+    """ Return the number of CPUs this container is allowed to use """
+    # 'sched_getaffinity' respects the CPUs given to the container,
+    # 'cpu_count' returns all of the CPUs of the host.
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+bind = os.environ.get('GUNICORN_BIND', f"0.0.0.0:{os.environ.get('PORT', '8000')}")
+
+# the usual rule is (2 x CPUs) + 1 processes: while a worker waits for the database
+# another one can use the CPU.
+workers = int(os.environ.get('WEB_CONCURRENCY', _cpu_count() * 2 + 1))
+
+# each process also runs a few threads ('gthread' worker), the requests mostly wait for
+# the database so the threads share the CPU well and use less memory than more processes.
+# NOTE: with the database pool enabled, DB_POOL_MAX_SIZE must be at least 'threads'.
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+worker_class = os.environ.get(
+    'GUNICORN_WORKER_CLASS',
+    'gthread' if threads > 1 else 'sync'
+)
+
+# the ASGI app is served with 'GUNICORN_WORKER_CLASS=uvicorn.workers.UvicornWorker'.
+if 'uvicorn' in worker_class:
+    wsgi_app = 'app.asgi:application'
+else:
+    wsgi_app = 'app.wsgi:application'
+
+# load the app once in the master process before forking the workers:
+# the workers start faster and share the memory of the loaded code.
+# (each worker opens its own database connections and pool after the fork.)
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') == '1'
+
+# keep the connection of a client (usually the load balancer) open between requests.
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+
+# restart a worker after it served this many requests (+ a random part so the workers
+# don't all restart at the same time), which limits the effect of any memory leak.
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 1000))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 100))
+
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+
+# the workers' heartbeat files are kept in memory instead of on the container disk.
+worker_tmp_dir = os.environ.get('GUNICORN_WORKER_TMP_DIR', '/dev/shm')
+
+# log the requests and errors to the console so the container logs collect them.
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG', '-')
+errorlog = '-'
+loglevel = os.environ.get('GUNICORN_LOG_LEVEL', 'info')
+
+raw_env = [
+    'DJANGO_SETTINGS_MODULE='
+    + os.environ.get('DJANGO_SETTINGS_MODULE', 'app.settings_prod'),
+]
+
+
+def on_starting(server):
+    """ Remove the metrics snapshots of the previous run (see 'core/metrics.py') """
+    directory = os.environ.get('METRICS_DIR')
+    if directory and os.path.isdir(directory):
+        for filename in os.listdir(directory):
+            if filename.startswith('metrics-'):
+                os.remove(os.path.join(directory, filename))
+
+
+def worker_exit(server, worker):
+    """ Save the last values of an exiting worker """
+    directory = os.environ.get('METRICS_DIR')
+    if directory and os.path.isdir(directory):
+        from core import metrics
+        metrics.REGISTRY.flush(directory)
+
+
+def child_exit(server, worker):
+    """ Merge the metrics snapshot of an exited worker into the totals """
+    directory = os.environ.get('METRICS_DIR')
+    if directory and os.path.isdir(directory):
+        from core import metrics
+        metrics.merge_process_snapshot(directory, worker.pid)
@@ -12,6 +12,8 @@ https://docs.djangoproject.com/en/3.2/ref/settings/
 import os
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -37,6 +39,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     # installed Dependencies
     'rest_framework',
     'rest_framework.authtoken',
@@ -47,6 +50,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # first, so it measures the whole request (see 'REQUEST_PROFILING' below).
+    'core.middleware.ProfilingMiddleware',
+    # the request counts and latencies served on '/metrics' (see 'METRICS' below).
+    'core.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -84,7 +91,9 @@ DATABASES = {
     # Setting PostgreSQL database as a default database
     'default': {
         # Database Engine => PostgreSQL engine
-        'ENGINE': 'django.db.backends.postgresql',
+        # (the default PostgreSQL backend plus connection health checks and pooling,
+        # see 'core/db/backends/postgresql/base.py')
+        'ENGINE': 'core.db.backends.postgresql',
         'HOST': os.environ.get('DB_HOST'),
         'NAME': os.environ.get('DB_NAME'),
         'USER': os.environ.get('DB_USER'),
@@ -92,10 +101,127 @@ DATABASES = {
         # the benefit of this is that we can easily change our config. when we run our app on different servers
         # by simply changing them in the environment variables and we don't have to make any changes to our source code to modify:
         # HostName, Name, UserName, Password.
+        # how many seconds a connection is kept open to be reused by the next requests
+        # of the same thread (0 = close it at the end of every request).
+        # always 0 with the pool below: the connections go back to the pool instead.
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 60)),
+        # check a reused connection still works before the first query of a request.
+        'CONN_HEALTH_CHECKS': os.environ.get('DB_CONN_HEALTH_CHECKS', '1') == '1',
+        # share the connections between the threads of a process (disabled when
+        # DB_POOL_MAX_SIZE is 0). when all of them are in use, a thread waits up to
+        # 'TIMEOUT' seconds for one before the request fails.
+        'POOL': {
+            'MIN_SIZE': int(os.environ.get('DB_POOL_MIN_SIZE', 1)),
+            'MAX_SIZE': int(os.environ.get('DB_POOL_MAX_SIZE', 0)),
+            'TIMEOUT': float(os.environ.get('DB_POOL_TIMEOUT', 30)),
+        },
     }
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/3.2/topics/cache/
+
+# by default it's an in-memory cache for each process.
+# in production you can point all the processes to a shared cache (e.g. memcached)
+# by setting "CACHE_BACKEND" and "CACHE_LOCATION" environment variables.
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get(
+            'CACHE_BACKEND',
+            'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.environ.get('CACHE_LOCATION', ''),
+    }
+}
+
+# how long (in seconds) the tag and ingredient list responses are cached.
+RECIPE_ATTR_CACHE_TIMEOUT = int(os.environ.get('RECIPE_ATTR_CACHE_TIMEOUT', 300))
+
+# caching of the "Authorization: Token ..." lookups (see 'core/authentication.py').
+# the in-process tier can't be invalidated by other processes so keep its TTL short.
+# set "TOKEN_AUTH_SHARED_CACHE" to a cache alias to also share the entries between processes.
+TOKEN_AUTH_CACHE = {
+    'LOCAL_TTL': int(os.environ.get('TOKEN_AUTH_LOCAL_TTL', 5)),
+    'LOCAL_MAX_ENTRIES': int(os.environ.get('TOKEN_AUTH_LOCAL_MAX_ENTRIES', 10000)),
+    'SHARED_CACHE_ALIAS': os.environ.get('TOKEN_AUTH_SHARED_CACHE') or None,
+    'SHARED_TTL': int(os.environ.get('TOKEN_AUTH_SHARED_TTL', 300)),
+}
+
+# the stateless signed tokens (see 'core/authentication.py'), off by default.
+# "POST /api/user/token/" with "token_type": "signed" returns a token valid for
+# 'MAX_AGE' seconds, sent as "Authorization: Bearer <token>".
+# the revoked tokens are saved in the database, the other processes reject them
+# after up to 'REVOKED_SYNC_INTERVAL' seconds.
+SIGNED_TOKEN = {
+    'ENABLED': os.environ.get('SIGNED_TOKENS', '0') == '1',
+    'MAX_AGE': int(os.environ.get('SIGNED_TOKEN_MAX_AGE', 3600)),
+    'REVOKED_SYNC_INTERVAL': float(os.environ.get('SIGNED_TOKEN_REVOKED_SYNC_INTERVAL', 1)),
+}
+
+# the per-request profiling (see 'core/middleware.py'), off by default.
+# requests slower than 'SLOW_REQUEST_MS' or running more than 'MAX_QUERIES' queries are logged,
+# and a 'PROFILE_SAMPLE_RATE' fraction of the requests (e.g. 0.01 = 1%) is profiled
+# with cProfile into 'PROFILE_DIR' (under WSGI only, the ASGI requests aren't profiled).
+REQUEST_PROFILING = {
+    'ENABLED': os.environ.get('REQUEST_PROFILING', '0') == '1',
+    'SLOW_REQUEST_MS': int(os.environ.get('REQUEST_PROFILING_SLOW_MS', 500)),
+    'MAX_QUERIES': int(os.environ.get('REQUEST_PROFILING_MAX_QUERIES', 50)),
+    'PROFILE_SAMPLE_RATE': float(os.environ.get('REQUEST_PROFILING_SAMPLE_RATE', 0)),
+    'PROFILE_DIR': os.environ.get('REQUEST_PROFILING_DIR') or None,
+}
+
+# the metrics served on '/metrics' (see 'core/metrics.py').
+# with several worker processes (gunicorn), set 'METRICS_DIR' to a directory shared by
+# all of them so '/metrics' reports the totals of every process.
+# set 'METRICS_TOKEN' to require "Authorization: Bearer <token>" to read the metrics.
+METRICS = {
+    'ENABLED': os.environ.get('METRICS_ENABLED', '1') == '1',
+    'MULTIPROCESS_DIR': os.environ.get('METRICS_DIR') or None,
+    'FLUSH_INTERVAL': float(os.environ.get('METRICS_FLUSH_INTERVAL', 1)),
+    'TOKEN': os.environ.get('METRICS_TOKEN') or None,
+}
+
+# the password hashing cost (see 'core/hashers.py').
+# "PASSWORD_HASHER" picks the algorithm of the new hashes: 'pbkdf2' (default), 'argon2'
+# (needs "pip install argon2-cffi") or 'bcrypt' (needs "pip install bcrypt").
+# the stored hashes are upgraded to the chosen algorithm and cost when their users log in.
+# each process hashes at most 'WORKERS' passwords at the same time, whatever the number of
+# requests. the limit is per process: with gunicorn the whole server hashes up to
+# 'WORKERS' x the number of gunicorn workers (WEB_CONCURRENCY) passwords at once, which
+# is already about 2 per CPU with the default of 1 (see 'app/gunicorn.conf.py').
+PASSWORD_HASHING = {
+    'PROFILE': os.environ.get('PASSWORD_HASHER', 'pbkdf2'),
+    'PBKDF2_ITERATIONS': int(os.environ.get('PASSWORD_PBKDF2_ITERATIONS', 260000)),
+    'ARGON2_TIME_COST': int(os.environ.get('PASSWORD_ARGON2_TIME_COST', 2)),
+    'ARGON2_MEMORY_COST': int(os.environ.get('PASSWORD_ARGON2_MEMORY_COST', 102400)),
+    'ARGON2_PARALLELISM': int(os.environ.get('PASSWORD_ARGON2_PARALLELISM', 8)),
+    'BCRYPT_ROUNDS': int(os.environ.get('PASSWORD_BCRYPT_ROUNDS', 12)),
+    'WORKERS': int(os.environ.get('PASSWORD_HASHING_WORKERS', 1)),
+}
+
+_PASSWORD_HASHER_PROFILES = {
+    'pbkdf2': 'core.hashers.TunedPBKDF2PasswordHasher',
+    'argon2': 'core.hashers.TunedArgon2PasswordHasher',
+    'bcrypt': 'core.hashers.TunedBCryptSHA256PasswordHasher',
+}
+if PASSWORD_HASHING['PROFILE'] not in _PASSWORD_HASHER_PROFILES:
+    raise ImproperlyConfigured(
+        f'PASSWORD_HASHER must be one of {", ".join(_PASSWORD_HASHER_PROFILES)}.'
+    )
+
+# the first hasher hashes the new passwords, the others can still check the old hashes.
+PASSWORD_HASHERS = [_PASSWORD_HASHER_PROFILES[PASSWORD_HASHING['PROFILE']]] + [
+    hasher for profile, hasher in _PASSWORD_HASHER_PROFILES.items()
+    if profile != PASSWORD_HASHING['PROFILE']
+] + [
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+]
+
+# checks the passwords in the hashing pool (see 'core/backends.py').
+AUTHENTICATION_BACKENDS = ['core.backends.PooledModelBackend']
+
+
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
 
@@ -165,3 +291,80 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 AUTH_USER_MODEL = 'core.User'
 
+# Django REST Framework
+# https://www.django-rest-framework.org/api-guide/settings/
+
+REST_FRAMEWORK = {
+    # the default number of items per page for the paginated list endpoints.
+    'PAGE_SIZE': int(os.environ.get('API_PAGE_SIZE', 100)),
+    # token bucket throttling (see 'core/throttling.py'): every user (or anonymous IP)
+    # can send bursts of up to N requests, refilled at N per period ('600/min').
+    # the image uploads also have their own rate ('uploads').
+    'DEFAULT_THROTTLE_CLASSES': [
+        'core.throttling.UserTokenBucketThrottle',
+        'core.throttling.ScopedTokenBucketThrottle',
+    ],
+    'DEFAULT_THROTTLE_RATES': {
+        'user': os.environ.get('THROTTLE_USER_RATE', '600/min'),
+        'anon': os.environ.get('THROTTLE_ANON_RATE', '100/min'),
+        'uploads': os.environ.get('THROTTLE_UPLOADS_RATE', '30/min'),
+    },
+    # the buckets are kept in each process by default, so the real limit is the rate
+    # times the number of processes (gunicorn workers) and nodes. set "THROTTLE_STORE"
+    # to 'core.throttling.CacheBucketStore' to share the buckets between all of them
+    # through the "THROTTLE_CACHE" cache alias (memcached or redis, not the default
+    # local memory cache).
+    'TOKEN_BUCKET': {
+        'ENABLED': os.environ.get('THROTTLING', '1') == '1',
+        'STORE': os.environ.get('THROTTLE_STORE', 'core.throttling.LocalBucketStore'),
+        'CACHE_ALIAS': os.environ.get('THROTTLE_CACHE', 'default'),
+        'MAX_ENTRIES': int(os.environ.get('THROTTLE_MAX_ENTRIES', 100000)),
+        # a request takes 1 more token per 'BYTES_PER_TOKEN' bytes of body.
+        'BYTES_PER_TOKEN': int(os.environ.get('THROTTLE_BYTES_PER_TOKEN', 1024 * 1024)),
+    },
+    # the anonymous requests are throttled by IP address. without a proxy the client
+    # could send any 'X-Forwarded-For' header to get a new bucket, so it's ignored by
+    # default. behind proxies/load balancers set 'NUM_PROXIES' to how many of them add
+    # themselves to the header: the address the last of them saw is used.
+    'NUM_PROXIES': int(os.environ.get('THROTTLE_NUM_PROXIES', 0)),
+}
+
+# the pagination classes are set on each viewset ('recipe/pagination.py'), so DRF's
+# warning about 'PAGE_SIZE' without a 'DEFAULT_PAGINATION_CLASS' doesn't apply.
+SILENCED_SYSTEM_CHECKS = ['rest_framework.W001']
+
+# clients can ask for a different page size with '?page_size=' but never more than this.
+API_MAX_PAGE_SIZE = int(os.environ.get('API_MAX_PAGE_SIZE', 1000))
+
+
+# how many recipes are read from the database at a time when streaming the recipe export.
+RECIPE_EXPORT_CHUNK_SIZE = int(os.environ.get('RECIPE_EXPORT_CHUNK_SIZE', 500))
+
+# serve the recipe read endpoints with async views under ASGI, the sync views run in a pool
+# of 'ASYNC_VIEW_WORKERS' threads (see 'core/asyncviews.py').
+ASYNC_READ_VIEWS = os.environ.get('ASYNC_READ_VIEWS', '0') == '1'
+ASYNC_VIEW_WORKERS = int(os.environ.get('ASYNC_VIEW_WORKERS', 16))
+
+# the number of background threads that resize uploaded recipe images (see 'recipe/images.py').
+RECIPE_IMAGE_WORKERS = int(os.environ.get('RECIPE_IMAGE_WORKERS', 2))
+
+# limits for the recipe image uploads (see 'recipe/uploads.py').
+RECIPE_IMAGE_MAX_UPLOAD_SIZE = int(
+    os.environ.get('RECIPE_IMAGE_MAX_UPLOAD_SIZE', 10 * 1024 * 1024)
+)
+RECIPE_IMAGE_MAX_PIXELS = int(os.environ.get('RECIPE_IMAGE_MAX_PIXELS', 40_000_000))
+RECIPE_IMAGE_ALLOWED_FORMATS = ('JPEG', 'PNG', 'WEBP', 'GIF')
+
+# where uploads are streamed to while they're received (None is the system temp dir).
+# putting it on the same volume as "MEDIA_ROOT" turns saving the upload into a rename.
+FILE_UPLOAD_TEMP_DIR = os.environ.get('FILE_UPLOAD_TEMP_DIR') or None
+
+# the maximum number of items accepted by the '/bulk/' endpoints in 1 request.
+RECIPE_BULK_MAX_BATCH_SIZE = int(os.environ.get('RECIPE_BULK_MAX_BATCH_SIZE', 1000))
+
+# the PostgreSQL text search configuration (language) of the recipe search.
+RECIPE_SEARCH_CONFIG = os.environ.get('RECIPE_SEARCH_CONFIG', 'english')
+
+# the default and maximum number of suggestions of the tag/ingredient autocomplete.
+RECIPE_AUTOCOMPLETE_LIMIT = 10
+RECIPE_AUTOCOMPLETE_MAX_LIMIT = 50
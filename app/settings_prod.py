@@ -0,0 +1,54 @@
+"""
+Production settings: the development settings with DEBUG turned off
+and the secrets read from environment variables.
+
+Use them with DJANGO_SETTINGS_MODULE=app.settings_prod
+(gunicorn uses them by default, see 'app/gunicorn.conf.py').
+"""
+import os
+
+from django.core.exceptions import ImproperlyConfigured
+
+from app.settings import *  # noqa: F401,F403
+
+
+# DEBUG keeps a copy of every SQL query in memory and shows the detailed
+# error pages (with the settings) to anybody, it must never be on in production.
+DEBUG = False
+
+SECRET_KEY = os.environ.get('DJANGO_SECRET_KEY')
+if not SECRET_KEY:
+    raise ImproperlyConfigured('DJANGO_SECRET_KEY must be set in production.')
+
+# the host names the app is served on, comma separated (e.g. "api.example.com").
+ALLOWED_HOSTS = [
+    host.strip()
+    for host in os.environ.get('DJANGO_ALLOWED_HOSTS', '').split(',')
+    if host.strip()
+]
+
+# when the app is behind a proxy/load balancer that terminates HTTPS, it tells us
+# the original scheme with this header.
+if os.environ.get('DJANGO_SECURE_PROXY_SSL_HEADER', '0') == '1':
+    SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
+    SESSION_COOKIE_SECURE = True
+    CSRF_COOKIE_SECURE = True
+
+# the browsable API renders HTML templates on every response, production clients only need JSON.
+REST_FRAMEWORK = {
+    **REST_FRAMEWORK,  # noqa: F405
+    'DEFAULT_RENDERER_CLASSES': ['rest_framework.renderers.JSONRenderer'],
+}
+
+# the errors go to the console, where the container logs collect them.
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'root': {
+        'handlers': ['console'],
+        'level': os.environ.get('DJANGO_LOG_LEVEL', 'WARNING'),
+    },
+}
@@ -18,10 +18,14 @@ from django.urls import path, include
 from django.conf.urls.static import static
 from django.conf import settings
 
+from core.views import metrics_view
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/user/', include('user.urls')),
     path('api/recipe/', include('recipe.urls')),
+    # the request, cache and upload metrics for Prometheus (see 'core/metrics.py').
+    path('metrics', metrics_view, name='metrics'),
     # Reference/URL for our media files
     # By default the Django development server will serve static files for any dependencies in our project.
     # it doesn't serve the media files by default, so you need to manually add this in the URLS.
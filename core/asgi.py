@@ -0,0 +1,68 @@
+import django
+
+from asgiref.sync import sync_to_async
+
+from django.core.handlers.asgi import ASGIHandler
+
+
+# Django 3.2's ASGI handler reads the body of a 'StreamingHttpResponse' directly in the
+# event loop, so a streamed response that runs queries while it's read (e.g. the recipe
+# export, which fetches a chunk of recipes for each part) fails with
+# 'SynchronousOnlyOperation', and anything slow in the iterator would block every other
+# request of the process.
+# this handler builds each part of a streamed response in a thread with 'sync_to_async'
+# instead, and only sends it from the event loop. the thread is the same one Django runs
+# the sync views in, so the queries use the same connection as the view and it's closed
+# with the response ('request_finished').
+
+_DONE = object()
+
+
+class StreamingASGIHandler(ASGIHandler):
+    """ The ASGI handler, reading the streamed responses in a thread """
+
+    async def send_response(self, response, send):
+        if not response.streaming:
+            return await super().send_response(response, send)
+
+        # the same headers as Django's handler, only the body is sent differently.
+        response_headers = []
+        for header, value in response.items():
+            if isinstance(header, str):
+                header = header.encode('ascii')
+            if isinstance(value, str):
+                value = value.encode('latin1')
+            response_headers.append((bytes(header), bytes(value)))
+        for c in response.cookies.values():
+            response_headers.append(
+                (b'Set-Cookie', c.output(header='').encode('ascii').strip())
+            )
+        await send({
+            'type': 'http.response.start',
+            'status': response.status_code,
+            'headers': response_headers,
+        })
+        await self._send_streaming_body(response, send)
+        await sync_to_async(response.close, thread_sensitive=True)()
+
+    async def _send_streaming_body(self, response, send):
+        # access '__iter__' and not 'streaming_content', like Django's handler.
+        parts = iter(response)
+        next_part = sync_to_async(next, thread_sensitive=True)
+        while True:
+            part = await next_part(parts, _DONE)
+            if part is _DONE:
+                break
+            for chunk, _last in self.chunk_bytes(part):
+                await send({
+                    'type': 'http.response.body',
+                    'body': chunk,
+                    'more_body': True,
+                })
+        await send({'type': 'http.response.body'})
+
+
+def get_asgi_application():
+    """ Like Django's 'get_asgi_application', with the streaming handler """
+    django.setup(set_prefix=False)
+    return StreamingASGIHandler()
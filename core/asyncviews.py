@@ -0,0 +1,100 @@
+import asyncio
+import contextvars
+import functools
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+
+from django.conf import settings
+from django.db import close_old_connections, connections
+
+
+# Under ASGI, Django runs every sync view through 'sync_to_async', which (by default)
+# sends all of them to 1 shared thread, so a slow request holds up the others.
+# Django 3.2 has no async ORM, so the read endpoints are wrapped in async views that
+# run the sync view in a dedicated pool of threads instead: the event loop keeps
+# accepting connections (e.g. slow clients) while up to 'ASYNC_VIEW_WORKERS'
+# requests run their queries at the same time, and the rest wait in the queue.
+
+ASYNC_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_executor = None
+_executor_workers = 0
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor, _executor_workers
+    with _executor_lock:
+        if _executor is None:
+            _executor_workers = getattr(settings, 'ASYNC_VIEW_WORKERS', 16)
+            _executor = ThreadPoolExecutor(
+                max_workers=_executor_workers,
+                thread_name_prefix='async-view'
+            )
+        return _executor
+
+
+def _run_view(view, request, args, kwargs):
+    """ Run a sync view and render its response in a worker thread """
+    # the request_started/finished signals close the old connections in the thread
+    # that handles them, not in these threads, so we do it here: it applies
+    # 'CONN_MAX_AGE' and the health checks to the connection of this thread.
+    close_old_connections()
+    try:
+        response = view(request, *args, **kwargs)
+        # rendering (e.g. to JSON) is CPU work that shouldn't run in the event loop.
+        if hasattr(response, 'render') and callable(response.render):
+            response = response.render()
+        return response
+    finally:
+        close_old_connections()
+
+
+def async_view(view, methods=ASYNC_METHODS):
+    """ Wrap a sync view in an async view that runs it in a bounded thread pool
+
+    Only the requests using one of 'methods' go to the pool, the others
+    are run the same way Django runs a sync view under ASGI.
+    """
+    sync_view = sync_to_async(view)
+
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if request.method not in methods:
+            return await sync_view(request, *args, **kwargs)
+        loop = asyncio.get_running_loop()
+        # unlike 'sync_to_async', 'run_in_executor' doesn't pass the context variables
+        # to the thread (e.g. the query timers of 'core/middleware.py').
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(
+            _get_executor(), context.run, _run_view, view, request, args, kwargs
+        )
+
+    return wrapper
+
+
+def _close_connections(barrier):
+    try:
+        connections.close_all()
+    finally:
+        # the thread waits for the others, so every thread runs this once.
+        barrier.wait()
+
+
+def shutdown():
+    """ Close the database connections of the threads and stop them
+
+    e.g. before the test database is dropped, the threads keep their connection
+    between the views ('CONN_MAX_AGE'). a new pool is started if a view runs again.
+    """
+    global _executor
+    with _executor_lock:
+        executor, workers, _executor = _executor, _executor_workers, None
+    if executor is not None:
+        barrier = threading.Barrier(workers)
+        for _index in range(workers):
+            executor.submit(_close_connections, barrier)
+        executor.shutdown(wait=True)
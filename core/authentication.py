@@ -0,0 +1,378 @@
+import datetime
+import hashlib
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core import signing
+from django.core.cache import caches
+from django.utils.crypto import salted_hmac
+from django.utils.translation import gettext_lazy as _
+
+from rest_framework import exceptions
+from rest_framework.authentication import BaseAuthentication, TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from core import metrics
+from core.cache import LocalLRUCache
+from core.models import RevokedToken
+
+
+# Every request with "Authorization: Token <key>" normally costs a query to find the token and its user.
+# the token -> user pairs are cached in 2 tiers:
+# 1. a small in-process LRU (no network at all), with a short TTL because other
+#    processes can't invalidate it.
+# 2. an optional shared Django cache (e.g. memcached) that every process can invalidate.
+
+DEFAULT_TOKEN_AUTH_CACHE = {
+    'LOCAL_TTL': 5,
+    'LOCAL_MAX_ENTRIES': 10000,
+    'SHARED_CACHE_ALIAS': None,
+    'SHARED_TTL': 300,
+}
+
+_local_cache = None
+
+
+def _get_config():
+    return {**DEFAULT_TOKEN_AUTH_CACHE, **getattr(settings, 'TOKEN_AUTH_CACHE', {})}
+
+
+def _get_local_cache():
+    global _local_cache
+    config = _get_config()
+    if (
+        _local_cache is None
+        or _local_cache.ttl != config['LOCAL_TTL']
+        or _local_cache.max_entries != config['LOCAL_MAX_ENTRIES']
+    ):
+        _local_cache = LocalLRUCache(
+            max_entries=config['LOCAL_MAX_ENTRIES'],
+            ttl=config['LOCAL_TTL']
+        )
+    return _local_cache
+
+
+def _get_shared_cache():
+    alias = _get_config()['SHARED_CACHE_ALIAS']
+    return caches[alias] if alias else None
+
+
+def _cache_key(token_key):
+    # the token is a password, so don't use it directly as a cache key (cache keys can end up in logs).
+    # 'v2': the cached values have changed format (no password), don't read the old ones.
+    return 'auth-token:v2:' + hashlib.sha256(token_key.encode()).hexdigest()
+
+
+# the password hash is never cached: the shared cache (e.g. memcached) is not as well
+# protected as the database. the cached users have it deferred, so it's only loaded
+# (1 query) if something actually reads it.
+CACHED_USER_EXCLUDED_FIELDS = ('password',)
+
+
+def _dump_user(user):
+    """ Return the cacheable values of a user, without the password """
+    fields = [
+        field for field in user._meta.concrete_fields
+        if field.attname not in CACHED_USER_EXCLUDED_FIELDS
+    ]
+    return (
+        user._state.db,
+        tuple(field.attname for field in fields),
+        tuple(getattr(user, field.attname) for field in fields),
+    )
+
+
+def _load_user(values):
+    """ Build a fresh user instance from cached values """
+    db, field_names, user_values = values
+    # 'from_db' is what Django uses to build instances from a database row,
+    # so every request gets its own user object that it can safely modify.
+    # the fields missing from 'field_names' are deferred.
+    return get_user_model().from_db(db, field_names, user_values)
+
+
+def _dump_token(token):
+    """ Return the cacheable (picklable and immutable) values of a token and its user """
+    return (token.key, token.created, _dump_user(token.user))
+
+
+def _load_token(values):
+    """ Build fresh token and user instances from cached values """
+    key, created, user_values = values
+    user = _load_user(user_values)
+    token = Token(key=key, user=user, created=created)
+    return token
+
+
+def invalidate_token(token_key):
+    """ Remove a token from the authentication caches """
+    cache_key = _cache_key(token_key)
+    _get_local_cache().delete(cache_key)
+    shared_cache = _get_shared_cache()
+    if shared_cache is not None:
+        shared_cache.delete(cache_key)
+
+
+def invalidate_user_tokens(user_id):
+    """ Remove all the tokens of a user from the authentication caches """
+    for token_key in Token.objects.filter(user_id=user_id).values_list('key', flat=True):
+        invalidate_token(token_key)
+
+
+def clear_token_cache():
+    """ Empty the in-process authentication cache """
+    _get_local_cache().clear()
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """ Token authentication that caches the token and user lookup """
+
+    def authenticate_credentials(self, key):
+        cache_key = _cache_key(key)
+        local_cache = _get_local_cache()
+        shared_cache = _get_shared_cache()
+
+        values = local_cache.get(cache_key)
+        metrics.record_cache('token_auth_local', values is not None)
+        if values is None and shared_cache is not None:
+            values = shared_cache.get(cache_key)
+            metrics.record_cache('token_auth_shared', values is not None)
+            if values is not None:
+                local_cache.set(cache_key, values)
+
+        if values is None:
+            # not cached: this does the database lookup and raises for an invalid token.
+            user, token = super().authenticate_credentials(key)
+            values = _dump_token(token)
+            local_cache.set(cache_key, values)
+            if shared_cache is not None:
+                shared_cache.set(
+                    cache_key,
+                    values,
+                    timeout=_get_config()['SHARED_TTL']
+                )
+
+        token = _load_token(values)
+        if not token.user.is_active:
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+
+        return (token.user, token)
+
+
+# Signed tokens ("Authorization: Bearer <token>"), an optional stateless alternative to
+# the database tokens above: the token itself holds the user ID, an ID of the token
+# ('jti') and a "version" of the user, signed with the SECRET_KEY (HMAC) and timestamped,
+# so checking it needs no database lookup:
+# - the signature and the expiry ('MAX_AGE' after the signature's timestamp) are
+#   checked with the 'signing' module.
+# - the version is a digest of the user's email, password hash and active flag. changing
+#   any of them (e.g. a new password or deactivating the user) invalidates every token
+#   issued before.
+# - the user is cached like the database tokens' users (in-process LRU + optional
+#   shared cache, without the password hash) with its version, and dropped from the
+#   caches when it's saved (see 'core/signals.py').
+# - a single token can be revoked before it expires: its 'jti' is saved in the
+#   'RevokedToken' table until the token would expire anyway. a cache could evict it
+#   earlier (e.g. when someone revokes lots of tokens) and the token would work again.
+#   every process keeps a copy of the table in memory and reads the new rows at most
+#   every 'REVOKED_SYNC_INTERVAL' seconds, so the other processes reject a revoked
+#   token after up to that delay (the process that revoked it does straight away).
+
+DEFAULT_SIGNED_TOKEN = {
+    'ENABLED': False,
+    'MAX_AGE': 3600,
+    'REVOKED_SYNC_INTERVAL': 1,
+}
+
+SIGNED_TOKEN_SALT = 'core.authentication.SignedTokenAuthentication'
+
+_revocation_list = None
+_revocation_list_lock = threading.Lock()
+
+
+def get_signed_token_config():
+    return {**DEFAULT_SIGNED_TOKEN, **getattr(settings, 'SIGNED_TOKEN', {})}
+
+
+class RevocationList:
+    """ The unexpired rows of the 'RevokedToken' table, in memory """
+
+    # the rows revoked up to this many seconds before the last read are read again,
+    # in case the clocks of the processes that saved them are a bit behind.
+    CLOCK_SKEW = 60
+
+    def __init__(self):
+        self._expires = {}
+        self._synced = None
+        self._lock = threading.Lock()
+
+    def add(self, jti, expires):
+        with self._lock:
+            self._expires[jti] = expires
+
+    def is_revoked(self, jti):
+        self._sync()
+        with self._lock:
+            return jti in self._expires
+
+    def _sync(self):
+        now = time.time()
+        with self._lock:
+            synced = self._synced
+        interval = get_signed_token_config()['REVOKED_SYNC_INTERVAL']
+        if synced is not None and now - synced < interval:
+            return
+
+        rows = RevokedToken.objects.filter(expires__gt=_datetime(now))
+        if synced is not None:
+            rows = rows.filter(revoked__gte=_datetime(synced - self.CLOCK_SKEW))
+        revoked = {
+            jti: expires.timestamp() for jti, expires in rows.values_list('jti', 'expires')
+        }
+        with self._lock:
+            self._expires.update(revoked)
+            for jti, expires in list(self._expires.items()):
+                if expires <= now:
+                    del self._expires[jti]
+            # only once the rows were read: if the query fails, the next request retries.
+            self._synced = now
+
+
+def _datetime(timestamp):
+    return datetime.datetime.fromtimestamp(timestamp, tz=datetime.timezone.utc)
+
+
+def _get_revocation_list():
+    global _revocation_list
+    with _revocation_list_lock:
+        if _revocation_list is None:
+            _revocation_list = RevocationList()
+        return _revocation_list
+
+
+def _user_cache_key(user_id):
+    return f'auth-user:v2:{user_id}'
+
+
+def get_user_version(user):
+    """ Return the version of a user embedded in its signed tokens """
+    value = f'{user.email}:{user.password}:{user.is_active}'
+    return salted_hmac(SIGNED_TOKEN_SALT, value).hexdigest()[:16]
+
+
+def create_signed_token(user):
+    """ Return a new signed token for a user """
+    return signing.dumps(
+        {
+            'u': user.pk,
+            'v': get_user_version(user),
+            'j': uuid.uuid4().hex,
+            'i': int(time.time()),
+        },
+        salt=SIGNED_TOKEN_SALT
+    )
+
+
+def invalidate_user(user_id):
+    """ Remove a user from the signed token caches """
+    cache_key = _user_cache_key(user_id)
+    _get_local_cache().delete(cache_key)
+    shared_cache = _get_shared_cache()
+    if shared_cache is not None:
+        shared_cache.delete(cache_key)
+
+
+def revoke_signed_token(payload):
+    """ Stop accepting a signed token before it expires """
+    RevokedToken.objects.bulk_create(
+        [RevokedToken(jti=payload['j'], expires=_datetime(payload['expires']))],
+        ignore_conflicts=True
+    )
+    # the expired tokens are rejected anyway, their rows aren't needed anymore.
+    RevokedToken.objects.filter(expires__lte=_datetime(time.time())).delete()
+    _get_revocation_list().add(payload['j'], payload['expires'])
+
+
+def clear_revoked_tokens():
+    """ Forget the in-process copy of the revocation list (e.g. between tests) """
+    global _revocation_list
+    with _revocation_list_lock:
+        _revocation_list = None
+
+
+def _is_revoked(jti):
+    return _get_revocation_list().is_revoked(jti)
+
+
+def _get_user(user_id):
+    """ Return (user, user version) of a signed token, from the caches if possible """
+    cache_key = _user_cache_key(user_id)
+    local_cache = _get_local_cache()
+    shared_cache = _get_shared_cache()
+
+    values = local_cache.get(cache_key)
+    metrics.record_cache('signed_token_user_local', values is not None)
+    if values is None and shared_cache is not None:
+        values = shared_cache.get(cache_key)
+        metrics.record_cache('signed_token_user_shared', values is not None)
+        if values is not None:
+            local_cache.set(cache_key, values)
+
+    if values is None:
+        user = get_user_model()._default_manager.filter(pk=user_id).first()
+        if user is None:
+            return None, None
+        # only the version derived from the password hash is cached, not the hash itself.
+        values = (_dump_user(user), get_user_version(user))
+        local_cache.set(cache_key, values)
+        if shared_cache is not None:
+            shared_cache.set(cache_key, values, timeout=_get_config()['SHARED_TTL'])
+
+    user_values, version = values
+    return _load_user(user_values), version
+
+
+class SignedTokenAuthentication(BaseAuthentication):
+    """ Authentication with signed tokens ("Authorization: Bearer <token>")
+
+    'request.auth' is the token payload: {'u': user ID, 'v': user version,
+    'j': token ID, 'i': issue timestamp, 'expires': expiry timestamp}.
+    """
+    keyword = 'Bearer'
+
+    def authenticate(self, request):
+        auth = request.META.get('HTTP_AUTHORIZATION', '').split()
+        if not auth or auth[0] != self.keyword:
+            return None
+        if not get_signed_token_config()['ENABLED']:
+            return None
+        if len(auth) != 2:
+            raise exceptions.AuthenticationFailed(_('Invalid token header.'))
+        return self.authenticate_credentials(auth[1])
+
+    def authenticate_credentials(self, token):
+        max_age = get_signed_token_config()['MAX_AGE']
+        try:
+            payload = signing.loads(token, salt=SIGNED_TOKEN_SALT, max_age=max_age)
+        except signing.SignatureExpired:
+            raise exceptions.AuthenticationFailed(_('Token expired.'))
+        except signing.BadSignature:
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+
+        if _is_revoked(payload['j']):
+            raise exceptions.AuthenticationFailed(_('Token revoked.'))
+
+        user, version = _get_user(payload['u'])
+        if user is None or not user.is_active:
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+        if version != payload['v']:
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+
+        payload['expires'] = payload['i'] + max_age
+        return (user, payload)
+
+    def authenticate_header(self, request):
+        return self.keyword
@@ -0,0 +1,34 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+
+from core import hashers
+
+
+class PooledModelBackend(ModelBackend):
+    """ The model backend, checking the passwords in the hashing pool
+
+    The hash of an outdated password (another algorithm or cost than the
+    settings) is replaced after a successful login.
+    """
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        UserModel = get_user_model()
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+        try:
+            user = UserModel._default_manager.get_by_natural_key(username)
+        except UserModel.DoesNotExist:
+            # hash anyway, so the response time doesn't tell if the user exists.
+            hashers.make_password(password)
+            return None
+
+        is_correct, must_update = hashers.check_password(password, user.password)
+        if not is_correct:
+            return None
+        if must_update:
+            hashers.set_password(user, password)
+            # the query runs here in the request thread, not in the pool.
+            user.save(update_fields=['password'])
+        return user if self.user_can_authenticate(user) else None
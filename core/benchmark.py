@@ -0,0 +1,469 @@
+import asyncio
+import io
+import math
+import statistics
+import time
+
+from importlib import import_module
+
+from asgiref.sync import sync_to_async
+from PIL import Image
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connections
+from django.test.utils import override_settings
+from django.urls import URLResolver, include, path, reverse
+from django.utils.http import urlencode
+
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core import asyncviews
+from core.asgi import StreamingASGIHandler
+from core.authentication import create_signed_token
+from core.middleware import QueryTimer, track_queries
+from core.models import Recipe
+
+from recipe import urls as recipe_urls
+
+
+# Measures the latency and the number of SQL queries of every API endpoint.
+# The requests go straight to Django (like the test client does), without a server or
+# network in between, so the numbers are the cost of our own code and queries.
+# each scenario is 1 endpoint (+ method, + variant of the query params), it's requested
+# 'warmup' times (not measured: caches, first connection...) then 'iterations' times.
+#
+# 'run_concurrent' measures the read endpoints that 'ASYNC_READ_VIEWS' serves with async
+# views (see 'core/asyncviews.py') under concurrent requests instead: the requests go
+# through the ASGI handler, with the sync and then the async views, to compare them.
+
+
+class BenchmarkError(Exception):
+    """ A benchmarked request didn't return the expected status """
+
+
+class Scenario:
+    """ 1 benchmarked request: its method, URL and payload for each iteration """
+
+    def __init__(self, name, method, url, data=None, status=200,
+                 authenticated=True, data_format='json', headers=None):
+        self.name = name
+        self.method = method
+        self.url = url
+        self.data = data
+        self.status = status
+        self.authenticated = authenticated
+        self.data_format = data_format
+        self.headers = headers
+
+    def request_kwargs(self, iteration):
+        url = self.url(iteration) if callable(self.url) else self.url
+        data = self.data(iteration) if callable(self.data) else self.data
+        headers = self.headers(iteration) if callable(self.headers) else self.headers
+        return {'path': url, 'data': data, 'format': self.data_format, **(headers or {})}
+
+
+def _jpeg_bytes():
+    """ Return a small JPEG image """
+    buffer = io.BytesIO()
+    Image.new('RGB', (64, 64), (200, 100, 50)).save(buffer, format='JPEG')
+    return buffer.getvalue()
+
+
+def build_scenarios(user, password):
+    """ Return the scenarios for every endpoint of the recipe and user APIs """
+    recipe_ids = list(
+        Recipe.objects.filter(user=user).order_by('id').values_list('id', flat=True)
+    )
+    tag_ids = list(user.tag_set.values_list('id', flat=True)[:2])
+    ingredient_ids = list(user.ingredient_set.values_list('id', flat=True)[:3])
+    image = _jpeg_bytes()
+
+    def recipe_url(name):
+        return lambda i: reverse(name, args=[recipe_ids[i % len(recipe_ids)]])
+
+    def new_recipe(i):
+        return {
+            'title': f'Benchmark {i}',
+            'time_minutes': 10,
+            'price': '5.00',
+            'tags': tag_ids,
+            'ingredients': ingredient_ids,
+        }
+
+    # the URLs and headers are built before the request is timed, so the recipe
+    # to delete and the tokens to revoke are created outside of the measure.
+    def recipes_to_update(i):
+        # 10 different recipes (fewer if the user doesn't have 10) per request.
+        count = min(10, len(recipe_ids))
+        return [
+            {
+                'id': recipe_ids[(i * count + n) % len(recipe_ids)],
+                'time_minutes': 10 + i % 50,
+                'tags': tag_ids,
+            }
+            for n in range(count)
+        ]
+
+    def recipe_to_delete_url(i):
+        recipe = Recipe.objects.create(
+            user=user, title=f'Deleted {i}', time_minutes=10, price='5.00'
+        )
+        return reverse('recipe:recipe-detail', args=[recipe.id])
+
+    def database_token(i):
+        # revoking deletes the token, so each one belongs to a new user
+        # (a user has only 1 token and the other scenarios use 'user's).
+        token_user = get_user_model().objects.create(email=f'revoke{i}@example.com')
+        return {'HTTP_AUTHORIZATION': f'Token {Token.objects.create(user=token_user).key}'}
+
+    def signed_token(i):
+        return {'HTTP_AUTHORIZATION': f'Bearer {create_signed_token(user)}'}
+
+    return [
+        # user API
+        Scenario(
+            'user:create [POST]', 'post', reverse('user:create'),
+            data=lambda i: {
+                'email': f'benchmark{i}@example.com',
+                'password': 'benchmark',
+                'name': 'Benchmark',
+            },
+            status=201, authenticated=False
+        ),
+        Scenario(
+            'user:token [POST]', 'post', reverse('user:token'),
+            data={'email': user.email, 'password': password},
+            authenticated=False
+        ),
+        Scenario(
+            'user:token-revoke [POST]', 'post', reverse('user:token-revoke'),
+            headers=database_token, status=204, authenticated=False
+        ),
+        Scenario(
+            'user:token-revoke [POST signed]', 'post', reverse('user:token-revoke'),
+            headers=signed_token, status=204, authenticated=False
+        ),
+        Scenario('user:me', 'get', reverse('user:me')),
+        Scenario(
+            'user:me [PATCH]', 'patch', reverse('user:me'),
+            data=lambda i: {'name': f'User {i}'}
+        ),
+        # the same password again, so it's still valid for the other scenarios.
+        Scenario(
+            'user:me [PUT]', 'put', reverse('user:me'),
+            data=lambda i: {'email': user.email, 'password': password, 'name': f'User {i}'}
+        ),
+        # tags and ingredients
+        Scenario('recipe:tag-list', 'get', reverse('recipe:tag-list')),
+        Scenario(
+            'recipe:tag-list [POST]', 'post', reverse('recipe:tag-list'),
+            data=lambda i: {'name': f'Benchmark {i}'}, status=201
+        ),
+        Scenario(
+            'recipe:tag-autocomplete', 'get', reverse('recipe:tag-autocomplete'),
+            data={'q': 've'}
+        ),
+        Scenario(
+            'recipe:tag-bulk [POST]', 'post', reverse('recipe:tag-bulk'),
+            data=lambda i: [{'name': f'Bulk {i} {n}'} for n in range(10)],
+            status=201
+        ),
+        Scenario('recipe:ingredient-list', 'get', reverse('recipe:ingredient-list')),
+        Scenario(
+            'recipe:ingredient-list [assigned_only]', 'get',
+            reverse('recipe:ingredient-list'), data={'assigned_only': 1}
+        ),
+        Scenario(
+            'recipe:ingredient-list [POST]', 'post', reverse('recipe:ingredient-list'),
+            data=lambda i: {'name': f'Benchmark {i}'}, status=201
+        ),
+        Scenario(
+            'recipe:ingredient-autocomplete', 'get',
+            reverse('recipe:ingredient-autocomplete'), data={'q': 'ga'}
+        ),
+        Scenario(
+            'recipe:ingredient-bulk [POST]', 'post', reverse('recipe:ingredient-bulk'),
+            data=lambda i: [{'name': f'Bulk {i} {n}'} for n in range(10)],
+            status=201
+        ),
+        # recipes
+        Scenario('recipe:recipe-list', 'get', reverse('recipe:recipe-list')),
+        Scenario(
+            'recipe:recipe-list [filtered]', 'get', reverse('recipe:recipe-list'),
+            data={
+                'tags': ','.join(str(pk) for pk in tag_ids),
+                'price_max': '30',
+                'ordering': 'price',
+            }
+        ),
+        Scenario(
+            'recipe:recipe-list [search]', 'get', reverse('recipe:recipe-list'),
+            data={'search': 'curry'}
+        ),
+        Scenario(
+            'recipe:recipe-list [fields]', 'get', reverse('recipe:recipe-list'),
+            data={'fields': 'id,title'}
+        ),
+        Scenario(
+            'recipe:recipe-list [expand]', 'get', reverse('recipe:recipe-list'),
+            data={'expand': 'tags,ingredients'}
+        ),
+        Scenario(
+            'recipe:recipe-list [POST]', 'post', reverse('recipe:recipe-list'),
+            data=new_recipe, status=201
+        ),
+        Scenario('recipe:recipe-detail', 'get', recipe_url('recipe:recipe-detail')),
+        Scenario(
+            'recipe:recipe-detail [PATCH]', 'patch', recipe_url('recipe:recipe-detail'),
+            data=lambda i: {'time_minutes': 10 + i % 50}
+        ),
+        Scenario(
+            'recipe:recipe-detail [PUT]', 'put', recipe_url('recipe:recipe-detail'),
+            data=new_recipe
+        ),
+        Scenario(
+            'recipe:recipe-detail [DELETE]', 'delete', recipe_to_delete_url, status=204
+        ),
+        Scenario(
+            'recipe:recipe-upload-image [POST]', 'post',
+            recipe_url('recipe:recipe-upload-image'),
+            data=lambda i: {
+                'image': SimpleUploadedFile('bench.jpg', image, 'image/jpeg')
+            },
+            data_format='multipart'
+        ),
+        Scenario('recipe:recipe-export', 'get', reverse('recipe:recipe-export')),
+        Scenario(
+            'recipe:recipe-bulk [POST]', 'post', reverse('recipe:recipe-bulk'),
+            data=lambda i: [new_recipe(i * 10 + n) for n in range(10)],
+            status=201
+        ),
+        Scenario(
+            'recipe:recipe-bulk [PATCH]', 'patch', reverse('recipe:recipe-bulk'),
+            data=recipes_to_update
+        ),
+    ]
+
+
+def percentile(values, percent):
+    """ Return the nearest-rank percentile of a list of numbers """
+    ordered = sorted(values)
+    rank = max(1, math.ceil(percent / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def measure(client, scenario, iterations, warmup=0):
+    """ Request a scenario several times and return its statistics """
+    durations = []
+    query_counts = []
+    for iteration in range(warmup + iterations):
+        kwargs = scenario.request_kwargs(iteration)
+        with track_queries(QueryTimer()) as queries:
+            start = time.perf_counter()
+            response = getattr(client, scenario.method)(**kwargs)
+            if response.streaming:
+                b''.join(response.streaming_content)
+            duration = time.perf_counter() - start
+
+        if response.status_code != scenario.status:
+            raise BenchmarkError(
+                f'{scenario.name}: expected status {scenario.status}, '
+                f'got {response.status_code}: {response.content[:500]!r}'
+            )
+        if iteration >= warmup:
+            durations.append(duration * 1000)
+            query_counts.append(queries.count)
+
+    return {
+        'requests': iterations,
+        'mean_ms': round(statistics.mean(durations), 3),
+        'p50_ms': round(percentile(durations, 50), 3),
+        'p90_ms': round(percentile(durations, 90), 3),
+        'p99_ms': round(percentile(durations, 99), 3),
+        'max_ms': round(max(durations), 3),
+        'queries_mean': round(statistics.mean(query_counts), 2),
+        'queries_max': max(query_counts),
+    }
+
+
+def _benchmark_settings():
+    """ Return the settings to override while benchmarking """
+    # the benchmark sends far more requests than a client is allowed to, don't throttle them.
+    rest_framework = getattr(settings, 'REST_FRAMEWORK', {})
+    rest_framework = {
+        **rest_framework,
+        'TOKEN_BUCKET': {**rest_framework.get('TOKEN_BUCKET', {}), 'ENABLED': False},
+    }
+    # the signed tokens are off by default, they're enabled to benchmark them too.
+    signed_tokens = {**getattr(settings, 'SIGNED_TOKEN', {}), 'ENABLED': True}
+    return {'REST_FRAMEWORK': rest_framework, 'SIGNED_TOKEN': signed_tokens}
+
+
+def run(user, password, iterations=50, warmup=5, only=None, log=None):
+    """ Benchmark every scenario as 'user' and return {scenario name: statistics} """
+    token, _created = Token.objects.get_or_create(user=user)
+    authenticated = APIClient()
+    authenticated.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+    anonymous = APIClient()
+
+    results = {}
+    with override_settings(**_benchmark_settings()):
+        for scenario in build_scenarios(user, password):
+            if only and only not in scenario.name:
+                continue
+            client = authenticated if scenario.authenticated else anonymous
+            results[scenario.name] = measure(client, scenario, iterations, warmup)
+            if log is not None:
+                log(scenario.name, results[scenario.name])
+    return results
+
+
+class _URLConf:
+    """ A URLconf built at runtime instead of imported from a module """
+
+    def __init__(self, urlpatterns):
+        self.urlpatterns = urlpatterns
+
+
+def build_urlconf(async_reads):
+    """ Return the project's URLconf with the recipe read endpoints sync or async """
+    # 'recipe/urls.py' picks the views once when it's imported ('ASYNC_READ_VIEWS'),
+    # both versions are built here so 1 process can compare them.
+    recipe_patterns = recipe_urls.router.urls
+    if async_reads:
+        recipe_patterns = recipe_urls.with_async_reads(recipe_patterns)
+    urlpatterns = []
+    for url in import_module(settings.ROOT_URLCONF).urlpatterns:
+        if isinstance(url, URLResolver) and url.namespace == recipe_urls.app_name:
+            url = URLResolver(
+                url.pattern,
+                _URLConf([path('', include(recipe_patterns))]),
+                url.default_kwargs,
+                url.app_name,
+                url.namespace
+            )
+        urlpatterns.append(url)
+    return _URLConf(urlpatterns)
+
+
+def _is_async_read(scenario):
+    names = {f'{recipe_urls.app_name}:{name}' for name in recipe_urls.ASYNC_READ_URL_NAMES}
+    return scenario.method == 'get' and scenario.name.split(' ')[0] in names
+
+
+def _asgi_scope(scenario, iteration, headers):
+    kwargs = scenario.request_kwargs(iteration)
+    return {
+        'type': 'http',
+        'method': 'GET',
+        'path': kwargs['path'],
+        'query_string': urlencode(kwargs['data'] or {}, doseq=True).encode(),
+        'headers': [(b'host', b'testserver')] + headers,
+    }
+
+
+async def _asgi_request(handler, scope):
+    """ Send a request to an ASGI handler and return its status """
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    await handler(scope, receive, send)
+    return messages[0]['status']
+
+
+async def measure_concurrent(handler, scenario, headers, requests, concurrency, warmup=0):
+    """ Send a scenario's requests with 'concurrency' of them at a time, return the statistics """
+    semaphore = asyncio.Semaphore(concurrency)
+    durations = []
+
+    async def send(iteration, scope):
+        async with semaphore:
+            start = time.perf_counter()
+            status = await _asgi_request(handler, scope)
+            if iteration >= warmup:
+                durations.append((time.perf_counter() - start) * 1000)
+        if status != scenario.status:
+            raise BenchmarkError(
+                f'{scenario.name}: expected status {scenario.status}, got {status}'
+            )
+
+    scopes = [_asgi_scope(scenario, i, headers) for i in range(warmup + requests)]
+    await asyncio.gather(*(send(i, scope) for i, scope in enumerate(scopes[:warmup])))
+    start = time.perf_counter()
+    await asyncio.gather(
+        *(send(i, scope) for i, scope in enumerate(scopes) if i >= warmup)
+    )
+    elapsed = time.perf_counter() - start
+
+    return {
+        'requests': requests,
+        'concurrency': concurrency,
+        'throughput_rps': round(requests / elapsed, 1),
+        'p50_ms': round(percentile(durations, 50), 3),
+        'p90_ms': round(percentile(durations, 90), 3),
+        'p99_ms': round(percentile(durations, 99), 3),
+        'max_ms': round(max(durations), 3),
+    }
+
+
+def run_concurrent(user, password, concurrency=16, requests=200, warmup=10,
+                   only=None, log=None):
+    """ Benchmark the async read endpoints under concurrency with and without async views
+
+    Returns {'sync': {scenario name: statistics}, 'async': {...}}.
+    """
+    token, _created = Token.objects.get_or_create(user=user)
+    headers = [(b'authorization', f'Token {token.key}'.encode())]
+    handler = StreamingASGIHandler()
+
+    results = {}
+    for mode, async_reads in (('sync', False), ('async', True)):
+        results[mode] = {}
+        urlconf = build_urlconf(async_reads)
+        with override_settings(ROOT_URLCONF=urlconf, **_benchmark_settings()):
+            for scenario in build_scenarios(user, password):
+                if not _is_async_read(scenario) or (only and only not in scenario.name):
+                    continue
+                results[mode][scenario.name] = asyncio.run(measure_concurrent(
+                    handler, scenario, headers, requests, concurrency, warmup
+                ))
+                if log is not None:
+                    log(mode, scenario.name, results[mode][scenario.name])
+            # the threads that ran the views keep their database connections open
+            # ('CONN_MAX_AGE'), they must be closed before the test database is dropped.
+            asyncviews.shutdown()
+            asyncio.run(sync_to_async(connections.close_all)())
+    return results
+
+
+def compare(results, baseline, tolerance=0.2, min_delta_ms=1.0):
+    """ Return the regressions of the results compared to a baseline
+
+    A scenario regressed if its median or p90 latency grew by more than
+    'tolerance' (and 'min_delta_ms', so sub-millisecond noise is ignored),
+    or if it runs more queries than before.
+    """
+    regressions = []
+    for name, base in baseline.items():
+        current = results.get(name)
+        if current is None:
+            continue
+        for key in ('p50_ms', 'p90_ms'):
+            limit = max(base[key] * (1 + tolerance), base[key] + min_delta_ms)
+            if current[key] > limit:
+                regressions.append(
+                    f'{name}: {key} {current[key]:.2f} > {base[key]:.2f} (+{tolerance:.0%})'
+                )
+        if current['queries_max'] > base['queries_max']:
+            regressions.append(
+                f'{name}: {current["queries_max"]} queries > {base["queries_max"]}'
+            )
+    return regressions
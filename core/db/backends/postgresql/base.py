@@ -0,0 +1,205 @@
+import os
+import threading
+
+import psycopg2.extras
+import psycopg2.pool
+
+from django.db.backends.postgresql import base
+
+
+# Opening a PostgreSQL connection costs a TCP handshake, the authentication and a new
+# server process, which is often slower than the queries of the request itself.
+# This backend adds 2 ways of reusing connections to the default PostgreSQL backend:
+#
+# - persistent connections ('CONN_MAX_AGE'): each thread keeps its connection open
+#   between requests. 'CONN_HEALTH_CHECKS' (a backport of the Django 4.1 setting)
+#   checks a reused connection once per request, before its first query, so a
+#   connection the server dropped while it was idle doesn't fail the request.
+#
+# - a connection pool ('POOL'): the connections are shared by all the threads of the
+#   process through a psycopg2 'ThreadedConnectionPool'. closing a connection at the
+#   end of a request gives it back to the pool instead of closing it, so a few
+#   connections can serve many threads. a thread keeping its connection would never
+#   share it, so 'CONN_MAX_AGE' is always 0 with a pool. when all the connections are
+#   in use, a thread waits up to 'TIMEOUT' seconds for one to be given back.
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class BlockingConnectionPool:
+    """ A 'ThreadedConnectionPool' that waits for a free connection when it's full
+
+    psycopg2's pool raises 'PoolError' straight away when every connection is in use.
+    """
+
+    def __init__(self, min_size, max_size, timeout, **conn_params):
+        self.pool = psycopg2.pool.ThreadedConnectionPool(min_size, max_size, **conn_params)
+        self.timeout = timeout
+        # 1 slot per connection: taken by 'getconn' and given back by 'putconn'.
+        self._slots = threading.BoundedSemaphore(max_size)
+        # the connections given back at least once (by 'id()'), the others were just opened.
+        self._reused = set()
+        self._reused_lock = threading.Lock()
+
+    def getconn(self):
+        if not self._slots.acquire(timeout=self.timeout):
+            # an 'OperationalError', so Django reports it like any failed connection.
+            raise psycopg2.OperationalError(
+                f'No database connection was free after {self.timeout} seconds '
+                '(the pool is full, raise DB_POOL_MAX_SIZE or lower the number of threads).'
+            )
+        try:
+            return self.pool.getconn()
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def putconn(self, connection, close=False):
+        with self._reused_lock:
+            if close:
+                self._reused.discard(id(connection))
+            else:
+                self._reused.add(id(connection))
+        try:
+            self.pool.putconn(connection, close=close)
+        finally:
+            self._slots.release()
+
+    def is_reused(self, connection):
+        """ Return True if the connection was used before being given back """
+        with self._reused_lock:
+            return id(connection) in self._reused
+
+    def closeall(self):
+        with self._reused_lock:
+            self._reused.clear()
+        self.pool.closeall()
+
+
+def get_pool(alias, settings_dict, conn_params):
+    """ Return the connection pool of a database, None if pooling is disabled """
+    options = settings_dict.get('POOL') or {}
+    max_size = options.get('MAX_SIZE', 0)
+    if not max_size:
+        return None
+
+    # the connections can't be shared with a forked process (e.g. a gunicorn
+    # worker started after the app was loaded), so each process has its own pool.
+    key = (alias, os.getpid())
+    pool = _pools.get(key)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(key)
+            if pool is None:
+                # the pool keeps up to 'MIN_SIZE' idle connections open,
+                # the others are closed when they're given back.
+                pool = BlockingConnectionPool(
+                    options.get('MIN_SIZE', 1),
+                    max_size,
+                    options.get('TIMEOUT', 30),
+                    **conn_params
+                )
+                _pools[key] = pool
+    return pool
+
+
+def close_pools():
+    """ Close every connection of the pools of this process """
+    with _pools_lock:
+        for key in [key for key in _pools if key[1] == os.getpid()]:
+            _pools.pop(key).closeall()
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """ PostgreSQL backend with connection health checks and pooling """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if (self.settings_dict.get('POOL') or {}).get('MAX_SIZE'):
+            # the connections go back to the pool at the end of every request.
+            self.settings_dict['CONN_MAX_AGE'] = 0
+        self.health_check_done = False
+        self.pool = None
+        self.discard_connection = False
+
+    @property
+    def health_checks_enabled(self):
+        return self.settings_dict.get('CONN_HEALTH_CHECKS', False)
+
+    def _is_alive(self, connection):
+        """ Check a psycopg2 connection still works """
+        if connection.closed:
+            return False
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            # without autocommit the query started a transaction, and Django can't change
+            # the session (e.g. 'set_autocommit') inside of it.
+            if not connection.autocommit:
+                connection.rollback()
+        except psycopg2.Error:
+            return False
+        return True
+
+    def get_new_connection(self, conn_params):
+        self.health_check_done = True
+        self.discard_connection = False
+        self.pool = get_pool(self.alias, self.settings_dict, conn_params)
+        if self.pool is None:
+            return super().get_new_connection(conn_params)
+
+        while True:
+            connection = self.pool.getconn()
+            # only an idle connection from the pool can have died, a new one was just opened.
+            if connection.closed or (
+                self.health_checks_enabled
+                and self.pool.is_reused(connection)
+                and not self._is_alive(connection)
+            ):
+                self.pool.putconn(connection, close=True)
+                continue
+            break
+
+        # the same set up as the default backend does for a new connection.
+        options = self.settings_dict['OPTIONS']
+        self.isolation_level = options.get(
+            'isolation_level', connection.isolation_level
+        )
+        if self.isolation_level != connection.isolation_level:
+            connection.set_session(isolation_level=self.isolation_level)
+        psycopg2.extras.register_default_jsonb(
+            conn_or_curs=connection, loads=lambda x: x
+        )
+        return connection
+
+    def _close(self):
+        if self.connection is not None and self.pool is not None:
+            with self.wrap_database_errors:
+                # the pool rolls back an unfinished transaction before reusing it,
+                # a connection that failed is closed instead.
+                return self.pool.putconn(
+                    self.connection,
+                    close=self.discard_connection or self.errors_occurred
+                )
+        return super()._close()
+
+    # Django calls this at the start and the end of every request (and Celery-like
+    # jobs can call it through 'close_old_connections'), the health check itself is
+    # only done when the connection is used, so requests without queries don't pay for it.
+    def close_if_unusable_or_obsolete(self):
+        super().close_if_unusable_or_obsolete()
+        self.health_check_done = False
+
+    def ensure_connection(self):
+        if (
+            self.connection is not None
+            and self.health_checks_enabled
+            and not self.health_check_done
+            and not self.in_atomic_block
+        ):
+            if not self.is_usable():
+                self.discard_connection = True
+                self.close()
+            self.health_check_done = True
+        super().ensure_connection()
@@ -0,0 +1,158 @@
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import hashers
+
+from core import metrics
+
+
+# Hashing a password is slow on purpose (so a stolen hash is slow to crack), which makes
+# it the most CPU expensive part of a login or a signup.
+#
+# 1. the cost is configured in 'PASSWORD_HASHING' instead of being fixed in the code:
+#    the hasher classes below read their parameters from the settings each time.
+#    Django re-hashes a password when its user logs in if it was hashed with another
+#    algorithm or other parameters ('must_update'), so changing the profile or the
+#    cost upgrades (or downgrades) the stored hashes one login at a time.
+# 2. the hashing runs in a small pool of 'WORKERS' threads, so a burst of logins uses
+#    at most that many cores per process and the other requests still get CPU time.
+#    PBKDF2, bcrypt and Argon2 all release the GIL while hashing, so the pool really runs
+#    in parallel. every server process has its own pool, so the default is 1 thread:
+#    a few processes per CPU (gunicorn) already give the logins every core.
+#    only the hashing runs in the pool, the database queries stay in the request thread.
+
+DEFAULT_PASSWORD_HASHING = {
+    'PROFILE': 'pbkdf2',
+    'PBKDF2_ITERATIONS': hashers.PBKDF2PasswordHasher.iterations,
+    'ARGON2_TIME_COST': hashers.Argon2PasswordHasher.time_cost,
+    'ARGON2_MEMORY_COST': hashers.Argon2PasswordHasher.memory_cost,
+    'ARGON2_PARALLELISM': hashers.Argon2PasswordHasher.parallelism,
+    'BCRYPT_ROUNDS': hashers.BCryptSHA256PasswordHasher.rounds,
+    'WORKERS': 1,
+}
+
+_executor = None
+_executor_lock = threading.Lock()
+_local = threading.local()
+
+PASSWORD_HASH_DURATION = metrics.REGISTRY.histogram(
+    'password_hash_duration_seconds',
+    'Time spent hashing or checking passwords.',
+    ('operation',)
+)
+
+
+def get_config():
+    return {**DEFAULT_PASSWORD_HASHING, **getattr(settings, 'PASSWORD_HASHING', {})}
+
+
+class TunedPBKDF2PasswordHasher(hashers.PBKDF2PasswordHasher):
+    """ PBKDF2 with the number of iterations from the settings """
+
+    # same algorithm name as Django's hasher, so the existing hashes keep working.
+    @property
+    def iterations(self):
+        return get_config()['PBKDF2_ITERATIONS']
+
+
+class TunedArgon2PasswordHasher(hashers.Argon2PasswordHasher):
+    """ Argon2 with the costs from the settings (needs 'argon2-cffi') """
+
+    @property
+    def time_cost(self):
+        return get_config()['ARGON2_TIME_COST']
+
+    @property
+    def memory_cost(self):
+        return get_config()['ARGON2_MEMORY_COST']
+
+    @property
+    def parallelism(self):
+        return get_config()['ARGON2_PARALLELISM']
+
+
+class TunedBCryptSHA256PasswordHasher(hashers.BCryptSHA256PasswordHasher):
+    """ bcrypt with the number of rounds from the settings (needs 'bcrypt') """
+
+    @property
+    def rounds(self):
+        return get_config()['BCRYPT_ROUNDS']
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=get_config()['WORKERS'],
+                thread_name_prefix='password-hash'
+            )
+        return _executor
+
+
+def _run_worker(operation, func, args):
+    _local.in_pool = True
+    start = time.perf_counter()
+    try:
+        return func(*args)
+    finally:
+        PASSWORD_HASH_DURATION.observe(time.perf_counter() - start, operation=operation)
+        _local.in_pool = False
+
+
+def run_in_pool(operation, func, *args):
+    """ Run a hashing function in the hashing pool and return its result """
+    if getattr(_local, 'in_pool', False):
+        # already in a worker: waiting for another worker could deadlock the pool.
+        return func(*args)
+    return _get_executor().submit(_run_worker, operation, func, args).result()
+
+
+def make_password(password):
+    """ Hash a password in the hashing pool """
+    return run_in_pool('hash', hashers.make_password, password)
+
+
+def set_password(user, password):
+    """ Set the password of a user (without saving it), hashing in the pool """
+    # 'set_password' only changes the instance, so it's safe to run in another thread.
+    run_in_pool('hash', user.set_password, password)
+
+
+def _check(password, encoded):
+    outdated = []
+    # the setter is only called for a correct password whose hash must be updated.
+    is_correct = hashers.check_password(password, encoded, setter=outdated.append)
+    return is_correct, bool(outdated)
+
+
+def check_password(password, encoded):
+    """ Check a password in the hashing pool
+
+    Returns (is the password correct, must the hash be updated).
+    """
+    return run_in_pool('check', _check, password, encoded)
+
+
+def measure_logins(hasher, count=20, threads=1, password='benchmark-password'):
+    """ Return the number of password checks per second of a hasher
+
+    'count' checks are run by each of the 'threads' threads.
+    """
+    encoded = hasher.encode(password, hasher.salt())
+
+    def check():
+        for _index in range(count):
+            hasher.verify(password, encoded)
+
+    start = time.perf_counter()
+    if threads == 1:
+        check()
+    else:
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            for future in [executor.submit(check) for _thread in range(threads)]:
+                future.result()
+    return count * threads / (time.perf_counter() - start)
@@ -0,0 +1,168 @@
+import json
+import platform
+import shutil
+import tempfile
+import time
+
+import django
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+from core import benchmark, seeding
+from recipe import images
+
+
+class Command(BaseCommand):
+    """ Django command to benchmark the latency and queries of the API endpoints """
+
+    help = (
+        'Seed a test database and measure the latency percentiles and the queries '
+        'of every API endpoint, optionally failing on regressions against a baseline.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=5)
+        parser.add_argument('--recipes', type=int, default=200, help='Recipes per user.')
+        parser.add_argument('--tags', type=int, default=10, help='Tags per user.')
+        parser.add_argument('--ingredients', type=int, default=20, help='Ingredients per user.')
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--only', help='Only run the scenarios containing this text.')
+        parser.add_argument('--output', help='Write the JSON report to this file.')
+        parser.add_argument('--baseline', help='A previous JSON report to compare with.')
+        parser.add_argument(
+            '--tolerance', type=float, default=0.2,
+            help='Allowed latency increase over the baseline (default: 0.2 = 20%%).'
+        )
+        parser.add_argument(
+            '--concurrency', type=int, default=0,
+            help='Also compare the read endpoints with and without ASYNC_READ_VIEWS, '
+                 'sending this many requests at a time through the ASGI handler.'
+        )
+        parser.add_argument(
+            '--concurrent-requests', type=int, default=200,
+            help='Requests per scenario with --concurrency.'
+        )
+        parser.add_argument(
+            '--keepdb', action='store_true',
+            help='Keep the test database between runs (like "manage.py test --keepdb").'
+        )
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['baseline']:
+            with open(options['baseline']) as file:
+                baseline = json.load(file)
+
+        # the benchmark runs in a separate test database (like the tests), so it never
+        # touches the real data and every run starts from the same seeded data.
+        runner = DiscoverRunner(verbosity=0, interactive=False, keepdb=options['keepdb'])
+        runner.setup_test_environment()
+        old_config = runner.setup_databases()
+        media_root = tempfile.mkdtemp(prefix='benchmark-media-')
+        try:
+            with override_settings(MEDIA_ROOT=media_root):
+                report = self.run_benchmark(options)
+                images.wait_for_tasks()
+        finally:
+            shutil.rmtree(media_root, ignore_errors=True)
+            runner.teardown_databases(old_config)
+            runner.teardown_test_environment()
+
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                json.dump(report, file, indent=2)
+            self.stdout.write(f'Report written to {options["output"]}')
+
+        if baseline is not None:
+            regressions = benchmark.compare(
+                report['results'], baseline['results'], options['tolerance']
+            )
+            if regressions:
+                raise CommandError(
+                    'Performance regressions:\n' + '\n'.join(regressions)
+                )
+            self.stdout.write(self.style.SUCCESS('No regressions against the baseline.'))
+
+    def run_benchmark(self, options):
+        password = 'benchmark'
+        self.stdout.write(
+            f'Seeding {options["users"]} users x {options["recipes"]} recipes...'
+        )
+        start = time.perf_counter()
+        user_ids = seeding.seed_users(
+            users=options['users'],
+            recipes=options['recipes'],
+            tags=options['tags'],
+            ingredients=options['ingredients'],
+            seed=options['seed'],
+            password=password,
+        )
+        self.stdout.write(f'Seeded in {time.perf_counter() - start:.1f} seconds')
+
+        self.stdout.write(
+            f'{"scenario":<45} {"p50":>8} {"p90":>8} {"p99":>8} {"queries":>8}'
+        )
+
+        def log(name, result):
+            self.stdout.write(
+                f'{name:<45} {result["p50_ms"]:>8.2f} {result["p90_ms"]:>8.2f} '
+                f'{result["p99_ms"]:>8.2f} {result["queries_max"]:>8}'
+            )
+
+        user = get_user_model().objects.get(pk=user_ids[0])
+        results = benchmark.run(
+            user,
+            password,
+            iterations=options['iterations'],
+            warmup=options['warmup'],
+            only=options['only'],
+            log=log,
+        )
+        report = {
+            'meta': {
+                'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+                **{
+                    key: options[key] for key in (
+                        'users', 'recipes', 'tags', 'ingredients',
+                        'iterations', 'warmup', 'seed',
+                    )
+                },
+            },
+            'results': results,
+        }
+        if options['concurrency']:
+            report['concurrency'] = self.run_concurrency_benchmark(user, password, options)
+        return report
+
+    def run_concurrency_benchmark(self, user, password, options):
+        self.stdout.write(
+            f'\nASYNC_READ_VIEWS off/on, {options["concurrency"]} concurrent requests:'
+        )
+        self.stdout.write(
+            f'{"scenario":<45} {"mode":>6} {"req/s":>8} {"p50":>8} {"p90":>8} {"p99":>8}'
+        )
+
+        def log(mode, name, result):
+            self.stdout.write(
+                f'{name:<45} {mode:>6} {result["throughput_rps"]:>8.1f} '
+                f'{result["p50_ms"]:>8.2f} {result["p90_ms"]:>8.2f} {result["p99_ms"]:>8.2f}'
+            )
+
+        return benchmark.run_concurrent(
+            user,
+            password,
+            concurrency=options['concurrency'],
+            requests=options['concurrent_requests'],
+            warmup=options['warmup'],
+            only=options['only'],
+            log=log,
+        )
@@ -0,0 +1,59 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core import hashers
+
+
+HASHERS = {
+    'pbkdf2': hashers.TunedPBKDF2PasswordHasher,
+    'argon2': hashers.TunedArgon2PasswordHasher,
+    'bcrypt': hashers.TunedBCryptSHA256PasswordHasher,
+}
+
+
+class Command(BaseCommand):
+    """ Django command to measure how many logins per second the password hashers allow """
+
+    help = (
+        'Measure the password checks per second (= logins per second) of the hashers '
+        'with the costs from the PASSWORD_HASHING settings, on 1 core and on all the '
+        'hashing pool threads.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--profile', action='append', choices=sorted(HASHERS),
+            help='The hashers to measure (default: every installed one).'
+        )
+        parser.add_argument('--count', type=int, default=20, help='Checks per thread.')
+        parser.add_argument(
+            '--threads', type=int, default=None,
+            help='Threads of the parallel run (default: 1 per CPU, like the gunicorn workers).'
+        )
+
+    def handle(self, *args, **options):
+        cores = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count()
+        # the hashing pool has 1 thread per process by default, the server's processes
+        # together hash on every CPU.
+        threads = options['threads'] or cores
+
+        for profile in options['profile'] or sorted(HASHERS):
+            hasher = HASHERS[profile]()
+            try:
+                # PBKDF2 is in the standard library, argon2 and bcrypt need a package.
+                if hasher.library:
+                    hasher._load_library()
+            except ValueError:
+                if options['profile']:
+                    raise CommandError(f'The library of the {profile} hasher is not installed.')
+                self.stdout.write(f'{profile}: not installed, skipped')
+                continue
+
+            single = hashers.measure_logins(hasher, count=options['count'])
+            parallel = hashers.measure_logins(hasher, count=options['count'], threads=threads)
+            self.stdout.write(
+                f'{profile}: {single:.1f} logins/s per core, '
+                f'{parallel:.1f} logins/s with {threads} threads '
+                f'({parallel / min(threads, cores):.1f} per core)'
+            )
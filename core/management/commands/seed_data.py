@@ -0,0 +1,87 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from core import seeding
+from core.models import Tag, Ingredient, Recipe
+
+
+class Command(BaseCommand):
+    """ Django command to fill the database with generated data """
+
+    help = (
+        'Generate users with their tags, ingredients and recipes, e.g. to reproduce '
+        'production sized data locally. The same --seed always generates the same data.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=100, help='Recipes per user.')
+        parser.add_argument('--tags', type=int, default=10, help='Tags per user.')
+        parser.add_argument('--ingredients', type=int, default=30, help='Ingredients per user.')
+        parser.add_argument(
+            '--links', type=int, default=3,
+            help='Tags and ingredients linked to each recipe.'
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--email-prefix', default=None,
+            help='The users are "<prefix><n>@example.com" (default: "seed<seed>-").'
+        )
+        parser.add_argument('--password', default='password')
+        parser.add_argument(
+            '--batch-rows', type=int, default=seeding.DEFAULT_BATCH_ROWS,
+            help='About how many recipes are written per transaction.'
+        )
+
+    def handle(self, *args, **options):
+        email_prefix = options['email_prefix'] or f'seed{options["seed"]}-'
+        if get_user_model().objects.filter(email__startswith=email_prefix).exists():
+            raise CommandError(
+                f'Users starting with "{email_prefix}" already exist, '
+                'use another --seed or --email-prefix.'
+            )
+
+        total = options['users'] * options['recipes']
+        method = 'COPY' if seeding.use_copy() else 'bulk_create'
+        self.stdout.write(
+            f'Generating {options["users"]} users and {total} recipes ({method})...'
+        )
+        start = time.monotonic()
+
+        def progress(created, total):
+            elapsed = time.monotonic() - start
+            rate = created / elapsed if elapsed else 0
+            remaining = (total - created) / rate if rate else 0
+            self.stdout.write(
+                f'  {created}/{total} recipes ({created / max(total, 1):.0%}), '
+                f'{rate:.0f} recipes/s, {remaining:.0f}s left'
+            )
+
+        seeding.seed_users(
+            users=options['users'],
+            recipes=options['recipes'],
+            tags=options['tags'],
+            ingredients=options['ingredients'],
+            links=options['links'],
+            seed=options['seed'],
+            password=options['password'],
+            email_prefix=email_prefix,
+            batch_rows=options['batch_rows'],
+            progress=progress,
+        )
+
+        # refresh the planner statistics, otherwise the database plans the next queries
+        # as if the tables were still (nearly) empty.
+        if connection.vendor == 'postgresql':
+            models = (get_user_model(), Tag, Ingredient, Recipe,
+                      Recipe.tags.through, Recipe.ingredients.through)
+            with connection.cursor() as cursor:
+                for model in models:
+                    cursor.execute(f'ANALYZE {connection.ops.quote_name(model._meta.db_table)}')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Generated {total} recipes in {time.monotonic() - start:.1f} seconds'
+        ))
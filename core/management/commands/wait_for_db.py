@@ -1,27 +1,101 @@
 # time: the default Python Module that we can use to make our apps sleep for a few seconds.
+import random
 import time
 
 # connections: Module which is what we can use to test if the database is available.
-from django.db import connections
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.migrations.executor import MigrationExecutor
 from django.db.utils import OperationalError
 
 # baseCommand: class that we need to build on to create our Custom Command.
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+
+
+class DatabaseNotReady(Exception):
+    """ The database is up but not ready yet (e.g. migrations not applied) """
+
 
 class Command(BaseCommand):
     """ Django command to pause execution util database is available """
 
+    help = 'Wait until the database accepts queries (and optionally is migrated).'
+
+    # the first retry is quick (the database is often just a moment away) and the
+    # delay doubles after each failure up to '--max-delay'.
+    # the "jitter" (a random part of the delay) stops many containers that started
+    # together from retrying at exactly the same moments.
+    initial_delay = 0.1
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--database', default=DEFAULT_DB_ALIAS,
+            help='The database to wait for (default: "default").'
+        )
+        parser.add_argument(
+            '--timeout', type=float, default=60,
+            help='Give up after this many seconds (default: 60).'
+        )
+        parser.add_argument(
+            '--max-delay', type=float, default=5,
+            help='The longest wait between 2 attempts in seconds (default: 5).'
+        )
+        parser.add_argument(
+            '--wait-for-migrations', action='store_true',
+            help='Also wait until every migration is applied.'
+        )
+
+    def check_database(self, alias, wait_for_migrations):
+        """ Raise an error unless the database is ready """
+        # getting the connection object doesn't connect, running a query does.
+        connection = connections[alias]
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+
+        if wait_for_migrations:
+            executor = MigrationExecutor(connection)
+            plan = executor.migration_plan(executor.loader.graph.leaf_nodes())
+            if plan:
+                raise DatabaseNotReady(f'{len(plan)} migrations not applied')
+
+    def get_delay(self, attempt, max_delay):
+        """ Return how long to wait after a failed attempt """
+        delay = min(max_delay, self.initial_delay * 2 ** (attempt - 1))
+        # half of the delay is fixed and the other half is random.
+        return delay / 2 + random.uniform(0, delay / 2)
+
     # we put our code in a handle function: ran whenever we run this management command.
     # ("*args", "**options"): allow for passing in custom arguments and options to our management commands.
     def handle(self, *args, **options):
         self.stdout.write('waiting for database...')
-        db_conn = None
-        while not db_conn:
+        start = time.monotonic()
+        deadline = start + options['timeout']
+        attempt = 0
+        while True:
+            attempt += 1
             try:
-                db_conn = connections['default']
-            except OperationalError:
-                self.stdout.write('Database unavailable, waiting 1 second...')
-                time.sleep(1)
-
-        self.stdout.write(self.style.SUCCESS('Database Available!'))
+                self.check_database(
+                    options['database'],
+                    options['wait_for_migrations']
+                )
+                break
+            except (OperationalError, DatabaseNotReady) as error:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise CommandError(
+                        f'Database not ready after {time.monotonic() - start:.2f} '
+                        f'seconds ({attempt} attempts): {error}'
+                    )
+                delay = min(
+                    self.get_delay(attempt, options['max_delay']),
+                    remaining
+                )
+                self.stdout.write(
+                    f'Database not ready ({error}), waiting {delay:.2f} seconds...'
+                )
+                time.sleep(delay)
 
+        # the orchestrator logs this, so we can see how long the startup waited.
+        self.stdout.write(self.style.SUCCESS(
+            f'Database Available! (after {time.monotonic() - start:.2f} seconds, '
+            f'{attempt} attempts)'
+        ))
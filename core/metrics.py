@@ -0,0 +1,392 @@
+import json
+import os
+import threading
+import time
+
+from django.conf import settings
+
+
+# A small in-process metrics registry, exposed on '/metrics' in the Prometheus text format.
+#
+# Recording a value must be cheap because it happens on every request, so every thread
+# writes to its own "shard" (a plain dict) and never waits for a lock. the lock is only
+# taken when a thread writes for the first time and when the shards are collected.
+#
+# gunicorn runs several worker processes and '/metrics' is served by only 1 of them,
+# so with 'MULTIPROCESS_DIR' set every process also saves a snapshot of its values to a
+# JSON file in that directory (at most once per 'FLUSH_INTERVAL' seconds), and '/metrics'
+# adds up the snapshots of all the processes.
+#
+# gunicorn restarts its workers (e.g. after 'max_requests'), so when a worker exits the
+# master merges its snapshot into 1 aggregate file and deletes it ('merge_process_snapshot',
+# called by the 'child_exit' hook in 'app/gunicorn.conf.py'): the counters of the dead
+# workers keep counting in the totals and their files don't pile up. the snapshot names
+# contain the start time of the process, a new worker that gets the PID of an old one
+# doesn't overwrite its file.
+
+DEFAULT_METRICS = {
+    'ENABLED': True,
+    'MULTIPROCESS_DIR': None,
+    'FLUSH_INTERVAL': 1.0,
+    'TOKEN': None,
+}
+
+DEFAULT_DURATION_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+
+
+def get_config():
+    return {**DEFAULT_METRICS, **getattr(settings, 'METRICS', {})}
+
+
+AGGREGATE_FILENAME = 'metrics-aggregate.json'
+
+
+def _merge_dumped(total, value):
+    # the dumped values are numbers (counters) or lists of numbers (histograms),
+    # the master process merges them without knowing the metrics.
+    if total is None:
+        return value
+    if isinstance(value, list):
+        return [a + b for a, b in zip(total, value)]
+    return total + value
+
+
+def _read_json(path):
+    with open(path) as file:
+        return json.load(file)
+
+
+def _write_json(path, data):
+    temp_path = f'{path}.{threading.get_ident()}.tmp'
+    with open(temp_path, 'w') as file:
+        json.dump(data, file)
+    # the readers never see a half written file, 'replace' is atomic.
+    os.replace(temp_path, path)
+
+
+def _add_to_aggregate(directory, filename, snapshot):
+    path = os.path.join(directory, AGGREGATE_FILENAME)
+    try:
+        aggregate = _read_json(path)
+    except (OSError, ValueError):
+        aggregate = {'metrics': {}}
+    for name, dumped in snapshot.items():
+        values = {tuple(key): value for key, value in aggregate['metrics'].get(name, [])}
+        for key, value in dumped:
+            values[tuple(key)] = _merge_dumped(values.get(tuple(key)), value)
+        aggregate['metrics'][name] = [[list(key), value] for key, value in values.items()]
+    # the readers skip the merged snapshot until it's deleted (see 'Registry.collect_all').
+    aggregate['merged'] = filename
+    _write_json(path, aggregate)
+
+
+def merge_process_snapshot(directory, pid):
+    """ Merge the snapshot of an exited process into the aggregate file and delete it """
+    prefix = f'metrics-{pid}-'
+    for filename in sorted(os.listdir(directory)):
+        if not filename.startswith(prefix):
+            continue
+        path = os.path.join(directory, filename)
+        if filename.endswith('.json'):
+            try:
+                _add_to_aggregate(directory, filename, _read_json(path))
+            except (OSError, ValueError):
+                pass
+        # the snapshot, or a temporary file the process didn't get to rename.
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    pairs = ','.join(
+        '{}="{}"'.format(
+            name,
+            str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+        )
+        for name, value in labels
+    )
+    return '{' + pairs + '}'
+
+
+def _format_value(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """ Base class of the metrics: the per-thread shards of the values """
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._local = threading.local()
+        self._shards = []
+        self._lock = threading.Lock()
+
+    def _shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = {}
+            with self._lock:
+                self._shards.append(shard)
+            self._local.shard = shard
+        return shard
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def collect(self):
+        """ Return {label values: value} summed over all the threads """
+        with self._lock:
+            shards = list(self._shards)
+        values = {}
+        for shard in shards:
+            # 'list()' copies the items at once, a thread can add a key while we read.
+            for key, value in list(shard.items()):
+                values[key] = self._merge(values.get(key), value)
+        return values
+
+    def clear(self):
+        with self._lock:
+            for shard in self._shards:
+                shard.clear()
+
+    def _merge(self, total, value):
+        raise NotImplementedError
+
+    def dump(self, values):
+        """ Return the values in a JSON compatible form """
+        return [[list(key), value] for key, value in values.items()]
+
+    def load(self, data):
+        return {tuple(key): value for key, value in data}
+
+    def expose(self, values):
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    """ A value that only goes up (e.g. the number of requests) """
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        shard = self._shard()
+        key = self._key(labels)
+        shard[key] = shard.get(key, 0) + amount
+
+    def _merge(self, total, value):
+        return (total or 0) + value
+
+    def expose(self, values):
+        for key, value in sorted(values.items()):
+            labels = _format_labels(zip(self.labelnames, key))
+            yield f'{self.name}{labels} {_format_value(value)}'
+
+
+class Histogram(Metric):
+    """ The distribution of observed values (e.g. request durations) in buckets """
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_DURATION_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        shard = self._shard()
+        key = self._key(labels)
+        # [count of each bucket..., count above the last bucket, sum]
+        counts = shard.get(key)
+        if counts is None:
+            counts = shard[key] = [0] * (len(self.buckets) + 1) + [0]
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                break
+        else:
+            index = len(self.buckets)
+        counts[index] += 1
+        counts[-1] += value
+
+    def _merge(self, total, value):
+        if total is None:
+            return list(value)
+        return [a + b for a, b in zip(total, value)]
+
+    def expose(self, values):
+        for key, counts in sorted(values.items()):
+            labels = list(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                bucket_labels = _format_labels(labels + [('le', _format_value(float(bound)))])
+                yield f'{self.name}_bucket{bucket_labels} {cumulative}'
+            cumulative += counts[len(self.buckets)]
+            yield f'{self.name}_bucket{_format_labels(labels + [("le", "+Inf")])} {cumulative}'
+            yield f'{self.name}_sum{_format_labels(labels)} {_format_value(counts[-1])}'
+            yield f'{self.name}_count{_format_labels(labels)} {cumulative}'
+
+
+class Registry:
+    """ The metrics of the process and their multi-process snapshots """
+
+    def __init__(self):
+        self.metrics = {}
+        self._last_flush = 0.0
+        self._flush_lock = threading.Lock()
+        # (PID, start time) of the process, the workers are forked from the master.
+        self._process = None
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, *args, **kwargs):
+        return self.register(Counter(*args, **kwargs))
+
+    def histogram(self, *args, **kwargs):
+        return self.register(Histogram(*args, **kwargs))
+
+    def collect(self):
+        """ Return {metric name: values} of this process """
+        return {name: metric.collect() for name, metric in self.metrics.items()}
+
+    def clear(self):
+        for metric in self.metrics.values():
+            metric.clear()
+
+    def _snapshot_path(self, directory):
+        pid = os.getpid()
+        if self._process is None or self._process[0] != pid:
+            self._process = (pid, time.time_ns())
+        return os.path.join(directory, 'metrics-{}-{}.json'.format(*self._process))
+
+    def flush(self, directory):
+        """ Save the values of this process to the multi-process directory """
+        data = {
+            name: self.metrics[name].dump(values)
+            for name, values in self.collect().items()
+        }
+        _write_json(self._snapshot_path(directory), data)
+
+    def maybe_flush(self):
+        """ Save a snapshot if the last one is older than the flush interval """
+        config = get_config()
+        directory = config['MULTIPROCESS_DIR']
+        if not directory:
+            return
+        now = time.monotonic()
+        if now - self._last_flush < config['FLUSH_INTERVAL']:
+            return
+        # only 1 thread saves, the others don't wait for it.
+        if not self._flush_lock.acquire(blocking=False):
+            return
+        try:
+            self._last_flush = now
+            os.makedirs(directory, exist_ok=True)
+            self.flush(directory)
+        finally:
+            self._flush_lock.release()
+
+    def collect_all(self):
+        """ Return the values of every process (or just this one) """
+        directory = get_config()['MULTIPROCESS_DIR']
+        if not directory or not os.path.isdir(directory):
+            return self.collect()
+
+        # our own values are always up to date, the other processes' are from their last snapshot.
+        with self._flush_lock:
+            self.flush(directory)
+        # a snapshot deleted while we read the others was merged into the aggregate after we
+        # read it, so we start over to count it once. (the last attempt skips it, the workers
+        # don't exit that often.)
+        for retry in (True, True, False):
+            snapshots = self._read_snapshots(directory, retry)
+            if snapshots is not None:
+                break
+        totals = {name: {} for name in self.metrics}
+        for data in snapshots:
+            for name, dumped in data.items():
+                metric = self.metrics.get(name)
+                if metric is None:
+                    continue
+                for key, value in metric.load(dumped).items():
+                    totals[name][key] = metric._merge(totals[name].get(key), value)
+        return totals
+
+    def _read_snapshots(self, directory, retry):
+        """ Return the aggregate and the snapshots, None if one was merged meanwhile """
+        # the aggregate is read first: the snapshot it names is already in it.
+        try:
+            aggregate = _read_json(os.path.join(directory, AGGREGATE_FILENAME))
+        except (OSError, ValueError):
+            aggregate = {'metrics': {}}
+        snapshots = [aggregate['metrics']]
+        for filename in os.listdir(directory):
+            if not filename.endswith('.json') or filename in (
+                AGGREGATE_FILENAME, aggregate.get('merged')
+            ):
+                continue
+            try:
+                snapshots.append(_read_json(os.path.join(directory, filename)))
+            except FileNotFoundError:
+                if retry:
+                    return None
+            except (OSError, ValueError):
+                continue
+        return snapshots
+
+    def expose(self):
+        """ Return all the metrics in the Prometheus text format """
+        lines = []
+        for name, values in self.collect_all().items():
+            metric = self.metrics[name]
+            lines.append(f'# HELP {name} {metric.documentation}')
+            lines.append(f'# TYPE {name} {metric.type}')
+            lines.extend(metric.expose(values))
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+REQUESTS = REGISTRY.counter(
+    'http_requests_total',
+    'Number of HTTP requests.',
+    ('method', 'route', 'status')
+)
+REQUEST_DURATION = REGISTRY.histogram(
+    'http_request_duration_seconds',
+    'Time spent handling HTTP requests.',
+    ('method', 'route')
+)
+REQUEST_QUERIES = REGISTRY.histogram(
+    'http_request_db_queries',
+    'Number of database queries per HTTP request.',
+    ('route',),
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100)
+)
+CACHE_REQUESTS = REGISTRY.counter(
+    'cache_requests_total',
+    'Number of cache lookups by result (hit/miss).',
+    ('cache', 'result')
+)
+UPLOAD_BYTES = REGISTRY.counter(
+    'recipe_image_upload_bytes_total',
+    'Number of bytes of recipe images received.'
+)
+UPLOADS = REGISTRY.counter(
+    'recipe_image_uploads_total',
+    'Number of recipe images received.'
+)
+
+
+def record_cache(cache_name, hit):
+    """ Count a cache lookup """
+    CACHE_REQUESTS.inc(cache=cache_name, result='hit' if hit else 'miss')
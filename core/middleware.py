@@ -0,0 +1,233 @@
+import asyncio
+import contextvars
+import cProfile
+import logging
+import os
+import random
+import re
+import time
+
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+from core import metrics
+
+
+logger = logging.getLogger(__name__)
+
+
+# Measures what each request costs: the total time, the number of SQL queries and the time
+# spent in them, and the size of the response body. the numbers are sent back in a
+# 'Server-Timing' header (the browser dev tools show it in the network tab), and requests
+# that are too slow or run too many queries are logged as warnings.
+# a fraction of the requests can also be profiled with cProfile, the '.prof' files can be
+# opened with 'python -m pstats' or a viewer like snakeviz (only under WSGI, see below).
+# when 'ENABLED' is off the middleware removes itself when the server starts
+# ('MiddlewareNotUsed'), so it costs nothing at all.
+
+DEFAULT_REQUEST_PROFILING = {
+    'ENABLED': False,
+    'SLOW_REQUEST_MS': 500,
+    'MAX_QUERIES': 50,
+    'PROFILE_SAMPLE_RATE': 0.0,
+    'PROFILE_DIR': None,
+}
+
+
+def _get_config():
+    return {**DEFAULT_REQUEST_PROFILING, **getattr(settings, 'REQUEST_PROFILING', {})}
+
+
+class QueryTimer:
+    """ The number of queries of a request and their time (see 'track_queries') """
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def add(self, duration):
+        self.count += 1
+        self.duration += duration
+
+
+# The connections are per thread, so an 'execute_wrapper' installed by a middleware only
+# sees the queries of the middleware's thread. under ASGI the view runs in another thread
+# (Django's 'sync_to_async' thread, or the pool of 'core/asyncviews.py'), so instead every
+# connection gets 1 permanent wrapper that reports to the timers of the current request,
+# found in a 'ContextVar': the context is copied to the thread that runs the view.
+
+_query_timers = contextvars.ContextVar('query_timers', default=())
+
+
+def _time_query(execute, sql, params, many, context):
+    timers = _query_timers.get()
+    if not timers:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration = time.perf_counter() - start
+        for timer in timers:
+            timer.add(duration)
+
+
+def _install_query_timing(connection):
+    # first in the list: 'connection.execute_wrapper()' removes the last wrapper when it exits.
+    if _time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, _time_query)
+
+
+def _on_connection_created(sender, connection, **kwargs):
+    _install_query_timing(connection)
+
+
+connection_created.connect(_on_connection_created)
+
+
+@contextmanager
+def track_queries(timer):
+    """ Count the queries run for the current request in 'timer', in any thread """
+    # the connections opened before this module was loaded didn't get the wrapper.
+    for connection in connections.all():
+        _install_query_timing(connection)
+    token = _query_timers.set(_query_timers.get() + (timer,))
+    try:
+        yield timer
+    finally:
+        _query_timers.reset(token)
+
+
+class ProfilingMiddleware:
+    """ Record the time, queries and response size of every request """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.config = _get_config()
+        if not self.config['ENABLED']:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # marks the instance as a coroutine function for Django, like 'MiddlewareMixin'.
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        profiler = None
+        if random.random() < self.config['PROFILE_SAMPLE_RATE']:
+            profiler = cProfile.Profile()
+
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            queries = stack.enter_context(track_queries(QueryTimer()))
+            if profiler is not None:
+                try:
+                    profiler.enable()
+                    stack.callback(profiler.disable)
+                except ValueError:
+                    # another profiler is already running (e.g. in another thread).
+                    profiler = None
+            response = self.get_response(request)
+        self._report(request, response, time.perf_counter() - start, queries)
+        if profiler is not None:
+            self._dump_profile(profiler, request)
+        return response
+
+    async def __acall__(self, request):
+        # no cProfile here: it only profiles the thread that enables it, which is the
+        # event loop running every other request, while the view runs in another thread.
+        start = time.perf_counter()
+        with track_queries(QueryTimer()) as queries:
+            response = await self.get_response(request)
+        self._report(request, response, time.perf_counter() - start, queries)
+        return response
+
+    def _report(self, request, response, duration, queries):
+        """ Add the 'Server-Timing' header and log the slow requests """
+        # a streamed response isn't in memory, its size isn't known yet.
+        size = None if response.streaming else len(response.content)
+        timings = [
+            f'app;dur={duration * 1000:.1f}',
+            f'db;dur={queries.duration * 1000:.1f};desc="{queries.count} queries"',
+        ]
+        if size is not None:
+            timings.append(f'body;desc="{size} bytes"')
+        response['Server-Timing'] = ', '.join(timings)
+
+        if (
+            duration * 1000 > self.config['SLOW_REQUEST_MS']
+            or queries.count > self.config['MAX_QUERIES']
+        ):
+            logger.warning(
+                'Slow request %s %s: %.1fms, %d queries (%.1fms), %s bytes',
+                request.method,
+                request.path,
+                duration * 1000,
+                queries.count,
+                queries.duration * 1000,
+                size,
+            )
+
+    def _dump_profile(self, profiler, request):
+        """ Save the cProfile stats of a request to the profile directory """
+        profile_dir = self.config['PROFILE_DIR']
+        if not profile_dir:
+            return
+        os.makedirs(profile_dir, exist_ok=True)
+        name = re.sub(r'[^a-zA-Z0-9]+', '_', request.path).strip('_') or 'root'
+        profiler.dump_stats(os.path.join(
+            profile_dir,
+            f'{time.strftime("%Y%m%d-%H%M%S")}-{request.method}-{name}-{os.getpid()}'
+            f'-{random.randrange(1 << 16):04x}.prof'
+        ))
+
+
+# Counts the requests and records their duration and number of queries per route
+# (the URL name, e.g. "recipe:recipe-list", so "/recipes/1/" and "/recipes/2/" are 1 route)
+# in the metrics served on '/metrics' (see 'core/metrics.py').
+# it works in both modes: under ASGI a sync-only middleware would send every request
+# to Django's single 'sync_to_async' thread and they would run one at a time.
+class MetricsMiddleware:
+    """ Record the request metrics """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not metrics.get_config()['ENABLED']:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # marks the instance as a coroutine function for Django, like 'MiddlewareMixin'.
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        start = time.perf_counter()
+        with track_queries(QueryTimer()) as queries:
+            response = self.get_response(request)
+        self._record(request, response, time.perf_counter() - start, queries)
+        return response
+
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        with track_queries(QueryTimer()) as queries:
+            response = await self.get_response(request)
+        self._record(request, response, time.perf_counter() - start, queries)
+        return response
+
+    def _record(self, request, response, duration, queries):
+        match = getattr(request, 'resolver_match', None)
+        route = match.view_name if match is not None else 'unmatched'
+        metrics.REQUESTS.inc(
+            method=request.method, route=route, status=response.status_code
+        )
+        metrics.REQUEST_DURATION.observe(duration, method=request.method, route=route)
+        metrics.REQUEST_QUERIES.observe(queries.count, route=route)
+        metrics.REGISTRY.maybe_flush()
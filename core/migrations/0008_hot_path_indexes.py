@@ -0,0 +1,39 @@
+# Generated by Django 3.2.25 on 2026-10-18 06:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_recipe_image'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='ingredient',
+            index=models.Index(fields=['user', 'name', 'id'], name='core_ingredient_user_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['user', 'id'], name='core_recipe_user_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tag',
+            index=models.Index(fields=['user', 'name', 'id'], name='core_tag_user_name_idx'),
+        ),
+        # the M2M through tables are created automatically so they can't declare indexes.
+        # they already have a unique (recipe_id, tag_id) index for "tags of a recipe",
+        # these cover the reverse direction "recipes with a tag" used by the recipe filters
+        # with both columns in the index so the lookup never needs to read the table.
+        migrations.RunSQL(
+            sql='CREATE INDEX core_recipe_tags_tag_recipe_idx '
+                'ON core_recipe_tags (tag_id, recipe_id)',
+            reverse_sql='DROP INDEX core_recipe_tags_tag_recipe_idx',
+        ),
+        migrations.RunSQL(
+            sql='CREATE INDEX core_recipe_ingr_ingr_recipe_idx '
+                'ON core_recipe_ingredients (ingredient_id, recipe_id)',
+            reverse_sql='DROP INDEX core_recipe_ingr_ingr_recipe_idx',
+        ),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 3.2.25 on 2026-10-18 06:22
+
+import django.contrib.postgres.search
+from django.conf import settings
+from django.db import migrations
+
+
+# the GIN index and the initial search vectors only exist on PostgreSQL,
+# on other databases (e.g. SQLite in the tests) the field just stays empty.
+
+# a copy of 'recipe/search.py' at the time of this migration: a migration must not
+# import the app's code, which can change or break after it was written.
+UPDATE_SEARCH_VECTORS_SQL = """
+    UPDATE core_recipe AS r SET search_vector =
+        setweight(to_tsvector(%(config)s::regconfig, coalesce(r.title, '')), 'A')
+        || setweight(to_tsvector(%(config)s::regconfig, coalesce((
+            SELECT string_agg(t.name, ' ')
+            FROM core_tag t JOIN core_recipe_tags rt ON rt.tag_id = t.id
+            WHERE rt.recipe_id = r.id
+        ), '')), 'B')
+        || setweight(to_tsvector(%(config)s::regconfig, coalesce((
+            SELECT string_agg(i.name, ' ')
+            FROM core_ingredient i JOIN core_recipe_ingredients ri ON ri.ingredient_id = i.id
+            WHERE ri.recipe_id = r.id
+        ), '')), 'B')
+"""
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        'CREATE INDEX core_recipe_search_vector_gin '
+        'ON core_recipe USING gin (search_vector)'
+    )
+    # the same text search configuration (language) as the app,
+    # so the existing recipes get the same vectors as the new ones.
+    schema_editor.execute(
+        UPDATE_SEARCH_VECTORS_SQL,
+        {'config': getattr(settings, 'RECIPE_SEARCH_CONFIG', 'english')}
+    )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS core_recipe_search_vector_gin')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_recipe_image_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
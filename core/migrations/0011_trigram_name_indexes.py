@@ -0,0 +1,44 @@
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+
+# 'pg_trgm' indexes for the tag/ingredient autocomplete, only on PostgreSQL.
+# the 1st index serves the "similar to" operator (name % 'term'),
+# the 2nd one the case insensitive prefix search that Django writes as
+# UPPER(name) LIKE UPPER('term%').
+TABLES = ('core_tag', 'core_ingredient')
+
+
+def create_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for table in TABLES:
+        schema_editor.execute(
+            f'CREATE INDEX {table}_name_trgm '
+            f'ON {table} USING gin (name gin_trgm_ops)'
+        )
+        schema_editor.execute(
+            f'CREATE INDEX {table}_upper_name_trgm '
+            f'ON {table} USING gin (UPPER(name) gin_trgm_ops)'
+        )
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for table in TABLES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {table}_name_trgm')
+        schema_editor.execute(f'DROP INDEX IF EXISTS {table}_upper_name_trgm')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_recipe_search_vector'),
+    ]
+
+    operations = [
+        # does nothing on databases other than PostgreSQL.
+        TrigramExtension(),
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 3.2.25 on 2026-10-18 07:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_recipe_price_time_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RevokedToken',
+            fields=[
+                ('jti', models.CharField(max_length=32, primary_key=True, serialize=False)),
+                ('expires', models.DateTimeField(db_index=True)),
+                ('revoked', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+        ),
+    ]
@@ -9,10 +9,13 @@ import uuid
 import os
 
 from django.db import models
+from django.contrib.postgres.search import SearchVectorField
 # these ar all things that are required to extend the Django user model while making use of some of the features that come with the django user model out of the box.
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
 from django.conf import settings
 
+from core import hashers
+
 def recipe_image_file_path(instance, filename):
     """ Generate file path for new recipe image """
     # Slice the list and return the last item.(extension)
@@ -43,7 +46,8 @@ class UserManager(BaseUserManager):
         if not email:
             raise ValueError('Users must have an email address')
         user = self.model(email=self.normalize_email(email), **extra_fields)
-        user.set_password(password)
+        # hashing is slow on purpose, it runs in the bounded hashing pool (see 'core/hashers.py').
+        hashers.set_password(user, password)
 
         # "using=self._db" - supporting multiple databases (Good Practice)
         user.save(using=self._db)
@@ -83,6 +87,17 @@ class Tag(models.Model):
         null=True,
     )
 
+    # every tag list filters by user and is ordered by name (then id for the pagination),
+    # so a composite index lets the database read the rows already in order
+    # instead of collecting and sorting all of the user's tags on every request.
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['user', 'name', 'id'],
+                name='core_tag_user_name_idx'
+            ),
+        ]
+
     def __str__(self):
         return self.name
 
@@ -94,6 +109,14 @@ class Ingredient(models.Model):
         on_delete=models.CASCADE
     )
 
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['user', 'name', 'id'],
+                name='core_ingredient_user_name_idx'
+            ),
+        ]
+
     def __str__(self):
         return self.name
 
@@ -116,6 +139,35 @@ class Recipe(models.Model):
     # and it gets called in the background by Django by the image filled feature.
     # we'll save the file.
     image = models.FileField(null=True, upload_to=recipe_image_file_path)
+    # the resized copies of the image (thumbnail, medium...) that are generated in the
+    # background after an upload ('recipe/images.py'), stored as {variant name: file path}.
+    image_variants = models.JSONField(default=dict, blank=True)
+    # the words of the title, tags and ingredients for the full text search.
+    # it's kept up to date by 'recipe/search.py' (only on PostgreSQL).
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    # the recipe list filters by user and is ordered by '-id'
+    # or by price/time ('?ordering=', with 'id' to break the ties).
+    # the same indexes answer the '?price_min=&price_max=' and '?time_max=' ranges.
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'id'], name='core_recipe_user_id_idx'),
+            models.Index(
+                fields=['user', 'price', 'id'], name='core_recipe_user_price_idx'
+            ),
+            models.Index(
+                fields=['user', 'time_minutes', 'id'], name='core_recipe_user_time_idx'
+            ),
+        ]
 
     def __str__(self):
         return self.title
+
+
+class RevokedToken(models.Model):
+    """ A signed token revoked before it expires (see 'core/authentication.py') """
+    jti = models.CharField(max_length=32, primary_key=True)
+    # the row is useless once the token has expired, it's deleted then.
+    expires = models.DateTimeField(db_index=True)
+    # the processes read the rows revoked since their last read.
+    revoked = models.DateTimeField(auto_now_add=True, db_index=True)
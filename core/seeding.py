@@ -0,0 +1,242 @@
+import io
+import random
+
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import connection, transaction
+
+from core.models import Tag, Ingredient, Recipe
+
+from recipe import search
+
+
+# Helpers to fill the database with realistic looking data (users with their tags,
+# ingredients and recipes) for the benchmarks and for reproducing production sized data.
+# everything comes from random generators created from 'seed', so the same seed (and
+# options) always creates the same data.
+#
+# To load millions of rows quickly:
+# - the users are created in batches of about 'batch_rows' recipes, each batch in its own
+#   transaction, so the memory stays flat and the progress can be reported.
+# - on PostgreSQL the rows are sent with 'COPY' (the bulk loading protocol, much faster
+#   than INSERTs) and the IDs are reserved from the sequences beforehand, because 'COPY'
+#   can't return them.
+# - on other databases the rows are inserted with 'bulk_create'.
+
+TAG_WORDS = (
+    'Vegan', 'Vegetarian', 'Dessert', 'Breakfast', 'Dinner', 'Quick', 'Spicy',
+    'Healthy', 'Comfort', 'Italian', 'Thai', 'Mexican', 'Indian', 'Baking', 'Soup',
+)
+INGREDIENT_WORDS = (
+    'Salt', 'Pepper', 'Garlic', 'Onion', 'Tomato', 'Basil', 'Cinnamon', 'Sugar',
+    'Flour', 'Butter', 'Eggs', 'Milk', 'Rice', 'Lentils', 'Chicken', 'Tofu',
+    'Ginger', 'Lemon', 'Coconut milk', 'Olive oil', 'Carrot', 'Potato', 'Cheese',
+)
+TITLE_WORDS = (
+    'Creamy', 'Roasted', 'Grilled', 'Quick', 'Spicy', 'Classic', 'Easy', 'Baked',
+    'Curry', 'Pasta', 'Salad', 'Stew', 'Cake', 'Soup', 'Pie', 'Risotto', 'Tacos',
+)
+
+BATCH_SIZE = 1000
+DEFAULT_BATCH_ROWS = 20000
+
+
+def use_copy():
+    """ Check if the rows can be loaded with PostgreSQL 'COPY' """
+    return connection.vendor == 'postgresql'
+
+
+def _row(obj, fields):
+    """ Return the database values of an object for 'COPY' """
+    return [field.get_prep_value(getattr(obj, field.attname)) for field in fields]
+
+
+def _copy_value(value):
+    """ Return a value in the 'COPY' text format """
+    if value is None:
+        return '\\N'
+    return (
+        str(value).replace('\\', '\\\\').replace('\t', '\\t')
+        .replace('\n', '\\n').replace('\r', '\\r')
+    )
+
+
+def _copy(table, columns, rows):
+    """ Load rows into a table with 'COPY ... FROM STDIN' """
+    # the text format: 1 row per line, the values separated by tabs and NULL written '\N'.
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write('\t'.join(_copy_value(value) for value in row))
+        buffer.write('\n')
+    buffer.seek(0)
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.copy_expert(
+            f'COPY {quote(table)} ({", ".join(quote(column) for column in columns)}) '
+            'FROM STDIN',
+            buffer
+        )
+
+
+def _reserve_ids(model, count):
+    """ Take 'count' IDs from the sequence of a PostgreSQL table """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT nextval(pg_get_serial_sequence(%s, %s)) FROM generate_series(1, %s)',
+            [model._meta.db_table, model._meta.pk.column, count]
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _bulk_insert(model, objs):
+    """ Insert objects and make sure they get their IDs """
+    if not objs:
+        return objs
+    if use_copy():
+        for obj, pk in zip(objs, _reserve_ids(model, len(objs))):
+            obj.pk = pk
+        fields = model._meta.concrete_fields
+        _copy(
+            model._meta.db_table,
+            [field.column for field in fields],
+            [_row(obj, fields) for obj in objs]
+        )
+        return objs
+    if connection.features.can_return_rows_from_bulk_insert:
+        return model.objects.bulk_create(objs, batch_size=BATCH_SIZE)
+    # databases that can't return the new IDs from a bulk insert (SQLite before
+    # Django 4.0): nothing else writes while we seed, so the new rows are the ones
+    # after the highest ID, in the same order.
+    last = model.objects.order_by('-id').values_list('id', flat=True).first() or 0
+    model.objects.bulk_create(objs, batch_size=BATCH_SIZE)
+    ids = model.objects.filter(id__gt=last).order_by('id').values_list('id', flat=True)
+    for obj, pk in zip(objs, ids):
+        obj.pk = pk
+    return objs
+
+
+def _unique_names(rng, words, count):
+    """ Return 'count' different names made from the words """
+    words = rng.sample(words, len(words))
+    return [
+        words[index % len(words)] if index < len(words)
+        else f'{words[index % len(words)]} {index // len(words) + 1}'
+        for index in range(count)
+    ]
+
+
+def _insert_links(field_name, links):
+    """ Insert (recipe_id, related_id) rows into a many to many table """
+    field = Recipe._meta.get_field(field_name)
+    through = field.remote_field.through
+    recipe_column = f'{field.m2m_field_name()}_id'
+    related_column = f'{field.m2m_reverse_field_name()}_id'
+    if use_copy():
+        # the link tables have their own 'id' column, its default comes from the sequence.
+        _copy(through._meta.db_table, [recipe_column, related_column], links)
+        return
+    for start in range(0, len(links), BATCH_SIZE):
+        through.objects.bulk_create([
+            through(**{recipe_column: recipe_id, related_column: related_id})
+            for recipe_id, related_id in links[start:start + BATCH_SIZE]
+        ])
+
+
+def _seed_batch(rng, user_indexes, recipes, tags, ingredients, links,
+                password_hash, email_prefix):
+    """ Create a batch of users with their data, return (users, recipe count) """
+    User = get_user_model()
+    user_objs = _bulk_insert(User, [
+        User(
+            email=f'{email_prefix}{index}@example.com',
+            name=f'User {index}',
+            password=password_hash,
+        )
+        for index in user_indexes
+    ])
+
+    tag_objs = _bulk_insert(Tag, [
+        Tag(user=user, name=name)
+        for user in user_objs
+        for name in _unique_names(rng, TAG_WORDS, tags)
+    ])
+    ingredient_objs = _bulk_insert(Ingredient, [
+        Ingredient(user=user, name=name)
+        for user in user_objs
+        for name in _unique_names(rng, INGREDIENT_WORDS, ingredients)
+    ])
+    recipe_objs = _bulk_insert(Recipe, [
+        Recipe(
+            user=user,
+            title=' '.join(rng.sample(TITLE_WORDS, 2)),
+            time_minutes=rng.randint(5, 180),
+            price=Decimal(rng.randint(100, 5000)) / 100,
+        )
+        for user in user_objs
+        for _index in range(recipes)
+    ])
+
+    # each recipe gets up to 'links' of its user's tags and ingredients.
+    user_tags = {}
+    for tag in tag_objs:
+        user_tags.setdefault(tag.user_id, []).append(tag.id)
+    user_ingredients = {}
+    for ingredient in ingredient_objs:
+        user_ingredients.setdefault(ingredient.user_id, []).append(ingredient.id)
+
+    tag_links = []
+    ingredient_links = []
+    for recipe in recipe_objs:
+        owned_tags = user_tags.get(recipe.user_id, [])
+        owned_ingredients = user_ingredients.get(recipe.user_id, [])
+        for tag_id in rng.sample(owned_tags, min(links, len(owned_tags))):
+            tag_links.append((recipe.id, tag_id))
+        for ingredient_id in rng.sample(
+            owned_ingredients, min(links, len(owned_ingredients))
+        ):
+            ingredient_links.append((recipe.id, ingredient_id))
+    _insert_links('tags', tag_links)
+    _insert_links('ingredients', ingredient_links)
+    # neither 'bulk_create' nor 'COPY' send the signals that keep the search vectors up to date.
+    search.update_search_vectors([recipe.id for recipe in recipe_objs])
+    return user_objs, len(recipe_objs)
+
+
+def seed_users(users=10, recipes=100, tags=10, ingredients=20, links=3,
+               seed=0, password='benchmark', email_prefix='user',
+               batch_rows=DEFAULT_BATCH_ROWS, progress=None):
+    """ Create users with their tags, ingredients and recipes
+
+    Returns the IDs of the new users, they all have the same 'password'.
+    'progress' is called with (recipes created, total recipes) after each batch.
+    """
+    # hashing a password is slow on purpose, all the users share the same hash.
+    password_hash = make_password(password)
+    users_per_batch = max(1, batch_rows // max(1, recipes))
+    total = users * recipes
+    created = 0
+    user_ids = []
+
+    for batch, start in enumerate(range(0, users, users_per_batch)):
+        # 1 generator per batch, so a batch's data doesn't depend on the previous ones.
+        rng = random.Random(f'{seed}-{batch}')
+        with transaction.atomic():
+            if use_copy():
+                # losing the last batches in a crash doesn't matter for generated data,
+                # so don't wait for each commit to be flushed to the disk.
+                with connection.cursor() as cursor:
+                    cursor.execute('SET LOCAL synchronous_commit TO OFF')
+            batch_users, batch_recipes = _seed_batch(
+                rng,
+                range(start, min(start + users_per_batch, users)),
+                recipes, tags, ingredients, links,
+                password_hash, email_prefix
+            )
+        user_ids.extend(user.id for user in batch_users)
+        created += batch_recipes
+        if progress is not None:
+            progress(created, total)
+
+    return user_ids
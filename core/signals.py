@@ -0,0 +1,38 @@
+import functools
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from rest_framework.authtoken.models import Token
+
+from core import authentication
+
+
+# the signals are sent inside the transaction of the change: a request of another
+# thread could still read the old row and cache it again until the commit, so the
+# caches are cleared once the change is committed ('on_commit').
+
+@receiver(post_delete, sender=Token)
+def invalidate_deleted_token(sender, instance, **kwargs):
+    """ Stop accepting a token from the cache once it's deleted """
+    transaction.on_commit(functools.partial(authentication.invalidate_token, instance.key))
+
+
+# the cache holds a copy of the user, so any change to the user (deactivated,
+# new password through 'UserSerializer.update', new name...) must drop it.
+@receiver(post_save, sender=get_user_model())
+def invalidate_changed_user_tokens(sender, instance, created, **kwargs):
+    """ Drop the cached tokens of a user when the user changes """
+    if not created:
+        transaction.on_commit(
+            functools.partial(authentication.invalidate_user_tokens, instance.id)
+        )
+        transaction.on_commit(functools.partial(authentication.invalidate_user, instance.id))
+
+
+@receiver(post_delete, sender=get_user_model())
+def invalidate_deleted_user(sender, instance, **kwargs):
+    """ Stop accepting the signed tokens of a deleted user from the cache """
+    transaction.on_commit(functools.partial(authentication.invalidate_user, instance.id))
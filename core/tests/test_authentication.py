@@ -0,0 +1,347 @@
+import datetime
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core import authentication
+from core.cache import LocalLRUCache
+from core.models import RevokedToken
+
+
+ME_URL = reverse('user:me')
+TOKEN_URL = reverse('user:token')
+REVOKE_URL = reverse('user:token-revoke')
+RECIPES_URL = reverse('recipe:recipe-list')
+
+
+class CachedTokenAuthenticationTests(TestCase):
+    """ Test the cached token authentication """
+
+    def setUp(self):
+        cache.clear()
+        authentication.clear_token_cache()
+        self.user = get_user_model().objects.create_user(
+            email='test@joeshak.com',
+            password='testpass',
+            name='Test name'
+        )
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def test_authentication_cached(self):
+        """ Test the token lookup only hits the database once """
+        with self.assertNumQueries(1):
+            res = self.client.get(ME_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        with self.assertNumQueries(0):
+            res = self.client.get(ME_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['email'], self.user.email)
+
+    def test_invalid_token_rejected(self):
+        """ Test an unknown token is rejected """
+        self.client.credentials(HTTP_AUTHORIZATION='Token notavalidtoken')
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deleted_token_invalidated(self):
+        """ Test a deleted token is no longer accepted from the cache """
+        self.client.get(ME_URL)
+
+        # the caches are cleared once the change is committed.
+        with self.captureOnCommitCallbacks(execute=True):
+            self.token.delete()
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deactivated_user_invalidated(self):
+        """ Test a deactivated user is no longer accepted from the cache """
+        self.client.get(ME_URL)
+
+        self.user.is_active = False
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_invalidated_after_commit(self):
+        """ Test the cached user is only dropped once the change is committed """
+        self.client.get(ME_URL)
+
+        self.user.is_active = False
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.user.save()
+            # a request before the commit still sees (and caches) the committed user.
+            self.assertEqual(self.client.get(ME_URL).status_code, status.HTTP_200_OK)
+        for callback in callbacks:
+            callback()
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_user_update_invalidated(self):
+        """ Test updating the profile refreshes the cached user """
+        self.client.get(ME_URL)
+
+        payload = {'name': 'new name', 'password': 'newpassword123'}
+        with self.captureOnCommitCallbacks(execute=True):
+            res = self.client.patch(ME_URL, payload)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        res = self.client.get(ME_URL)
+        self.assertEqual(res.data['name'], payload['name'])
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password(payload['password']))
+
+    def test_shared_cache_tier(self):
+        """ Test entries are shared through the Django cache """
+        config = {'SHARED_CACHE_ALIAS': 'default', 'LOCAL_TTL': 5}
+        with self.settings(TOKEN_AUTH_CACHE=config):
+            self.client.get(ME_URL)
+            # another process would have an empty in-process cache.
+            authentication.clear_token_cache()
+            with self.assertNumQueries(0):
+                res = self.client.get(ME_URL)
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+            with self.captureOnCommitCallbacks(execute=True):
+                self.token.delete()
+            authentication.clear_token_cache()
+            res = self.client.get(ME_URL)
+            self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_password_hash_not_cached(self):
+        """ Test the password hash of the user is never written to the caches """
+        config = {'SHARED_CACHE_ALIAS': 'default', 'LOCAL_TTL': 5}
+        with self.settings(TOKEN_AUTH_CACHE=config):
+            self.client.get(ME_URL)
+            values = cache.get(authentication._cache_key(self.token.key))
+
+        self.assertIsNotNone(values)
+        self.assertNotIn(self.user.password, repr(values))
+
+    def test_cached_user_password_deferred(self):
+        """ Test the cached user still loads its password when it's needed """
+        self.client.get(ME_URL)
+        user, token = authentication.CachedTokenAuthentication().authenticate_credentials(
+            self.token.key
+        )
+
+        with self.assertNumQueries(1):
+            self.assertTrue(user.check_password('testpass'))
+
+
+@override_settings(
+    SIGNED_TOKEN={'ENABLED': True, 'MAX_AGE': 60, 'REVOKED_SYNC_INTERVAL': 60}
+)
+class SignedTokenAuthenticationTests(TestCase):
+    """ Test the stateless signed token authentication """
+
+    def setUp(self):
+        cache.clear()
+        authentication.clear_token_cache()
+        authentication.clear_revoked_tokens()
+        self.user = get_user_model().objects.create_user(
+            email='test@joeshak.com',
+            password='testpass',
+            name='Test name'
+        )
+        self.client = APIClient()
+        res = self.client.post(
+            TOKEN_URL,
+            {'email': 'test@joeshak.com', 'password': 'testpass', 'token_type': 'signed'}
+        )
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['token_type'], 'Bearer')
+        self.assertEqual(res.data['expires_in'], 60)
+        self.token = res.data['token']
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.token}')
+
+    def test_no_database_lookup(self):
+        """ Test a signed token is checked without querying the database """
+        # the user, and the revocation list once per 'REVOKED_SYNC_INTERVAL'.
+        with self.assertNumQueries(2):
+            res = self.client.get(ME_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        with self.assertNumQueries(0):
+            res = self.client.get(ME_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['email'], self.user.email)
+
+    def test_password_hash_not_cached(self):
+        """ Test only the user version is cached, not the password hash """
+        with self.settings(TOKEN_AUTH_CACHE={'SHARED_CACHE_ALIAS': 'default'}):
+            self.client.get(ME_URL)
+            values = cache.get(authentication._user_cache_key(self.user.id))
+
+        self.assertIsNotNone(values)
+        self.assertNotIn(self.user.password, repr(values))
+        self.assertIn(authentication.get_user_version(self.user), values)
+
+    def test_recipe_views_accept_signed_token(self):
+        """ Test the recipe views accept signed tokens """
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_tampered_token_rejected(self):
+        """ Test a modified token is rejected """
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.token[:-1]}x')
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_expired_token_rejected(self):
+        """ Test a token is rejected after its max age """
+        with self.settings(SIGNED_TOKEN={'ENABLED': True, 'MAX_AGE': -1}):
+            res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(str(res.data['detail']), 'Token expired.')
+
+    def test_password_change_invalidates_tokens(self):
+        """ Test changing the password rejects the tokens issued before """
+        self.client.get(ME_URL)
+
+        self.user.set_password('newpassword')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deactivated_user_rejected(self):
+        """ Test the tokens of a deactivated user are rejected """
+        self.client.get(ME_URL)
+
+        self.user.is_active = False
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_revoke_token(self):
+        """ Test a revoked token is rejected, the others still work """
+        other_token = authentication.create_signed_token(self.user)
+
+        res = self.client.post(REVOKE_URL)
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+
+        res = self.client.get(ME_URL)
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(str(res.data['detail']), 'Token revoked.')
+
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {other_token}')
+        res = self.client.get(ME_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_revocation_reaches_other_processes(self):
+        """ Test a revocation is read from the database by the other processes """
+        self.client.post(REVOKE_URL)
+        # another process starts with an empty revocation list.
+        authentication.clear_revoked_tokens()
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_revocation_synced_after_interval(self):
+        """ Test the revocations of the other processes are read after the interval """
+        with self.settings(SIGNED_TOKEN={'ENABLED': True, 'REVOKED_SYNC_INTERVAL': 0}):
+            self.assertEqual(self.client.get(ME_URL).status_code, status.HTTP_200_OK)
+            # revoked by another process.
+            payload = authentication.SignedTokenAuthentication().authenticate_credentials(
+                self.token
+            )[1]
+            RevokedToken.objects.create(
+                jti=payload['j'],
+                expires=timezone.now() + datetime.timedelta(minutes=1)
+            )
+            res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_revocations_never_evicted(self):
+        """ Test revoking many tokens doesn't make an older revoked token valid again """
+        self.client.post(REVOKE_URL)
+        for _index in range(50):
+            token = authentication.create_signed_token(self.user)
+            authentication.revoke_signed_token(
+                authentication.SignedTokenAuthentication().authenticate_credentials(token)[1]
+            )
+        authentication.clear_revoked_tokens()
+
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(RevokedToken.objects.count(), 51)
+
+    def test_expired_revocations_deleted(self):
+        """ Test the revocations of expired tokens are deleted """
+        RevokedToken.objects.create(
+            jti='expired', expires=timezone.now() - datetime.timedelta(seconds=1)
+        )
+
+        self.client.post(REVOKE_URL)
+
+        self.assertFalse(RevokedToken.objects.filter(jti='expired').exists())
+        self.assertEqual(RevokedToken.objects.count(), 1)
+
+    def test_revoke_database_token(self):
+        """ Test revoking a database token deletes it """
+        token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+
+        res = self.client.post(REVOKE_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(Token.objects.filter(key=token.key).exists())
+
+    def test_signed_tokens_disabled(self):
+        """ Test signed tokens are neither issued nor accepted when disabled """
+        with self.settings(SIGNED_TOKEN={'ENABLED': False}):
+            res = self.client.get(ME_URL)
+            self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+            res = self.client.post(
+                TOKEN_URL,
+                {'email': 'test@joeshak.com', 'password': 'testpass', 'token_type': 'signed'}
+            )
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertIn('token_type', res.data)
+
+
+class LocalLRUCacheTests(TestCase):
+    """ Test the in-process LRU cache """
+
+    def test_least_recently_used_evicted(self):
+        """ Test the least recently used entry is dropped when full """
+        lru = LocalLRUCache(max_entries=2, ttl=60)
+        lru.set('a', 1)
+        lru.set('b', 2)
+        lru.get('a')
+        lru.set('c', 3)
+
+        self.assertEqual(lru.get('a'), 1)
+        self.assertIsNone(lru.get('b'))
+        self.assertEqual(lru.get('c'), 3)
+
+    def test_expired_entries_ignored(self):
+        """ Test entries are not returned after their TTL """
+        lru = LocalLRUCache(max_entries=2, ttl=-1)
+        lru.set('a', 1)
+
+        self.assertIsNone(lru.get('a'))
@@ -0,0 +1,155 @@
+import asyncio
+import threading
+
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from django.urls import get_resolver
+
+from core import benchmark, seeding
+from core.models import Recipe, Tag
+
+
+class SeedingTests(TestCase):
+    """ Test seeding the database for the benchmarks """
+
+    def test_seed_users(self):
+        """ Test the users are created with their data and links """
+        user_ids = seeding.seed_users(users=2, recipes=5, tags=4, ingredients=6, links=2)
+        users = list(get_user_model().objects.filter(id__in=user_ids).order_by('id'))
+
+        self.assertEqual(len(users), 2)
+        self.assertTrue(users[0].check_password('benchmark'))
+        self.assertEqual(Recipe.objects.filter(user=users[0]).count(), 5)
+        self.assertEqual(Tag.objects.filter(user=users[1]).count(), 4)
+        recipe = Recipe.objects.filter(user=users[0]).first()
+        self.assertEqual(recipe.tags.count(), 2)
+        # a recipe is only linked to the tags of its own user.
+        self.assertEqual(set(recipe.tags.values_list('user', flat=True)), {users[0].id})
+
+    def test_seed_deterministic(self):
+        """ Test the same seed creates the same data """
+        seeding.seed_users(users=1, recipes=5, seed=7, email_prefix='a')
+        seeding.seed_users(users=1, recipes=5, seed=7, email_prefix='b')
+
+        def titles(prefix):
+            return list(Recipe.objects.filter(
+                user__email__startswith=prefix
+            ).order_by('id').values_list('title', 'price', 'time_minutes'))
+
+        self.assertEqual(titles('a'), titles('b'))
+
+
+class BenchmarkRunTests(TestCase):
+    """ Test running the benchmark scenarios """
+
+    def setUp(self):
+        cache.clear()
+        user_id = seeding.seed_users(users=1, recipes=3)[0]
+        self.user = get_user_model().objects.get(pk=user_id)
+
+    def test_run_reports_statistics(self):
+        """ Test every selected scenario is measured """
+        results = benchmark.run(
+            self.user, 'benchmark', iterations=3, warmup=1, only='recipe:recipe-'
+        )
+
+        self.assertIn('recipe:recipe-list', results)
+        self.assertIn('recipe:recipe-bulk [POST]', results)
+        self.assertIn('recipe:recipe-bulk [PATCH]', results)
+        self.assertIn('recipe:recipe-detail [PUT]', results)
+        self.assertIn('recipe:recipe-detail [DELETE]', results)
+        self.assertNotIn('recipe:tag-list', results)
+        stats = results['recipe:recipe-detail']
+        self.assertEqual(stats['requests'], 3)
+        self.assertLessEqual(stats['p50_ms'], stats['p99_ms'])
+        self.assertGreater(stats['queries_max'], 0)
+
+    def test_every_endpoint_covered(self):
+        """ Test every method of the user and recipe endpoints has a scenario """
+        results = benchmark.run(self.user, 'benchmark', iterations=1, warmup=0)
+
+        self.assertIn('user:token-revoke [POST]', results)
+        self.assertIn('user:token-revoke [POST signed]', results)
+        self.assertIn('user:me [PUT]', results)
+        # the password set by 'user:me [PUT]' still works.
+        self.assertTrue(self.client.login(email=self.user.email, password='benchmark'))
+        self.assertEqual(
+            Recipe.objects.filter(user=self.user, title__startswith='Deleted').count(), 0
+        )
+
+    def test_unexpected_status_fails(self):
+        """ Test a scenario returning the wrong status stops the benchmark """
+        scenario = benchmark.Scenario('missing', 'get', '/api/recipe/missing/')
+
+        with self.assertRaises(benchmark.BenchmarkError):
+            benchmark.measure(benchmark.APIClient(), scenario, iterations=1)
+
+
+class ConcurrentBenchmarkTests(TransactionTestCase):
+    """ Test comparing the sync and async read views under concurrency """
+
+    def setUp(self):
+        cache.clear()
+        user_id = seeding.seed_users(users=1, recipes=3)[0]
+        self.user = get_user_model().objects.get(pk=user_id)
+
+    def test_urlconf_variants(self):
+        """ Test only the async URLconf serves the read endpoints with async views """
+        sync_match = get_resolver(benchmark.build_urlconf(False)).resolve('/api/recipe/recipes/')
+        async_match = get_resolver(benchmark.build_urlconf(True)).resolve('/api/recipe/recipes/')
+
+        self.assertFalse(asyncio.iscoroutinefunction(sync_match.func))
+        self.assertTrue(asyncio.iscoroutinefunction(async_match.func))
+        self.assertEqual(async_match.view_name, 'recipe:recipe-list')
+
+    def test_run_concurrent(self):
+        """ Test the read scenarios are measured with the sync and async views """
+        threads = []
+        run_view = benchmark.asyncviews._run_view
+
+        def record_thread(*args):
+            threads.append(threading.current_thread().name)
+            return run_view(*args)
+
+        with patch.object(benchmark.asyncviews, '_run_view', record_thread):
+            results = benchmark.run_concurrent(
+                self.user, 'benchmark', concurrency=2, requests=4, warmup=0,
+                only='recipe:tag-list'
+            )
+
+        self.assertEqual(set(results), {'sync', 'async'})
+        for mode in ('sync', 'async'):
+            self.assertEqual(list(results[mode]), ['recipe:tag-list'])
+            self.assertEqual(results[mode]['recipe:tag-list']['requests'], 4)
+            self.assertGreater(results[mode]['recipe:tag-list']['throughput_rps'], 0)
+        # only the 4 requests to the async views ran in the pool.
+        self.assertEqual(len(threads), 4)
+        self.assertTrue(all(name.startswith('async-view') for name in threads))
+
+
+class CompareTests(SimpleTestCase):
+    """ Test comparing benchmark results with a baseline """
+
+    def _stats(self, p50, queries=3):
+        return {'p50_ms': p50, 'p90_ms': p50 * 1.5, 'queries_max': queries}
+
+    def test_within_tolerance(self):
+        """ Test small changes are not regressions """
+        baseline = {'list': self._stats(10)}
+        self.assertEqual(benchmark.compare({'list': self._stats(11.5)}, baseline), [])
+        # sub-millisecond noise on very fast endpoints is ignored.
+        baseline = {'me': self._stats(0.5)}
+        self.assertEqual(benchmark.compare({'me': self._stats(0.9)}, baseline), [])
+
+    def test_regressions(self):
+        """ Test slower endpoints and extra queries are reported """
+        baseline = {'list': self._stats(10), 'detail': self._stats(5, queries=3)}
+        results = {'list': self._stats(20), 'detail': self._stats(5, queries=4)}
+
+        regressions = benchmark.compare(results, baseline)
+
+        self.assertTrue(any(line.startswith('list: p50_ms') for line in regressions))
+        self.assertIn('detail: 4 queries > 3', regressions)
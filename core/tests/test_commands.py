@@ -1,11 +1,13 @@
 # Patch Function:
         # allows us to mock the behaviour of the Django get database function.
         # it basically simulate the database being available and not being available for when we test our command.
-from unittest.mock import patch
+from io import StringIO
+from unittest.mock import MagicMock, patch
 
 # Call Command Function:
         # allows us to call the command in our source code.
 from django.core.management import call_command
+from django.core.management.base import CommandError
 
 # Operational Error: that Django throws when tha database is unavailable.
         # simulates the database being available or not when we run our command.
@@ -13,6 +15,8 @@ from django.db.utils import OperationalError
 
 from django.test import TestCase
 
+from core.models import Recipe, Tag
+
 
 class CommandTests(TestCase):
 
@@ -36,7 +40,9 @@ class CommandTests(TestCase):
             # it will override it and replace it with a mock object which does 2 things:
                 # 1. specify "return_value"
                 # 2. allow us to monitor how many times it was called and the different calls that were made to it.
-            gi.return_value = True
+            # the command runs a query on the connection, so it returns a mock connection
+            # that accepts any call.
+            gi.return_value = MagicMock()
 
             # test our call_command
             # "wait_for_db" is gonna be the name of management command that we create.
@@ -61,11 +67,80 @@ class CommandTests(TestCase):
             # SideEffect: Raise The Operational Error 5 times, and then on 6th time, it's not gonna raise the error and then the call should complete.
             # "[OperationalError] * 5": means you call this "__getitem__", Raise the Operational Error
             # "+ [True]": means that in the additional 6th time, it won't raise the error, it will just return.
-            gi.side_effect = [OperationalError] * 5 + [True]
+            gi.side_effect = [OperationalError] * 5 + [MagicMock()]
             call_command('wait_for_db')
             self.assertEqual(gi.call_count, 6)
 
+        # the waits between the attempts grow (exponential backoff).
+        delays = [call.args[0] for call in ts.call_args_list]
+        self.assertEqual(len(delays), 5)
+        self.assertLess(delays[0], delays[-1])
 
+    @patch('time.sleep', return_value=True)
+    def test_wait_for_db_query_fails(self, ts):
+        """ Test a connection that can't run a query is not ready """
+        with patch('django.db.utils.ConnectionHandler.__getitem__') as gi:
+            connection = MagicMock()
+            connection.cursor.side_effect = [OperationalError, MagicMock()]
+            gi.return_value = connection
 
+            call_command('wait_for_db')
 
+            self.assertEqual(connection.cursor.call_count, 2)
 
+    @patch('time.sleep', return_value=True)
+    def test_wait_for_db_timeout(self, ts):
+        """ Test the command fails when the database isn't ready in time """
+        with patch('django.db.utils.ConnectionHandler.__getitem__') as gi, \
+                patch('time.monotonic', side_effect=[0, 1, 2, 9, 11, 12]):
+            gi.side_effect = OperationalError
+
+            with self.assertRaises(CommandError):
+                call_command('wait_for_db', timeout=10)
+
+            self.assertEqual(gi.call_count, 4)
+        # the last wait is cut short so the deadline is respected.
+        self.assertLessEqual(ts.call_args_list[-1].args[0], 1)
+
+    @patch('time.sleep', return_value=True)
+    def test_wait_for_migrations(self, ts):
+        """ Test waiting until the migrations are applied """
+        with patch('django.db.utils.ConnectionHandler.__getitem__') as gi, \
+                patch(
+                    'core.management.commands.wait_for_db.MigrationExecutor'
+                ) as executor:
+            gi.return_value = MagicMock()
+            executor.return_value.migration_plan.side_effect = [
+                [('core', '0012')], []
+            ]
+
+            call_command('wait_for_db', wait_for_migrations=True)
+
+            self.assertEqual(executor.return_value.migration_plan.call_count, 2)
+
+
+class SeedDataCommandTests(TestCase):
+    """ Test the seed_data command """
+
+    def test_seed_data(self):
+        """ Test the data is generated in batches with progress output """
+        out = StringIO()
+
+        call_command(
+            'seed_data', users=4, recipes=5, tags=3, batch_rows=10, stdout=out
+        )
+
+        self.assertEqual(Recipe.objects.count(), 20)
+        self.assertEqual(Tag.objects.count(), 12)
+        self.assertEqual(Recipe.tags.through.objects.count(), 20 * 3)
+        # 2 users (10 recipes) per batch.
+        self.assertIn('10/20 recipes', out.getvalue())
+        self.assertIn('20/20 recipes', out.getvalue())
+
+    def test_seed_data_twice(self):
+        """ Test seeding the same users twice fails before writing anything """
+        call_command('seed_data', users=1, recipes=1, stdout=StringIO())
+
+        with self.assertRaises(CommandError):
+            call_command('seed_data', users=1, recipes=1, stdout=StringIO())
+        self.assertEqual(Recipe.objects.count(), 1)
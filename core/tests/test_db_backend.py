@@ -0,0 +1,212 @@
+import threading
+import time
+
+from unittest.mock import MagicMock, patch
+
+import psycopg2
+
+from unittest import skipUnless
+
+from django.db import connection
+from django.test import SimpleTestCase
+
+from core.db.backends.postgresql import base
+
+
+def settings_dict(**params):
+    """ Return the settings of a test database """
+    defaults = {
+        'NAME': 'recipes',
+        'USER': 'user',
+        'PASSWORD': 'pass',
+        'HOST': 'db',
+        'PORT': '',
+        'OPTIONS': {},
+        'AUTOCOMMIT': True,
+        'CONN_MAX_AGE': 60,
+        'CONN_HEALTH_CHECKS': True,
+        'TIME_ZONE': None,
+        'POOL': {},
+    }
+    defaults.update(params)
+    return defaults
+
+
+class ConnectionPoolTests(SimpleTestCase):
+    """ Test the pooled PostgreSQL backend """
+
+    def setUp(self):
+        patcher = patch('psycopg2.pool.ThreadedConnectionPool')
+        self.pool_class = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(base._pools.clear)
+        self.pool = self.pool_class.return_value
+        self.connection = MagicMock(closed=0, isolation_level=None)
+        self.pool.getconn.return_value = self.connection
+
+    def test_pool_shared_and_connection_given_back(self):
+        """ Test the connections come from 1 shared pool and go back to it """
+        pool_settings = settings_dict(POOL={'MIN_SIZE': 2, 'MAX_SIZE': 10})
+        wrapper = base.DatabaseWrapper(pool_settings, 'pooled')
+        other_wrapper = base.DatabaseWrapper(pool_settings, 'pooled')
+
+        with patch('psycopg2.extras.register_default_jsonb'):
+            wrapper.connection = wrapper.get_new_connection({'dbname': 'recipes'})
+            other_wrapper.get_new_connection({'dbname': 'recipes'})
+        wrapper._close()
+
+        self.pool_class.assert_called_once_with(2, 10, dbname='recipes')
+        self.assertIsInstance(wrapper.pool, base.BlockingConnectionPool)
+        self.assertIs(wrapper.connection, self.connection)
+        self.pool.putconn.assert_called_once_with(self.connection, close=False)
+        self.connection.close.assert_not_called()
+
+    def test_dead_pooled_connection_discarded(self):
+        """ Test a closed connection from the pool is replaced """
+        dead = MagicMock(closed=1)
+        self.pool.getconn.side_effect = [dead, self.connection]
+        wrapper = base.DatabaseWrapper(
+            settings_dict(POOL={'MAX_SIZE': 5}), 'pooled'
+        )
+
+        with patch('psycopg2.extras.register_default_jsonb'):
+            connection = wrapper.get_new_connection({})
+
+        self.assertIs(connection, self.connection)
+        self.pool.putconn.assert_called_once_with(dead, close=True)
+
+    def test_new_connection_not_probed(self):
+        """ Test a connection the pool just opened isn't health checked """
+        wrapper = base.DatabaseWrapper(settings_dict(POOL={'MAX_SIZE': 5}), 'pooled')
+
+        with patch('psycopg2.extras.register_default_jsonb'):
+            wrapper.get_new_connection({})
+
+        self.connection.cursor.assert_not_called()
+
+    def test_reused_connection_probed_outside_transaction(self):
+        """ Test the health check of a reused connection doesn't leave a transaction open """
+        self.connection.autocommit = False
+        wrapper = base.DatabaseWrapper(settings_dict(POOL={'MAX_SIZE': 5}), 'pooled')
+
+        with patch('psycopg2.extras.register_default_jsonb'):
+            wrapper.connection = wrapper.get_new_connection({})
+            wrapper._close()
+            wrapper.get_new_connection({})
+
+        self.connection.cursor.assert_called_once_with()
+        self.connection.rollback.assert_called_once_with()
+
+    def test_pool_forces_conn_max_age_zero(self):
+        """ Test the pooled connections aren't kept by their thread """
+        wrapper = base.DatabaseWrapper(
+            settings_dict(CONN_MAX_AGE=60, POOL={'MAX_SIZE': 5}), 'pooled'
+        )
+        unpooled = base.DatabaseWrapper(settings_dict(CONN_MAX_AGE=60), 'default')
+
+        self.assertEqual(wrapper.settings_dict['CONN_MAX_AGE'], 0)
+        self.assertEqual(unpooled.settings_dict['CONN_MAX_AGE'], 60)
+
+    def test_exhausted_pool_times_out(self):
+        """ Test a thread waits for a free connection, then fails with a clear error """
+        pool = base.BlockingConnectionPool(1, 1, 0.05)
+        connection = pool.getconn()
+
+        start = time.monotonic()
+        with self.assertRaisesRegex(psycopg2.OperationalError, 'No database connection'):
+            pool.getconn()
+        self.assertGreaterEqual(time.monotonic() - start, 0.05)
+
+        pool.putconn(connection)
+        self.assertIs(pool.getconn(), connection)
+
+    def test_exhausted_pool_waits_for_connection(self):
+        """ Test a connection given back by another thread is handed to the waiting one """
+        pool = base.BlockingConnectionPool(1, 1, 5)
+        connection = pool.getconn()
+        timer = threading.Timer(0.05, pool.putconn, args=[connection])
+        timer.start()
+        self.addCleanup(timer.cancel)
+
+        self.assertIs(pool.getconn(), connection)
+
+    def test_pool_disabled(self):
+        """ Test the default backend connects when pooling is disabled """
+        wrapper = base.DatabaseWrapper(settings_dict(), 'default')
+
+        with patch('psycopg2.connect') as connect, \
+                patch('psycopg2.extras.register_default_jsonb'):
+            wrapper.get_new_connection({'dbname': 'recipes'})
+
+        connect.assert_called_once_with(dbname='recipes')
+        self.pool_class.assert_not_called()
+
+
+class HealthCheckTests(SimpleTestCase):
+    """ Test the health checks of reused connections """
+
+    def _connected_wrapper(self, **params):
+        wrapper = base.DatabaseWrapper(settings_dict(**params), 'default')
+        wrapper.connection = MagicMock()
+        wrapper.autocommit = True
+        wrapper.close_at = None
+        wrapper.errors_occurred = False
+        return wrapper
+
+    def test_broken_connection_replaced_once_per_request(self):
+        """ Test a dead connection is reconnected before the first query """
+        wrapper = self._connected_wrapper()
+        old_connection = wrapper.connection
+
+        # a new request starts.
+        wrapper.close_if_unusable_or_obsolete()
+        with patch.object(wrapper, 'is_usable', return_value=False) as is_usable, \
+                patch.object(wrapper, 'connect') as connect:
+            wrapper.ensure_connection()
+            wrapper.connection = MagicMock()
+            wrapper.ensure_connection()
+
+        old_connection.close.assert_called_once()
+        connect.assert_called_once()
+        is_usable.assert_called_once()
+
+    def test_health_checks_disabled(self):
+        """ Test the connection isn't checked when health checks are off """
+        wrapper = self._connected_wrapper(CONN_HEALTH_CHECKS=False)
+
+        wrapper.close_if_unusable_or_obsolete()
+        with patch.object(wrapper, 'is_usable') as is_usable:
+            wrapper.ensure_connection()
+
+        is_usable.assert_not_called()
+
+
+@skipUnless(connection.vendor == 'postgresql', 'needs a PostgreSQL database')
+class PooledPostgreSQLTests(SimpleTestCase):
+    """ Test the pooled backend against the real database """
+    databases = {'default'}
+
+    def test_new_and_reused_connections(self):
+        """ Test Django can set up the new and the reused pooled connections """
+        wrapper = base.DatabaseWrapper(
+            {
+                **connection.settings_dict,
+                'CONN_HEALTH_CHECKS': True,
+                'POOL': {'MIN_SIZE': 1, 'MAX_SIZE': 2},
+            },
+            'pooled'
+        )
+        self.addCleanup(base.close_pools)
+
+        for _attempt in range(2):
+            # 'connect' sets autocommit, which fails inside a transaction.
+            wrapper.connect()
+            self.assertTrue(wrapper.get_autocommit())
+            self.assertEqual(
+                wrapper.connection.info.transaction_status,
+                psycopg2.extensions.TRANSACTION_STATUS_IDLE
+            )
+            with wrapper.cursor() as cursor:
+                cursor.execute('SELECT 1')
+                self.assertEqual(cursor.fetchone(), (1,))
+            wrapper.close()
@@ -0,0 +1,128 @@
+import threading
+
+from io import StringIO
+from unittest.mock import patch
+
+from django.contrib.auth import authenticate, get_user_model
+from django.contrib.auth.hashers import make_password as django_make_password
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core import hashers
+
+
+TOKEN_URL = reverse('user:token')
+
+FAST_HASHING = {'PBKDF2_ITERATIONS': 1000}
+
+
+@override_settings(PASSWORD_HASHING=FAST_HASHING)
+class PasswordHashingTests(TestCase):
+    """ Test the tuned hashers and the hashing pool """
+
+    def test_iterations_from_settings(self):
+        """ Test the PBKDF2 iterations come from the settings """
+        encoded = hashers.make_password('testpass123')
+
+        self.assertTrue(encoded.startswith('pbkdf2_sha256$1000$'))
+
+    def test_hashing_runs_in_the_pool(self):
+        """ Test the passwords are hashed in the hashing pool threads """
+        thread_names = []
+
+        def record(password):
+            thread_names.append(threading.current_thread().name)
+            return django_make_password(password)
+
+        with patch('django.contrib.auth.hashers.make_password', side_effect=record):
+            hashers.make_password('testpass123')
+
+        self.assertTrue(thread_names[0].startswith('password-hash'))
+
+    def test_create_user_hashes_with_settings(self):
+        """ Test creating a user hashes the password with the configured cost """
+        user = get_user_model().objects.create_user('test@londonappdev.com', 'testpass123')
+
+        self.assertIn('$1000$', user.password)
+        self.assertTrue(user.check_password('testpass123'))
+
+    def test_check_password_outdated_hash(self):
+        """ Test a hash made with another cost must be updated """
+        encoded = hashers.make_password('testpass123')
+
+        with self.settings(PASSWORD_HASHING={'PBKDF2_ITERATIONS': 2000}):
+            self.assertEqual(hashers.check_password('testpass123', encoded), (True, True))
+            self.assertEqual(hashers.check_password('wrong', encoded), (False, False))
+        self.assertEqual(hashers.check_password('testpass123', encoded), (True, False))
+
+    def test_measure_logins(self):
+        """ Test measuring the password checks per second """
+        hasher = hashers.TunedPBKDF2PasswordHasher()
+
+        self.assertGreater(hashers.measure_logins(hasher, count=2), 0)
+        self.assertGreater(hashers.measure_logins(hasher, count=2, threads=2), 0)
+
+    def test_benchmark_hashers_command(self):
+        """ Test the benchmark command reports the logins per second """
+        out = StringIO()
+        call_command('benchmark_hashers', '--profile', 'pbkdf2', '--count', '2', stdout=out)
+
+        self.assertIn('pbkdf2:', out.getvalue())
+        self.assertIn('logins/s per core', out.getvalue())
+
+
+@override_settings(PASSWORD_HASHING=FAST_HASHING)
+class PooledModelBackendTests(TestCase):
+    """ Test authenticating with the hashing pool backend """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email='test@londonappdev.com',
+            password='testpass123'
+        )
+
+    def test_authenticate(self):
+        """ Test the backend accepts only the right password """
+        self.assertEqual(
+            authenticate(username='test@londonappdev.com', password='testpass123'),
+            self.user
+        )
+        self.assertIsNone(authenticate(username='test@londonappdev.com', password='wrong'))
+        self.assertIsNone(authenticate(username='nobody@londonappdev.com', password='wrong'))
+
+    def test_inactive_user_rejected(self):
+        """ Test an inactive user can't authenticate """
+        self.user.is_active = False
+        self.user.save()
+
+        self.assertIsNone(
+            authenticate(username='test@londonappdev.com', password='testpass123')
+        )
+
+    def test_login_upgrades_outdated_hash(self):
+        """ Test logging in re-hashes a password hashed with another cost """
+        with self.settings(PASSWORD_HASHING={'PBKDF2_ITERATIONS': 2000}):
+            res = self.client.post(
+                TOKEN_URL, {'email': 'test@londonappdev.com', 'password': 'testpass123'}
+            )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.user.refresh_from_db()
+        self.assertIn('$2000$', self.user.password)
+
+    def test_failed_login_keeps_hash(self):
+        """ Test a wrong password doesn't change the stored hash """
+        old_password = self.user.password
+        with self.settings(PASSWORD_HASHING={'PBKDF2_ITERATIONS': 2000}):
+            res = self.client.post(
+                TOKEN_URL, {'email': 'test@londonappdev.com', 'password': 'wrong'}
+            )
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.password, old_password)
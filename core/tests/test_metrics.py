@@ -0,0 +1,216 @@
+import asyncio
+import json
+import os
+import tempfile
+import threading
+
+from asgiref.sync import async_to_sync
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.test import (
+    RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+)
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core import metrics
+from core.asyncviews import async_view
+from core.middleware import MetricsMiddleware
+from core.models import Tag
+
+
+METRICS_URL = reverse('metrics')
+TAGS_URL = reverse('recipe:tag-list')
+
+
+class RegistryTests(SimpleTestCase):
+    """ Test the metrics registry """
+
+    def setUp(self):
+        self.registry = metrics.Registry()
+        self.counter = self.registry.counter('jobs_total', 'Jobs.', ('kind',))
+        self.histogram = self.registry.histogram(
+            'job_seconds', 'Job time.', buckets=(0.1, 1)
+        )
+
+    def test_exposition_format(self):
+        """ Test counters and histograms in the Prometheus text format """
+        self.counter.inc(kind='a')
+        self.counter.inc(2, kind='a')
+        self.histogram.observe(0.05)
+        self.histogram.observe(0.5)
+        self.histogram.observe(3)
+
+        text = self.registry.expose()
+
+        self.assertIn('# TYPE jobs_total counter', text)
+        self.assertIn('jobs_total{kind="a"} 3', text)
+        self.assertIn('# TYPE job_seconds histogram', text)
+        self.assertIn('job_seconds_bucket{le="0.1"} 1', text)
+        self.assertIn('job_seconds_bucket{le="1"} 2', text)
+        self.assertIn('job_seconds_bucket{le="+Inf"} 3', text)
+        self.assertIn('job_seconds_sum 3.55', text)
+        self.assertIn('job_seconds_count 3', text)
+
+    def test_threads_counted(self):
+        """ Test the values written by several threads add up """
+        def work():
+            for _ in range(1000):
+                self.counter.inc(kind='b')
+
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(self.counter.collect(), {('b',): 4000})
+
+    def test_processes_added_up(self):
+        """ Test the snapshots of the other processes are included """
+        self.counter.inc(kind='a')
+        with tempfile.TemporaryDirectory() as directory:
+            with open(os.path.join(directory, 'metrics-1.json'), 'w') as file:
+                json.dump({
+                    'jobs_total': [[['a'], 4]],
+                    'job_seconds': [[[], [1, 0, 0, 0.05]]],
+                }, file)
+
+            with override_settings(METRICS={'MULTIPROCESS_DIR': directory}):
+                text = self.registry.expose()
+                own_snapshot = self.registry._snapshot_path(directory)
+                self.assertTrue(os.path.exists(own_snapshot))
+
+        self.assertIn('jobs_total{kind="a"} 5', text)
+        self.assertIn('job_seconds_count 1', text)
+
+    def test_exited_process_merged(self):
+        """ Test the snapshots of exited processes are merged into the aggregate """
+        with tempfile.TemporaryDirectory() as directory:
+            for name, count in (('metrics-1-100.json', 4), ('metrics-2-100.json', 2)):
+                with open(os.path.join(directory, name), 'w') as file:
+                    json.dump({
+                        'jobs_total': [[['a'], count]],
+                        'job_seconds': [[[], [1, 0, 0, 0.05]]],
+                    }, file)
+
+            with override_settings(METRICS={'MULTIPROCESS_DIR': directory}):
+                before = self.registry.collect_all()
+                metrics.merge_process_snapshot(directory, 1)
+                metrics.merge_process_snapshot(directory, 2)
+                after = self.registry.collect_all()
+                filenames = os.listdir(directory)
+
+        self.assertEqual(after, before)
+        self.assertEqual(after['jobs_total'], {('a',): 6})
+        self.assertEqual(after['job_seconds'], {(): [2, 0, 0, 0.1]})
+        self.assertIn(metrics.AGGREGATE_FILENAME, filenames)
+        self.assertNotIn('metrics-1-100.json', filenames)
+        self.assertNotIn('metrics-2-100.json', filenames)
+
+    def test_merged_snapshot_not_counted_twice(self):
+        """ Test a snapshot merged but not deleted yet is only counted once """
+        with tempfile.TemporaryDirectory() as directory:
+            with open(os.path.join(directory, 'metrics-1-100.json'), 'w') as file:
+                json.dump({'jobs_total': [[['a'], 4]]}, file)
+            metrics._add_to_aggregate(
+                directory, 'metrics-1-100.json', {'jobs_total': [[['a'], 4]]}
+            )
+
+            with override_settings(METRICS={'MULTIPROCESS_DIR': directory}):
+                values = self.registry.collect_all()
+
+        self.assertEqual(values['jobs_total'], {('a',): 4})
+
+    def test_reused_pid_new_snapshot(self):
+        """ Test a new process with the PID of an old one doesn't overwrite its snapshot """
+        with tempfile.TemporaryDirectory() as directory:
+            path = self.registry._snapshot_path(directory)
+            self.assertEqual(self.registry._snapshot_path(directory), path)
+
+            # a forked worker (or a new process) starts a new snapshot.
+            self.registry._process = (os.getpid() + 1, 0)
+            self.assertNotEqual(self.registry._snapshot_path(directory), path)
+            self.assertTrue(
+                os.path.basename(self.registry._snapshot_path(directory))
+                .startswith(f'metrics-{os.getpid()}-')
+            )
+
+
+class MetricsEndpointTests(TestCase):
+    """ Test the '/metrics' endpoint """
+
+    def setUp(self):
+        cache.clear()
+        metrics.REGISTRY.clear()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@joeshak.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_request_metrics(self):
+        """ Test the requests are counted per route with the cache lookups """
+        self.client.get(TAGS_URL)
+        self.client.get(TAGS_URL)
+
+        res = self.client.get(METRICS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertTrue(res['Content-Type'].startswith('text/plain'))
+        text = res.content.decode()
+        self.assertIn(
+            'http_requests_total{method="GET",route="recipe:tag-list",status="200"} 2',
+            text
+        )
+        self.assertIn(
+            'http_request_duration_seconds_count{method="GET",route="recipe:tag-list"} 2',
+            text
+        )
+        self.assertIn('http_request_db_queries_count{route="recipe:tag-list"} 2', text)
+        self.assertIn('cache_requests_total{cache="recipe_attr_list",result="hit"} 1', text)
+        self.assertIn('cache_requests_total{cache="recipe_attr_list",result="miss"} 1', text)
+
+    @override_settings(METRICS={'TOKEN': 'secret'})
+    def test_token_required(self):
+        """ Test the metrics token is required when it's set """
+        res = self.client.get(METRICS_URL)
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        res = self.client.get(METRICS_URL, HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+
+class AsyncMetricsMiddlewareTests(TransactionTestCase):
+    """ Test the metrics middleware under ASGI """
+
+    def setUp(self):
+        metrics.REGISTRY.clear()
+
+    def test_async_middleware(self):
+        """ Test the middleware is async with an async view """
+        middleware = MetricsMiddleware(async_view(lambda request: HttpResponse()))
+
+        self.assertTrue(asyncio.iscoroutinefunction(middleware))
+
+    def test_queries_counted_in_view_thread(self):
+        """ Test the queries run by the view in another thread are counted """
+        threads = []
+
+        def view(request):
+            threads.append(threading.current_thread())
+            list(Tag.objects.all())
+            return HttpResponse()
+
+        middleware = MetricsMiddleware(async_view(view))
+        async_to_sync(middleware)(RequestFactory().get(TAGS_URL))
+
+        self.assertIsNot(threads[0], threading.current_thread())
+        self.assertEqual(
+            metrics.REQUEST_QUERIES.collect()[('unmatched',)][-1], 1
+        )
@@ -0,0 +1,94 @@
+import asyncio
+import os
+import tempfile
+
+from asgiref.sync import async_to_sync
+
+from django.contrib.auth import get_user_model
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+
+from rest_framework.test import APIClient
+
+from core.asyncviews import async_view
+from core.middleware import ProfilingMiddleware
+from core.models import Tag
+
+
+TAGS_URL = reverse('recipe:tag-list')
+
+
+def profiling(**config):
+    """ Return the profiling settings with the middleware enabled """
+    return override_settings(REQUEST_PROFILING={'ENABLED': True, **config})
+
+
+class ProfilingMiddlewareTests(TestCase):
+    """ Test the request profiling middleware """
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'test@joeshak.com',
+            'testpass'
+        )
+        Tag.objects.create(user=self.user, name='Vegan')
+
+    def _get(self, url):
+        # a new client loads the middleware with the current settings.
+        client = APIClient()
+        client.force_authenticate(self.user)
+        return client.get(url)
+
+    def test_disabled_by_default(self):
+        """ Test no timing header is added when profiling is disabled """
+        res = self._get(TAGS_URL)
+
+        self.assertFalse(res.has_header('Server-Timing'))
+
+    @profiling()
+    def test_server_timing_header(self):
+        """ Test the time and queries of the request are reported """
+        res = self._get(TAGS_URL)
+
+        timing = res['Server-Timing']
+        self.assertRegex(timing, r'app;dur=[\d.]+')
+        self.assertRegex(timing, r'db;dur=[\d.]+;desc="[1-9]\d* queries"')
+        self.assertIn(f'body;desc="{len(res.content)} bytes"', timing)
+
+    @profiling(MAX_QUERIES=0)
+    def test_request_over_threshold_logged(self):
+        """ Test requests over the query threshold are logged """
+        with self.assertLogs('core.middleware', level='WARNING') as logs:
+            self._get(TAGS_URL)
+
+        self.assertIn(f'GET {TAGS_URL}', logs.output[0])
+
+    def test_sampled_request_profiled(self):
+        """ Test the sampled requests are saved with cProfile """
+        with tempfile.TemporaryDirectory() as profile_dir:
+            with profiling(PROFILE_SAMPLE_RATE=1.0, PROFILE_DIR=profile_dir):
+                self._get(TAGS_URL)
+
+            files = os.listdir(profile_dir)
+
+        self.assertEqual(len(files), 1)
+        self.assertTrue(files[0].endswith('.prof'))
+
+
+class AsyncProfilingMiddlewareTests(TransactionTestCase):
+    """ Test the profiling middleware under ASGI """
+
+    @profiling()
+    def test_queries_counted_in_view_thread(self):
+        """ Test the async middleware counts the queries run in the view's thread """
+        def view(request):
+            list(Tag.objects.all())
+            list(Tag.objects.all())
+            return HttpResponse()
+
+        middleware = ProfilingMiddleware(async_view(view))
+        res = async_to_sync(middleware)(RequestFactory().get(TAGS_URL))
+
+        self.assertTrue(asyncio.iscoroutinefunction(middleware))
+        self.assertIn('desc="2 queries"', res['Server-Timing'])
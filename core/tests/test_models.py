@@ -1,6 +1,7 @@
 # Test 1: test that our helper function for our model can create a new user.
 # we're gonna use the "create_user" function to create a user
 # and then we're gonna to verify that user has been created as expected.
+from django.db import connection
 from django.test import TestCase
 
 from unittest.mock import patch
@@ -110,3 +111,42 @@ class ModelTests(TestCase):
 
         exp_path = f'uploads/recipe/{uuid}.jpg'
         self.assertEqual(file_path, exp_path)
+
+
+class IndexTests(TestCase):
+    """ Test the indexes for the hot filter paths exist """
+
+    def _index_columns(self, table):
+        """ Return the column lists of the indexes on a table """
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(cursor, table)
+        return [
+            constraint['columns'] for constraint in constraints.values()
+            if constraint['index']
+        ]
+
+    def test_user_name_indexes(self):
+        """ Test tags and ingredients are indexed by user and name """
+        for table in ('core_tag', 'core_ingredient'):
+            self.assertIn(['user_id', 'name', 'id'], self._index_columns(table))
+
+    def test_recipe_user_index(self):
+        """ Test recipes are indexed by user and id """
+        self.assertIn(['user_id', 'id'], self._index_columns('core_recipe'))
+
+    def test_recipe_price_time_indexes(self):
+        """ Test recipes are indexed for the price and time filters """
+        columns = self._index_columns('core_recipe')
+        self.assertIn(['user_id', 'price', 'id'], columns)
+        self.assertIn(['user_id', 'time_minutes', 'id'], columns)
+
+    def test_through_table_reverse_indexes(self):
+        """ Test the recipe links are indexed from the tag/ingredient side """
+        self.assertIn(
+            ['tag_id', 'recipe_id'],
+            self._index_columns('core_recipe_tags')
+        )
+        self.assertIn(
+            ['ingredient_id', 'recipe_id'],
+            self._index_columns('core_recipe_ingredients')
+        )
@@ -0,0 +1,223 @@
+import tempfile
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache, caches
+from django.core.exceptions import ImproperlyConfigured
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core import throttling
+from core.models import Recipe
+
+
+RECIPES_URL = reverse('recipe:recipe-list')
+TOKEN_URL = reverse('user:token')
+
+
+def throttle_settings(rates, **token_bucket):
+    """ Return the REST_FRAMEWORK settings with other rates and options """
+    return {
+        **settings.REST_FRAMEWORK,
+        'DEFAULT_THROTTLE_RATES': rates,
+        'TOKEN_BUCKET': {
+            **settings.REST_FRAMEWORK['TOKEN_BUCKET'], 'ENABLED': True, **token_bucket
+        },
+    }
+
+
+class TokenBucketTests(SimpleTestCase):
+    """ Test the token bucket algorithm """
+
+    def test_parse_rate(self):
+        """ Test a DRF rate gives the capacity and the tokens per second """
+        self.assertEqual(throttling.parse_rate('60/min'), (60, 1))
+        self.assertEqual(throttling.parse_rate('10/s'), (10, 10))
+
+    def test_take_from_new_bucket(self):
+        """ Test a new bucket starts full """
+        bucket, wait = throttling.take(None, 3, capacity=5, refill_rate=1, now=100)
+
+        self.assertEqual(bucket, (2, 100))
+        self.assertEqual(wait, 0)
+
+    def test_empty_bucket_waits(self):
+        """ Test an empty bucket returns the time until the tokens are refilled """
+        bucket, wait = throttling.take((0.5, 100), 2, capacity=5, refill_rate=0.5, now=100)
+
+        self.assertEqual(bucket, (0.5, 100))
+        self.assertEqual(wait, 3)
+
+    def test_bucket_refills_up_to_capacity(self):
+        """ Test the tokens come back with time but never above the capacity """
+        bucket, wait = throttling.take((0, 100), 1, capacity=5, refill_rate=1, now=200)
+
+        self.assertEqual(bucket, (4, 200))
+        self.assertEqual(wait, 0)
+
+    def test_cost_capped_to_capacity(self):
+        """ Test a request costing more than the capacity can still pass """
+        bucket, wait = throttling.take(None, 50, capacity=5, refill_rate=1, now=100)
+
+        self.assertEqual(bucket, (0, 100))
+        self.assertEqual(wait, 0)
+
+    def test_local_store_bounded(self):
+        """ Test the local store drops the least recently used buckets """
+        store = throttling.LocalBucketStore({'MAX_ENTRIES': 2})
+        store.consume('a', 1, 1, 0.001)
+        store.consume('b', 1, 1, 0.001)
+        store.consume('c', 1, 1, 0.001)
+
+        # 'a' was dropped, so it's a full bucket again.
+        self.assertEqual(store.consume('a', 1, 1, 0.001), 0)
+        self.assertGreater(store.consume('c', 1, 1, 0.001), 0)
+
+
+class ThrottlingApiTests(TestCase):
+    """ Test the throttling of the API """
+
+    def setUp(self):
+        throttling.reset_store()
+        # the IDs can be reused by the next tests, so don't leave empty buckets behind.
+        self.addCleanup(throttling.reset_store)
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.user = get_user_model().objects.create_user(
+            'test@londonappdev.com',
+            'testpass'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_user_throttled(self):
+        """ Test a user is throttled once its bucket is empty """
+        with self.settings(REST_FRAMEWORK=throttle_settings({'user': '3/min'})):
+            for _index in range(3):
+                res = self.client.get(RECIPES_URL)
+                self.assertEqual(res.status_code, status.HTTP_200_OK)
+            res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(res['Retry-After'], '20')
+
+    def test_users_have_their_own_buckets(self):
+        """ Test a throttled user doesn't throttle the other users """
+        other = get_user_model().objects.create_user('other@londonappdev.com', 'testpass')
+        with self.settings(REST_FRAMEWORK=throttle_settings({'user': '1/min'})):
+            self.client.get(RECIPES_URL)
+            self.client.force_authenticate(other)
+            res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_big_pages_cost_more(self):
+        """ Test asking for 10 default pages at once takes 10 tokens """
+        rest_framework = throttle_settings({'user': '10/min'})
+        rest_framework['PAGE_SIZE'] = 100
+        with self.settings(REST_FRAMEWORK=rest_framework):
+            res = self.client.get(RECIPES_URL, {'page_size': 1000})
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    def test_upload_bytes_cost_more(self):
+        """ Test the request body takes 1 token per 'BYTES_PER_TOKEN' bytes """
+        recipe = Recipe.objects.create(user=self.user, title='Sample', time_minutes=5, price=5)
+        url = reverse('recipe:recipe-upload-image', args=[recipe.id])
+        rest_framework = throttle_settings(
+            {'user': '1000/min', 'uploads': '5/min'}, BYTES_PER_TOKEN=100
+        )
+        with self.settings(REST_FRAMEWORK=rest_framework):
+            # 1 + 400 bytes / 100 = 5 tokens, the whole bucket.
+            res = self.client.post(url, 'x' * 400, content_type='application/octet-stream')
+            self.assertNotEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+            res = self.client.post(url, {'image': ''}, format='multipart')
+            self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+            # the other endpoints only use the user's rate.
+            res = self.client.get(RECIPES_URL)
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_anonymous_throttled_by_ip(self):
+        """ Test the anonymous requests are throttled with the 'anon' rate """
+        client = APIClient()
+        payload = {'email': 'test@londonappdev.com', 'password': 'wrong'}
+        with self.settings(REST_FRAMEWORK=throttle_settings({'anon': '1/min'})):
+            res = client.post(TOKEN_URL, payload)
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+            res = client.post(TOKEN_URL, payload)
+
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    def test_forwarded_for_not_trusted(self):
+        """ Test a spoofed 'X-Forwarded-For' doesn't give a new anonymous bucket """
+        client = APIClient()
+        payload = {'email': 'test@londonappdev.com', 'password': 'wrong'}
+        with self.settings(REST_FRAMEWORK=throttle_settings({'anon': '1/min'})):
+            client.post(TOKEN_URL, payload, HTTP_X_FORWARDED_FOR='10.0.0.1')
+            res = client.post(TOKEN_URL, payload, HTTP_X_FORWARDED_FOR='10.0.0.2')
+
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    def test_forwarded_for_behind_proxy(self):
+        """ Test only the address added by the proxy is used behind 1 proxy """
+        client = APIClient()
+        payload = {'email': 'test@londonappdev.com', 'password': 'wrong'}
+        rest_framework = throttle_settings({'anon': '1/min'})
+        rest_framework['NUM_PROXIES'] = 1
+        with self.settings(REST_FRAMEWORK=rest_framework):
+            client.post(TOKEN_URL, payload, HTTP_X_FORWARDED_FOR='10.0.0.1, 192.0.2.1')
+            # the client can prepend anything, the proxy appends the address it saw.
+            res = client.post(TOKEN_URL, payload, HTTP_X_FORWARDED_FOR='10.0.0.2, 192.0.2.1')
+            self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+            res = client.post(TOKEN_URL, payload, HTTP_X_FORWARDED_FOR='192.0.2.2')
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_throttling_disabled(self):
+        """ Test nothing is throttled when the throttling is disabled """
+        rest_framework = throttle_settings({'user': '1/min'}, ENABLED=False)
+        with self.settings(REST_FRAMEWORK=rest_framework):
+            for _index in range(3):
+                res = self.client.get(RECIPES_URL)
+                self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_cache_store(self):
+        """ Test the buckets can be shared through a Django cache """
+        rest_framework = throttle_settings(
+            {'user': '1/min'},
+            STORE='core.throttling.CacheBucketStore',
+            CACHE_ALIAS='throttle'
+        )
+        with tempfile.TemporaryDirectory() as location:
+            # a file cache is shared by the processes, like memcached.
+            shared_cache = {
+                'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                'LOCATION': location,
+            }
+            with self.settings(
+                REST_FRAMEWORK=rest_framework,
+                CACHES={**settings.CACHES, 'throttle': shared_cache}
+            ):
+                self.client.get(RECIPES_URL)
+                # another process has its own store but the same cache.
+                throttling.reset_store()
+                res = self.client.get(RECIPES_URL)
+
+                self.assertIsNotNone(
+                    caches['throttle'].get(f'throttle:user:{self.user.pk}')
+                )
+
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    def test_cache_store_needs_shared_cache(self):
+        """ Test the cache store refuses a cache that's local to the process """
+        config = {**throttling.get_config(), 'CACHE_ALIAS': 'default'}
+
+        with self.assertRaises(ImproperlyConfigured):
+            throttling.CacheBucketStore(config)
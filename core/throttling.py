@@ -0,0 +1,226 @@
+import math
+import threading
+import time
+
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+from core import metrics
+
+
+# Token bucket throttling: every client has a bucket of 'capacity' tokens that refills at
+# a constant rate, and each request takes tokens from it. a client can send a burst of
+# requests as long as its bucket isn't empty, then it's limited to the refill rate.
+#
+# the rates use DRF's format in "DEFAULT_THROTTLE_RATES" (e.g. '600/min' = a bucket of
+# 600 tokens refilled in a minute) and the other options are in REST_FRAMEWORK's
+# 'TOKEN_BUCKET' (see 'DEFAULT_TOKEN_BUCKET').
+#
+# requests don't all cost the same: a request takes 1 token, plus 1 per 'BYTES_PER_TOKEN'
+# bytes of body (e.g. image uploads), times the number of default pages it asks for on
+# the list endpoints (a '?page_size=1000' list costs 10 when the default page size is
+# 100). a view can also set 'throttle_cost' (e.g. on an expensive action).
+#
+# a bucket is just (tokens, last update time), so checking a request is O(1). the
+# buckets are kept by a "store":
+# - 'LocalBucketStore' (default): in the memory of the process. every process has its
+#   own buckets, so with N gunicorn workers a client can get up to N times the rate
+#   (each of its requests goes to any of the workers).
+# - 'CacheBucketStore': in a Django cache (e.g. memcached or redis) shared by every
+#   process and node, for the exact rate. the cache must really be shared: a local memory
+#   cache is per process too (and a dummy cache stores nothing), so they're refused.
+#   the read and the write aren't atomic, so 2 concurrent requests of a client can both
+#   take the same token, which only makes the limit slightly less strict.
+
+DEFAULT_TOKEN_BUCKET = {
+    'ENABLED': True,
+    'STORE': 'core.throttling.LocalBucketStore',
+    'CACHE_ALIAS': 'default',
+    'MAX_ENTRIES': 100000,
+    'BYTES_PER_TOKEN': 1024 * 1024,
+}
+
+THROTTLED_REQUESTS = metrics.REGISTRY.counter(
+    'api_throttled_requests_total',
+    'Number of API requests rejected by the throttling.',
+    ('scope',)
+)
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_config():
+    rest_framework = getattr(settings, 'REST_FRAMEWORK', {})
+    return {**DEFAULT_TOKEN_BUCKET, **rest_framework.get('TOKEN_BUCKET', {})}
+
+
+def parse_rate(rate):
+    """ Return (capacity, tokens per second) of a rate like '600/min' """
+    num, period = rate.split('/')
+    seconds = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}[period[0]]
+    return int(num), int(num) / seconds
+
+
+def take(bucket, cost, capacity, refill_rate, now):
+    """ Take 'cost' tokens from a bucket
+
+    'bucket' is (tokens, last update) or None for a new (full) bucket.
+    Returns (the new bucket, seconds to wait before retrying or 0 if the tokens were taken).
+    """
+    tokens, updated = bucket if bucket is not None else (capacity, now)
+    tokens = min(capacity, tokens + (now - updated) * refill_rate)
+    # a request can't cost more than a full bucket, otherwise it could never pass.
+    cost = min(cost, capacity)
+    if tokens >= cost:
+        return (tokens - cost, now), 0
+    return (tokens, now), (cost - tokens) / refill_rate
+
+
+class LocalBucketStore:
+    """ The buckets in the memory of the process, the least recently used are dropped """
+
+    def __init__(self, config):
+        self.max_entries = config['MAX_ENTRIES']
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def consume(self, key, cost, capacity, refill_rate):
+        with self._lock:
+            bucket, wait = take(
+                self._buckets.get(key), cost, capacity, refill_rate, time.monotonic()
+            )
+            self._buckets[key] = bucket
+            self._buckets.move_to_end(key)
+            # a dropped bucket comes back full, like the bucket of an idle client.
+            while len(self._buckets) > self.max_entries:
+                self._buckets.popitem(last=False)
+        return wait
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+class CacheBucketStore:
+    """ The buckets in a Django cache shared by all the processes and nodes """
+
+    def __init__(self, config):
+        self.cache = caches[config['CACHE_ALIAS']]
+        if isinstance(self.cache, (LocMemCache, DummyCache)):
+            raise ImproperlyConfigured(
+                f'CacheBucketStore needs a cache shared by the processes, the '
+                f'"{config["CACHE_ALIAS"]}" cache is {type(self.cache).__name__}.'
+            )
+
+    def consume(self, key, cost, capacity, refill_rate):
+        # the clocks of the nodes must agree, so this uses the wall clock.
+        bucket, wait = take(self.cache.get(key), cost, capacity, refill_rate, time.time())
+        # once refilled, the bucket is the same as a missing one, so it can expire then.
+        self.cache.set(key, bucket, timeout=math.ceil(capacity / refill_rate))
+        return wait
+
+    def clear(self):
+        pass
+
+
+def get_store():
+    global _store
+    config = get_config()
+    with _store_lock:
+        if _store is None or _store[0] != config['STORE']:
+            _store = (config['STORE'], import_string(config['STORE'])(config))
+        return _store[1]
+
+
+def reset_store():
+    """ Forget every bucket (e.g. between tests) """
+    global _store
+    with _store_lock:
+        _store = None
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """ Base class of the token bucket throttles """
+    scope = None
+
+    def get_scope(self, request, view):
+        return self.scope
+
+    def get_cache_key(self, request, view, scope):
+        """ Return the key of the client's bucket, or None to not throttle the request """
+        raise NotImplementedError
+
+    def get_cost(self, request, view):
+        """ Return the number of tokens the request takes """
+        cost = getattr(view, 'throttle_cost', 1)
+        if getattr(view, 'action', None) == 'list' and getattr(view, 'paginator', None):
+            default_page_size = api_settings.PAGE_SIZE
+            page_size = view.paginator.get_page_size(request) or default_page_size
+            if default_page_size:
+                cost *= math.ceil(page_size / default_page_size)
+        try:
+            length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            length = 0
+        return cost + length // get_config()['BYTES_PER_TOKEN']
+
+    def allow_request(self, request, view):
+        self.wait_time = None
+        if not get_config()['ENABLED']:
+            return True
+        scope = self.get_scope(request, view)
+        rate = api_settings.DEFAULT_THROTTLE_RATES.get(scope) if scope else None
+        if rate is None:
+            return True
+        key = self.get_cache_key(request, view, scope)
+        if key is None:
+            return True
+
+        capacity, refill_rate = parse_rate(rate)
+        self.wait_time = get_store().consume(
+            key, self.get_cost(request, view), capacity, refill_rate
+        )
+        if self.wait_time:
+            THROTTLED_REQUESTS.inc(scope=scope)
+            return False
+        return True
+
+    def wait(self):
+        return self.wait_time
+
+
+class UserTokenBucketThrottle(TokenBucketThrottle):
+    """ Throttle each user (rate 'user') and each anonymous IP address (rate 'anon') """
+
+    def get_scope(self, request, view):
+        return 'user' if request.user and request.user.is_authenticated else 'anon'
+
+    def get_cache_key(self, request, view, scope):
+        if scope == 'user':
+            return f'throttle:user:{request.user.pk}'
+        return f'throttle:anon:{self.get_ident(request)}'
+
+
+class ScopedTokenBucketThrottle(TokenBucketThrottle):
+    """ Throttle the views with a 'throttle_scope' with that scope's rate
+
+    e.g. the image uploads have their own (lower) rate on top of the user's rate.
+    """
+
+    def get_scope(self, request, view):
+        return getattr(view, 'throttle_scope', None)
+
+    def get_cache_key(self, request, view, scope):
+        if request.user and request.user.is_authenticated:
+            return f'throttle:{scope}:user:{request.user.pk}'
+        return f'throttle:{scope}:anon:{self.get_ident(request)}'
@@ -0,0 +1,23 @@
+import hmac
+
+from django.http import HttpResponse
+from django.views.decorators.http import require_GET
+
+from core import metrics
+
+
+# the Prometheus server reads this page every few seconds (a "scrape").
+@require_GET
+def metrics_view(request):
+    """ Return the metrics in the Prometheus text format """
+    token = metrics.get_config()['TOKEN']
+    if token:
+        expected = f'Bearer {token}'
+        given = request.headers.get('Authorization', '')
+        # 'compare_digest' takes the same time wherever the strings differ.
+        if not hmac.compare_digest(given.encode(), expected.encode()):
+            return HttpResponse(status=401)
+    return HttpResponse(
+        metrics.REGISTRY.expose(),
+        content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
@@ -0,0 +1,99 @@
+import bisect
+import difflib
+
+from django.conf import settings
+from django.contrib.postgres.search import TrigramSimilarity
+from django.db import connection
+from django.db.models import Case, IntegerField, Q, Value, When
+
+from core.cache import LocalLRUCache
+
+from recipe import cache
+
+
+# Autocomplete is called on every keystroke, so it must never scan all the names.
+# On PostgreSQL the 'pg_trgm' GIN indexes (see the migration) answer both the prefix
+# search and the "similar to" (typo tolerant) search.
+# the prefix matches come first, then the most similar names.
+
+def _search_postgres(queryset, term, limit):
+    matches = queryset.filter(
+        Q(name__istartswith=term) | Q(name__trigram_similar=term)
+    ).annotate(
+        is_prefix=Case(
+            When(name__istartswith=term, then=Value(1)),
+            default=Value(0),
+            output_field=IntegerField(),
+        ),
+        similarity=TrigramSimilarity('name', term),
+    ).order_by('-is_prefix', '-similarity', 'name')
+    return list(matches.values('id', 'name')[:limit])
+
+
+# On other databases (e.g. SQLite in the tests) each user's names are loaded once into
+# a sorted list and searched in memory with 'bisect' (a binary search).
+# the lists are cached with the same per-user version as the cached lists
+# ('recipe/cache.py'), so a new or renamed tag/ingredient gives a new list.
+
+_names_cache = LocalLRUCache(max_entries=1000, ttl=300)
+
+
+def _get_sorted_names(queryset, user_id, endpoint):
+    key = (endpoint, user_id, cache.get_user_version(user_id))
+    names = _names_cache.get(key)
+    if names is None:
+        names = sorted(
+            (name.lower(), name, pk)
+            for pk, name in queryset.values_list('id', 'name')
+        )
+        _names_cache.set(key, names)
+    return names
+
+
+def _search_in_memory(names, term, limit):
+    term = term.lower()
+    results = []
+    seen = set()
+
+    def add(entry):
+        if entry[2] not in seen and len(results) < limit:
+            seen.add(entry[2])
+            results.append({'id': entry[2], 'name': entry[1]})
+
+    # all the names starting with the term are next to each other in the sorted list.
+    start = bisect.bisect_left(names, (term,))
+    for entry in names[start:]:
+        if not entry[0].startswith(term) or len(results) >= limit:
+            break
+        add(entry)
+
+    # then names containing the term, then similar names (typos).
+    if len(results) < limit:
+        for entry in names:
+            if term in entry[0]:
+                add(entry)
+    if len(results) < limit:
+        lowered = [entry[0] for entry in names]
+        close = difflib.get_close_matches(term, lowered, n=limit, cutoff=0.6)
+        for match in close:
+            add(names[bisect.bisect_left(names, (match,))])
+
+    return results
+
+
+def autocomplete(queryset, user_id, endpoint, term, limit):
+    """ Return up to 'limit' {'id', 'name'} matches for a partial name """
+    queryset = queryset.filter(user_id=user_id)
+    if connection.vendor == 'postgresql':
+        return _search_postgres(queryset, term, limit)
+    return _search_in_memory(
+        _get_sorted_names(queryset, user_id, endpoint), term, limit
+    )
+
+
+def get_limits():
+    """ Return the default and maximum number of autocomplete results """
+    return (
+        getattr(settings, 'RECIPE_AUTOCOMPLETE_LIMIT', 10),
+        getattr(settings, 'RECIPE_AUTOCOMPLETE_MAX_LIMIT', 50),
+    )
@@ -0,0 +1,149 @@
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+from django.utils.translation import gettext_lazy as _
+
+from rest_framework import exceptions
+
+from core.models import Tag, Ingredient, Recipe
+
+from recipe import cache
+from recipe import search
+
+
+# Creating objects one by one costs 1 INSERT (and 1 transaction) per object,
+# plus 1 more per tag/ingredient link.
+# 'bulk_create' sends them in a few big INSERTs instead.
+# NOTE: 'bulk_create' and 'bulk_update' don't send the model signals,
+# so everything the signals would do (e.g. invalidating the cached lists) is done here.
+
+def get_max_batch_size():
+    """ Return the maximum number of items accepted by a bulk request """
+    return getattr(settings, 'RECIPE_BULK_MAX_BATCH_SIZE', 1000)
+
+
+def check_batch(data):
+    """ Check a bulk request payload is a list of at most the max batch size """
+    if not isinstance(data, list):
+        raise exceptions.ValidationError(
+            {'non_field_errors': [_('Expected a list of items.')]}
+        )
+    max_batch_size = get_max_batch_size()
+    if len(data) > max_batch_size:
+        raise exceptions.ValidationError({'non_field_errors': [
+            _('A bulk request can contain at most %(max)d items.')
+            % {'max': max_batch_size}
+        ]})
+
+
+def _parse_ids(model, values):
+    """ Return the valid primary keys among the values sent by the client """
+    ids = set()
+    for value in values:
+        if isinstance(value, bool):
+            continue
+        try:
+            ids.add(model._meta.pk.to_python(value))
+        except (ValidationError, TypeError, ValueError):
+            # the serializer reports the invalid ones.
+            pass
+    return ids
+
+
+def preload_links(user, data):
+    """ Load the tags and ingredients referenced by a bulk recipe payload
+
+    Returns {model: {id: object}} with 1 query per model for the whole batch,
+    only the user's own objects are found.
+    """
+    preloaded = {}
+    for field_name, model in (('tags', Tag), ('ingredients', Ingredient)):
+        values = []
+        for item in data:
+            if isinstance(item, dict) and isinstance(item.get(field_name), list):
+                values.extend(item[field_name])
+        ids = _parse_ids(model, values)
+        preloaded[model] = (
+            model.objects.filter(user=user, id__in=ids).in_bulk() if ids else {}
+        )
+    return preloaded
+
+
+def _insert(model, objs):
+    """ Insert objects in bulk, making sure they get their IDs """
+    if connection.features.can_return_rows_from_bulk_insert:
+        return model.objects.bulk_create(objs, batch_size=500)
+    # databases that can't return the new IDs from a bulk insert
+    # (SQLite before Django 4.0) need 1 insert per object.
+    for obj in objs:
+        obj.save()
+    return objs
+
+
+def _set_links(field_name, links):
+    """ Replace the linked objects of recipes: {recipe_id: [related ids]} """
+    through = getattr(Recipe, field_name).through
+    related_column = f'{Recipe._meta.get_field(field_name).m2m_reverse_field_name()}_id'
+    through.objects.filter(recipe_id__in=list(links)).delete()
+    through.objects.bulk_create(
+        [
+            through(**{'recipe_id': recipe_id, related_column: related_id})
+            for recipe_id, related_ids in links.items()
+            # a set, so an ID sent twice doesn't break the unique constraint.
+            for related_id in set(related_ids)
+        ],
+        batch_size=1000
+    )
+
+
+def create_attrs(model, user, items):
+    """ Create tags or ingredients for a user from validated data """
+    with transaction.atomic():
+        objs = _insert(model, [model(user=user, **item) for item in items])
+    cache.bump_user_version(user.id)
+    return objs
+
+
+def create_recipes(user, items):
+    """ Create recipes and their tag/ingredient links from validated data """
+    with transaction.atomic():
+        recipes = _insert(Recipe, [
+            Recipe(user=user, **{
+                key: value for key, value in item.items()
+                if key not in ('tags', 'ingredients')
+            })
+            for item in items
+        ])
+        for field_name in ('tags', 'ingredients'):
+            _set_links(field_name, {
+                recipe.id: [obj.id for obj in item.get(field_name, [])]
+                for recipe, item in zip(recipes, items)
+            })
+        search.update_search_vectors([recipe.id for recipe in recipes])
+    cache.bump_user_version(user.id)
+    return recipes
+
+
+def update_recipes(user, updates):
+    """ Partially update recipes: [(recipe, validated data), ...] """
+    fields = set()
+    links = {'tags': {}, 'ingredients': {}}
+    for recipe, data in updates:
+        for key, value in data.items():
+            if key in links:
+                links[key][recipe.id] = [obj.id for obj in value]
+            else:
+                setattr(recipe, key, value)
+                fields.add(key)
+
+    with transaction.atomic():
+        if fields:
+            Recipe.objects.bulk_update(
+                [recipe for recipe, data in updates], sorted(fields), batch_size=500
+            )
+        for field_name, field_links in links.items():
+            if field_links:
+                _set_links(field_name, field_links)
+        search.update_search_vectors([recipe.id for recipe, data in updates])
+    cache.bump_user_version(user.id)
+    return [recipe for recipe, data in updates]
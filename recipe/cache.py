@@ -0,0 +1,96 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.http import urlencode
+
+from core import metrics
+
+
+# Instead of deleting every cached list of a user when one of their tags changes
+# (we don't know all the query params that were cached), each user has a version number
+# which is part of every cache key.
+# Bumping the version makes all the old keys unreachable at once and they simply expire.
+
+def _get_cache():
+    return caches[getattr(settings, 'RECIPE_ATTR_CACHE_ALIAS', 'default')]
+
+
+def _version_key(user_id):
+    return f'recipe-attr-version:{user_id}'
+
+
+def _new_version():
+    # start from the current time instead of 1 so that if the version key gets evicted,
+    # the new version can't collide with old keys that are still in the cache.
+    return time.time_ns()
+
+
+def get_user_version(user_id):
+    """ Return the current cache version for the user's recipe attributes """
+    cache = _get_cache()
+    key = _version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        # 'add' only sets the key if it doesn't exist, so 2 requests racing here agree on 1 version.
+        cache.add(key, _new_version(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_user_version(user_id):
+    """ Invalidate every cached recipe attribute list of the user """
+    if user_id is None:
+        return
+    cache = _get_cache()
+    key = _version_key(user_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # the key doesn't exist (yet or anymore)
+        cache.set(key, _new_version(), timeout=None)
+
+
+def list_cache_key(user_id, endpoint, query_params):
+    """ Return the cache key for a user's list response """
+    params = urlencode(sorted(query_params.lists()), doseq=True)
+    digest = hashlib.md5(params.encode()).hexdigest()
+    version = get_user_version(user_id)
+    return f'recipe-attr-list:{user_id}:{endpoint}:{version}:{digest}'
+
+
+def etag_for(cache_key):
+    """ Return the ETag of the response stored under a cache key """
+    # the cache key already changes whenever the data changes (the version is in it),
+    # so we don't need to hash the response body.
+    return '"%s"' % hashlib.md5(cache_key.encode()).hexdigest()
+
+
+def etag_matches(etag, if_none_match):
+    """ Check an ETag against the value of an 'If-None-Match' header """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        # weak comparison: 'W/"abc"' matches '"abc"'
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+def get_list(cache_key):
+    """ Return a cached list response or None """
+    value = _get_cache().get(cache_key)
+    metrics.record_cache('recipe_attr_list', value is not None)
+    return value
+
+
+def set_list(cache_key, value):
+    """ Store a list response in the cache """
+    timeout = getattr(settings, 'RECIPE_ATTR_CACHE_TIMEOUT', 300)
+    _get_cache().set(cache_key, value, timeout=timeout)
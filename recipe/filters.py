@@ -0,0 +1,107 @@
+from django.db.models import Exists, OuterRef
+
+from rest_framework import serializers
+
+
+MATCH_ANY = 'any'
+MATCH_ALL = 'all'
+MATCH_MODES = (MATCH_ANY, MATCH_ALL)
+
+# the '?ordering=' values and the ordering they give.
+# 'id' breaks the ties in the same direction as the main field so the database can
+# read the rows straight from the (user, field, id) index, forwards or backwards.
+RECIPE_ORDERINGS = {
+    'price': ('price', 'id'),
+    '-price': ('-price', '-id'),
+    'time_minutes': ('time_minutes', 'id'),
+    '-time_minutes': ('-time_minutes', '-id'),
+}
+
+
+# Filtering with a join ('tags__id__in=[...]') returns 1 row per matching link, so a recipe
+# with 2 of the requested tags comes back twice, and filtering on tags and ingredients
+# multiplies the rows of both joins.
+# 'EXISTS (SELECT 1 FROM core_recipe_tags WHERE recipe_id = core_recipe.id AND ...)' asks
+# "is there at least 1 link?" instead: each recipe is checked once with an index lookup
+# and is returned at most once, so we don't need an expensive 'DISTINCT' either.
+def filter_by_related(queryset, field_name, ids, mode=MATCH_ANY):
+    """ Filter a queryset by the IDs linked through a many to many field
+
+    'any' keeps the objects linked to at least 1 of the IDs,
+    'all' keeps the objects linked to every one of them.
+    """
+    field = queryset.model._meta.get_field(field_name)
+    through = field.remote_field.through
+    links = through.objects.filter(
+        **{f'{field.m2m_field_name()}_id': OuterRef('pk')}
+    )
+    related_column = f'{field.m2m_reverse_field_name()}_id'
+
+    if mode == MATCH_ALL:
+        # 1 EXISTS per ID, each of them is a single lookup in the unique
+        # (recipe_id, tag_id) index of the through table.
+        for related_id in set(ids):
+            queryset = queryset.filter(
+                Exists(links.filter(**{related_column: related_id}))
+            )
+        return queryset
+
+    return queryset.filter(
+        Exists(links.filter(**{f'{related_column}__in': ids}))
+    )
+
+
+class IdListField(serializers.Field):
+    """ A comma separated list of IDs in a query param (e.g. '?tags=1,2') """
+    default_error_messages = {
+        'invalid': 'Must be a comma separated list of integers.',
+    }
+
+    def to_internal_value(self, data):
+        try:
+            ids = [int(str_id) for str_id in str(data).split(',')]
+        except ValueError:
+            self.fail('invalid')
+        if any(pk < 1 for pk in ids):
+            self.fail('invalid')
+        return ids
+
+
+# The query params are strings typed by the client, so converting them by hand with
+# 'int()' raises a 'ValueError' (a '500 Internal Server Error') on '?tags=abc'.
+# a serializer validates all of them at once and returns a '400 Bad Request'
+# with an error for each invalid param instead.
+class RecipeFilterSerializer(serializers.Serializer):
+    """ Validate the query params used to filter and order the recipes """
+    tags = IdListField(required=False)
+    ingredients = IdListField(required=False)
+    tags_mode = serializers.ChoiceField(MATCH_MODES, default=MATCH_ANY)
+    ingredients_mode = serializers.ChoiceField(MATCH_MODES, default=MATCH_ANY)
+    price_min = serializers.DecimalField(
+        max_digits=10, decimal_places=2, min_value=0, required=False
+    )
+    price_max = serializers.DecimalField(
+        max_digits=10, decimal_places=2, min_value=0, required=False
+    )
+    time_max = serializers.IntegerField(min_value=0, required=False)
+    ordering = serializers.ChoiceField(list(RECIPE_ORDERINGS), required=False)
+
+    def validate(self, attrs):
+        price_min = attrs.get('price_min')
+        price_max = attrs.get('price_max')
+        if price_min is not None and price_max is not None and price_min > price_max:
+            raise serializers.ValidationError(
+                {'price_max': 'Must be greater than or equal to price_min.'}
+            )
+        return attrs
+
+
+def filter_by_ranges(queryset, params):
+    """ Filter recipes by the validated price and time ranges """
+    if params.get('price_min') is not None:
+        queryset = queryset.filter(price__gte=params['price_min'])
+    if params.get('price_max') is not None:
+        queryset = queryset.filter(price__lte=params['price_max'])
+    if params.get('time_max') is not None:
+        queryset = queryset.filter(time_minutes__lte=params['time_max'])
+    return queryset
@@ -0,0 +1,148 @@
+import io
+import logging
+import os
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections, transaction
+
+from core.models import Recipe
+
+
+logger = logging.getLogger(__name__)
+
+# name -> (maximum width and height, format)
+# the images keep their aspect ratio and are never scaled up.
+DEFAULT_IMAGE_VARIANTS = {
+    'thumbnail': ((200, 200), 'JPEG'),
+    'medium': ((800, 800), 'JPEG'),
+    'webp': ((800, 800), 'WEBP'),
+}
+
+EXTENSIONS = {'JPEG': 'jpg', 'WEBP': 'webp', 'PNG': 'png'}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_variant_specs():
+    """ Return the configured image variants """
+    return getattr(settings, 'RECIPE_IMAGE_VARIANTS', DEFAULT_IMAGE_VARIANTS)
+
+
+def _can_encode(image_format):
+    # e.g. WebP is only available when Pillow was built with libwebp.
+    Image.init()
+    return image_format in Image.SAVE
+
+
+def _variant_path(image_name, variant, image_format):
+    base, _ = os.path.splitext(image_name)
+    return f'{base}_{variant}.{EXTENSIONS.get(image_format, image_format.lower())}'
+
+
+def _encode(image, size, image_format):
+    """ Return the bytes of a resized copy of an image """
+    variant = image.copy()
+    # 'thumbnail' resizes in place, keeps the aspect ratio and never makes the image bigger.
+    variant.thumbnail(size)
+    if image_format == 'JPEG' and variant.mode not in ('RGB', 'L'):
+        variant = variant.convert('RGB')
+    buffer = io.BytesIO()
+    variant.save(buffer, format=image_format, quality=85, optimize=True)
+    return buffer.getvalue()
+
+
+def generate_variants(recipe_id, image_name, storage=default_storage):
+    """ Create the resized variants of a recipe image and record them
+
+    Returns the mapping of variant name to file path.
+    """
+    specs = {
+        name: spec for name, spec in get_variant_specs().items()
+        if _can_encode(spec[1])
+    }
+    if not specs:
+        return {}
+
+    with storage.open(image_name, 'rb') as image_file:
+        image = Image.open(image_file)
+        # for JPEGs 'draft' lets the decoder skip straight to a smaller scale
+        # (1/2, 1/4, 1/8) which is a lot faster than decoding the full image.
+        largest = max(max(size) for size, _ in specs.values())
+        image.draft('RGB', (largest, largest))
+        image.load()
+
+    variants = {}
+    for name, (size, image_format) in specs.items():
+        path = _variant_path(image_name, name, image_format)
+        variants[name] = storage.save(
+            path, ContentFile(_encode(image, size, image_format))
+        )
+
+    # only record the variants if the recipe still has the same image,
+    # if the image was replaced while we were working, these files are stale.
+    updated = Recipe.objects.filter(pk=recipe_id, image=image_name).update(
+        image_variants=variants
+    )
+    if not updated:
+        delete_variant_files(variants, storage=storage)
+        return {}
+
+    return variants
+
+
+def delete_variant_files(variants, storage=default_storage):
+    """ Delete the files of previously generated variants """
+    for path in variants.values():
+        storage.delete(path)
+
+
+def _run_task(recipe_id, image_name, old_variants):
+    try:
+        delete_variant_files(old_variants)
+        generate_variants(recipe_id, image_name)
+    except Exception:
+        logger.exception('Generating variants of %s failed', image_name)
+    finally:
+        # the worker threads aren't request threads, so Django never closes their
+        # database connections for us.
+        connections.close_all()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'RECIPE_IMAGE_WORKERS', 2),
+                thread_name_prefix='recipe-image'
+            )
+        return _executor
+
+
+def schedule_variants(recipe, old_variants=None):
+    """ Generate the recipe image variants in the background """
+    image_name = recipe.image.name
+    old_variants = dict(old_variants or {})
+    # wait until the upload is committed, otherwise the worker may not see the new image yet.
+    transaction.on_commit(
+        lambda: _get_executor().submit(
+            _run_task, recipe.id, image_name, old_variants
+        )
+    )
+
+
+def wait_for_tasks():
+    """ Wait until every scheduled variant is generated """
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=True)
@@ -0,0 +1,176 @@
+import json
+
+from base64 import b64decode, b64encode
+from urllib import parse
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import Cursor, CursorPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+# Cursor (keyset) pagination: instead of "skip the first N rows" (OFFSET), the cursor
+# remembers the last value it returned and asks the database for rows "after" it
+# (WHERE id < last_id ORDER BY -id LIMIT page_size), which uses the index and costs
+# the same on page 1 and page 1000.
+# It also means that rows inserted while a client is paging don't shift the pages.
+#
+# DRF's 'CursorPagination' only keeps the value of the first ordering field in the
+# cursor and skips the rows that have the same value with an OFFSET, capped at 1000:
+# with more than 1000 recipes at the same price, the pages repeat forever. our cursor
+# keeps the value of every ordering field instead (e.g. price and id) and asks for
+#     WHERE price > last_price OR (price = last_price AND id > last_id)
+# so the last field ('id') must be unique, and the ties cost nothing.
+class KeysetCursorPagination(CursorPagination):
+    """ Cursor pagination on all of the ordering fields, without offsets """
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        assert self.ordering[-1].lstrip('-') in ('id', 'pk'), (
+            'The keyset pagination needs an ordering ending with the unique "id".'
+        )
+
+        self.cursor = self.decode_cursor(request)
+        reverse, position = (
+            (self.cursor.reverse, self.cursor.position) if self.cursor else (False, None)
+        )
+        if reverse:
+            # the previous page: read backwards from the first row of the current page.
+            queryset = queryset.order_by(*(
+                order[1:] if order.startswith('-') else '-' + order
+                for order in self.ordering
+            ))
+        else:
+            queryset = queryset.order_by(*self.ordering)
+        if position is not None:
+            try:
+                queryset = queryset.filter(self._after(position, reverse))
+            except (TypeError, ValueError, ValidationError):
+                raise NotFound(self.invalid_cursor_message)
+
+        # 1 more row tells us if there's a following page.
+        results = list(queryset[:self.page_size + 1])
+        self.page = results[:self.page_size]
+        has_following = len(results) > len(self.page)
+        if reverse:
+            self.page.reverse()
+            self.has_next = position is not None
+            self.has_previous = has_following
+        else:
+            self.has_next = has_following
+            self.has_previous = position is not None
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+        return self.page
+
+    def _after(self, position, reverse):
+        """ Return the filter of the rows after 'position' in the ordering """
+        after = Q()
+        equal = Q()
+        for order, value in zip(self.ordering, position):
+            name = order.lstrip('-')
+            lookup = 'lt' if order.startswith('-') != reverse else 'gt'
+            after |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+        return after
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        if self.page:
+            position = self._get_position_from_instance(self.page[-1], self.ordering)
+        else:
+            position = self.cursor.position
+        return self.encode_cursor(Cursor(offset=0, reverse=False, position=position))
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if self.page:
+            position = self._get_position_from_instance(self.page[0], self.ordering)
+        else:
+            position = self.cursor.position
+        return self.encode_cursor(Cursor(offset=0, reverse=True, position=position))
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            querystring = b64decode(encoded.encode('ascii')).decode('ascii')
+            tokens = parse.parse_qs(querystring, keep_blank_values=True)
+            reverse = bool(int(tokens.get('r', ['0'])[0]))
+            position = json.loads(tokens['p'][0])
+        except (TypeError, ValueError, KeyError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list) or len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return Cursor(offset=0, reverse=reverse, position=position)
+
+    def encode_cursor(self, cursor):
+        tokens = {'p': json.dumps(cursor.position, cls=DjangoJSONEncoder)}
+        if cursor.reverse:
+            tokens['r'] = '1'
+        querystring = parse.urlencode(tokens)
+        encoded = b64encode(querystring.encode('ascii')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def _get_position_from_instance(self, instance, ordering):
+        # the values as they are (not 'str()'), a float must come back exactly the same.
+        return [getattr(instance, order.lstrip('-')) for order in ordering]
+
+
+class LinkHeaderCursorPagination(KeysetCursorPagination):
+    """ Cursor pagination that returns the page as a plain list
+
+    The next/previous page URLs are sent in the 'Link' header (RFC 8288)
+    so the response body keeps the same shape as the unpaginated API.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    max_page_size = getattr(settings, 'API_MAX_PAGE_SIZE', 1000)
+
+    # a view can change the ordering for a request (e.g. by search rank) by
+    # defining 'get_pagination_ordering', otherwise the class 'ordering' is used.
+    def get_ordering(self, request, queryset, view):
+        get_view_ordering = getattr(view, 'get_pagination_ordering', None)
+        if get_view_ordering is not None:
+            ordering = get_view_ordering()
+            if ordering:
+                return ordering
+        return super().get_ordering(request, queryset, view)
+
+    def get_paginated_response(self, data):
+        links = []
+        next_link = self.get_next_link()
+        previous_link = self.get_previous_link()
+        if next_link:
+            links.append(f'<{next_link}>; rel="next"')
+        if previous_link:
+            links.append(f'<{previous_link}>; rel="prev"')
+
+        headers = {'Link': ', '.join(links)} if links else None
+        return Response(data, headers=headers)
+
+
+class RecipeCursorPagination(LinkHeaderCursorPagination):
+    """ Paginate recipes newest first """
+    # 'id' is unique and always increasing, so it's a stable cursor.
+    ordering = ('-id',)
+
+
+class RecipeAttrCursorPagination(LinkHeaderCursorPagination):
+    """ Paginate tags and ingredients by name """
+    # names aren't unique so 'id' breaks the ties between equal names.
+    ordering = ('-name', '-id')
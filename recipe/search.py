@@ -0,0 +1,86 @@
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connection
+from django.db.models import Exists, F, FloatField, OuterRef, Q
+from django.db.models.functions import Cast
+
+from core.models import Recipe
+
+
+# On PostgreSQL every recipe keeps a precomputed 'search_vector' (a "tsvector": the
+# normalized words of its title, tag names and ingredient names) with a GIN index on it,
+# so a search is an index lookup instead of scanning every title with 'LIKE'.
+# the vector can't be computed with the ORM (it needs the names of the linked tags and
+# ingredients), so it's refreshed with 1 UPDATE for any number of recipes.
+# the title words weigh more ('A') than the tag and ingredient names ('B') in the ranking.
+
+UPDATE_SEARCH_VECTORS_SQL = """
+    UPDATE core_recipe AS r SET search_vector =
+        setweight(to_tsvector(%(config)s::regconfig, coalesce(r.title, '')), 'A')
+        || setweight(to_tsvector(%(config)s::regconfig, coalesce((
+            SELECT string_agg(t.name, ' ')
+            FROM core_tag t JOIN core_recipe_tags rt ON rt.tag_id = t.id
+            WHERE rt.recipe_id = r.id
+        ), '')), 'B')
+        || setweight(to_tsvector(%(config)s::regconfig, coalesce((
+            SELECT string_agg(i.name, ' ')
+            FROM core_ingredient i JOIN core_recipe_ingredients ri ON ri.ingredient_id = i.id
+            WHERE ri.recipe_id = r.id
+        ), '')), 'B')
+"""
+
+
+def get_search_config():
+    """ Return the PostgreSQL text search configuration (language) """
+    return getattr(settings, 'RECIPE_SEARCH_CONFIG', 'english')
+
+
+def is_full_text_supported():
+    """ Check if the database supports the full text search """
+    return connection.vendor == 'postgresql'
+
+
+def update_search_vectors(recipe_ids=None):
+    """ Refresh the search vectors of some recipes (all of them if None) """
+    if not is_full_text_supported():
+        return
+    params = {'config': get_search_config()}
+    sql = UPDATE_SEARCH_VECTORS_SQL
+    if recipe_ids is not None:
+        recipe_ids = list(recipe_ids)
+        if not recipe_ids:
+            return
+        sql += ' WHERE r.id = ANY(%(ids)s)'
+        params['ids'] = recipe_ids
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+
+
+def search_recipes(queryset, term):
+    """ Filter recipes matching a search term
+
+    Returns the queryset and whether it's annotated with a 'search_rank'.
+    """
+    if is_full_text_supported():
+        query = SearchQuery(term, config=get_search_config())
+        # 'ts_rank' is a 'real', which doesn't convert exactly to and from a Python float:
+        # the cursor pagination would compare the rank of the last recipe of a page with
+        # a slightly different number and serve that recipe again. as a 'double' it's exact.
+        queryset = queryset.filter(search_vector=query).annotate(
+            search_rank=Cast(SearchRank(F('search_vector'), query), FloatField())
+        )
+        return queryset, True
+
+    # the fallback for other databases (e.g. SQLite for local tests): every word
+    # must be in the title or in the name of a linked tag or ingredient.
+    for word in term.split():
+        queryset = queryset.filter(
+            Q(title__icontains=word)
+            | Q(Exists(Recipe.tags.through.objects.filter(
+                recipe_id=OuterRef('pk'), tag__name__icontains=word
+            )))
+            | Q(Exists(Recipe.ingredients.through.objects.filter(
+                recipe_id=OuterRef('pk'), ingredient__name__icontains=word
+            )))
+        )
+    return queryset, False
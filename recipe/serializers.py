@@ -1,3 +1,7 @@
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.files.storage import default_storage
+from django.utils.translation import gettext_lazy as _
+
 from rest_framework import serializers
 
 from core.models import Tag, Ingredient, Recipe
@@ -21,20 +25,93 @@ class IngredientSerializer(serializers.ModelSerializer):
         read_only_fields = ('id',)
 
 
-class RecipeSerializer(serializers.ModelSerializer):
+def _split_names(value):
+    names = [name.strip() for name in (value or '').split(',') if name.strip()]
+    return names or None
+
+
+# Sparse fieldsets: '?fields=id,title' only returns those fields and '?expand=tags'
+# nests the full tag objects instead of their IDs, so a client gets exactly what it
+# needs in 1 request. the view also uses them to skip the prefetches and the columns
+# that no field needs (see 'RecipeViewSet.get_queryset').
+class SparseFieldsMixin:
+    """ A serializer whose fields can be pruned ('fields') and expanded ('expand') """
+    # {field name: serializer of the nested objects when the field is expanded}
+    expandable_fields = {}
+
+    def __init__(self, *args, fields=None, expand=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        for name in expand:
+            self.fields[name] = self.expandable_fields[name](many=True, read_only=True)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+    @classmethod
+    def parse_fieldset(cls, query_params):
+        """ Return the (fields or None, expand) of the '?fields=&expand=' params """
+        fields = _split_names(query_params.get('fields'))
+        expand = _split_names(query_params.get('expand')) or ()
+        errors = {}
+        if fields is not None:
+            unknown = sorted(set(fields) - set(cls.Meta.fields))
+            if unknown:
+                errors['fields'] = [
+                    _('Unknown fields: %(names)s.') % {'names': ', '.join(unknown)}
+                ]
+        unknown = sorted(set(expand) - set(cls.expandable_fields))
+        if unknown:
+            errors['expand'] = [
+                _('Fields that can\'t be expanded: %(names)s.') % {'names': ', '.join(unknown)}
+            ]
+        if errors:
+            raise serializers.ValidationError(errors)
+        return fields, tuple(expand)
+
+
+# 'PrimaryKeyRelatedField' runs 1 query per ID to check the object exists, which adds up
+# in a bulk request (10 recipes with 3 tags and 3 ingredients each are 60 queries).
+# the bulk view loads all the objects of the batch at once (see 'recipe/bulk.py') and
+# passes them in the context as {model: {id: object}}, this field looks the IDs up there.
+class PreloadedPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """ A primary key field using the objects preloaded in the context if any """
+
+    def to_internal_value(self, data):
+        preloaded = self.context.get('preloaded_objects')
+        if preloaded is None:
+            return super().to_internal_value(data)
+        model = self.get_queryset().model
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            pk = model._meta.pk.to_python(data)
+        except (DjangoValidationError, TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        obj = preloaded.get(model, {}).get(pk)
+        if obj is None:
+            self.fail('does_not_exist', pk_value=data)
+        return obj
+
+
+class RecipeSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """ Serialize a Recipe """
     # "ManyToManyField" needs "PrimaryKeyRelatedField" in Serializer
     # Created a "PrimaryKeyRelatedField" and it allows "many" and "queryset"
     # It simply lists the objects "Ingredient" with their "primary key" id.
-    ingredients = serializers.PrimaryKeyRelatedField(
+    ingredients = PreloadedPrimaryKeyRelatedField(
         many=True,
         queryset=Ingredient.objects.all()
     )
-    tags = serializers.PrimaryKeyRelatedField(
+    tags = PreloadedPrimaryKeyRelatedField(
         many=True,
         queryset=Tag.objects.all()
     )
 
+    expandable_fields = {
+        'ingredients': IngredientSerializer,
+        'tags': TagSerializer,
+    }
+
     class Meta:
         model = Recipe
         fields = (
@@ -44,16 +121,36 @@ class RecipeSerializer(serializers.ModelSerializer):
         read_only_fields = ('id',)
 
 
+class ImageVariantsField(serializers.ReadOnlyField):
+    """ Return the URLs of the generated image variants """
+
+    def to_representation(self, value):
+        request = self.context.get('request')
+        urls = {}
+        for name, path in (value or {}).items():
+            url = default_storage.url(path)
+            # match the 'image' field which returns absolute URLs when there's a request.
+            urls[name] = request.build_absolute_uri(url) if request else url
+        return urls
+
+
 class RecipeDetailSerializer(RecipeSerializer):
     """ Serialize a recipe detail """
     ingredients = IngredientSerializer(many=True, read_only=True)
     tags = TagSerializer(many=True, read_only=True)
+    image = serializers.FileField(read_only=True)
+    image_variants = ImageVariantsField()
+
+    class Meta(RecipeSerializer.Meta):
+        fields = RecipeSerializer.Meta.fields + ('image', 'image_variants')
 
 
 class RecipeImageSerializer(serializers.ModelSerializer):
     """ Serializer for uploading images to recipe """
-    
+    # the variants are generated in the background, so right after an upload it's empty.
+    image_variants = ImageVariantsField()
+
     class Meta:
         model = Recipe
-        fields = ('id', 'image')
+        fields = ('id', 'image', 'image_variants')
         read_only_fields = ('id',)
@@ -0,0 +1,123 @@
+import functools
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import (
+    post_save, pre_delete, post_delete, m2m_changed
+)
+from django.dispatch import receiver
+
+from core.models import Tag, Ingredient, Recipe
+
+from recipe import cache
+from recipe import search
+
+
+# Signals are Django's way of letting us run code whenever sth. happens to a model
+# (saved, deleted, M2M links added/removed) no matter where in the code it happened.
+# we use them to invalidate the cached tag/ingredient lists of the owner.
+# the signals are sent inside the transaction of the change: a request of another thread
+# could still read the old rows and cache them under the new version until the commit,
+# so the version is bumped (and the search vectors refreshed) once it's committed.
+
+
+def _bump_on_commit(user_id):
+    transaction.on_commit(functools.partial(cache.bump_user_version, user_id))
+
+
+def _update_search_vectors_on_commit(recipe_ids):
+    transaction.on_commit(functools.partial(search.update_search_vectors, recipe_ids))
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def invalidate_attr_lists(sender, instance, **kwargs):
+    """ Invalidate the owner's cached lists when a tag/ingredient changes """
+    _bump_on_commit(instance.user_id)
+
+
+# the 'assigned_only' lists depend on which tags/ingredients are linked to recipes.
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def invalidate_attr_lists_on_link(sender, instance, action, **kwargs):
+    """ Invalidate the owner's cached lists when recipe links change """
+    # 'instance' is the recipe, or the tag/ingredient when the relation is changed
+    # from the reverse side, all of them have a 'user_id'.
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        _bump_on_commit(instance.user_id)
+
+
+# deleting a recipe also deletes its links (without sending 'm2m_changed').
+@receiver(post_delete, sender=Recipe)
+def invalidate_attr_lists_on_recipe_delete(sender, instance, **kwargs):
+    """ Invalidate the owner's cached lists when a recipe is deleted """
+    _bump_on_commit(instance.user_id)
+
+
+# a new user can get the ID of a deleted one, so make sure they never see old cached lists.
+# nobody can have cached lists of the new user yet, so this one is bumped right away
+# (the ID can also be reused when the transaction is rolled back, e.g. in the tests).
+@receiver(post_save, sender=get_user_model())
+def invalidate_attr_lists_on_new_user(sender, instance, created, **kwargs):
+    """ Start a fresh cache version for new users """
+    if created:
+        cache.bump_user_version(instance.id)
+
+
+# the search vector of a recipe contains its title and the names of its tags and ingredients,
+# so it must be refreshed whenever any of those change.
+@receiver(post_save, sender=Recipe)
+def update_recipe_search_vector(sender, instance, **kwargs):
+    """ Refresh the search vector of a saved recipe """
+    _update_search_vectors_on_commit([instance.id])
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def update_search_vectors_on_link(sender, instance, action, reverse, pk_set, **kwargs):
+    """ Refresh the search vectors of recipes whose links changed """
+    if not reverse:
+        # 'instance' is the recipe.
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            _update_search_vectors_on_commit([instance.id])
+        return
+
+    # 'instance' is a tag/ingredient and 'pk_set' are recipe IDs.
+    if action == 'pre_clear' and search.is_full_text_supported():
+        # after the clear we can't tell which recipes were linked anymore.
+        instance._search_recipe_ids = list(
+            instance.recipe_set.values_list('id', flat=True)
+        )
+    elif action == 'post_clear':
+        _update_search_vectors_on_commit(getattr(instance, '_search_recipe_ids', []))
+    elif action in ('post_add', 'post_remove'):
+        # a copy, the set belongs to the caller.
+        _update_search_vectors_on_commit(set(pk_set))
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+def update_search_vectors_on_rename(sender, instance, created, **kwargs):
+    """ Refresh the search vectors of the recipes using a tag/ingredient """
+    if not created:
+        # the queryset is lazy: it's only run after the commit (if the search is supported).
+        _update_search_vectors_on_commit(instance.recipe_set.values_list('id', flat=True))
+
+
+@receiver(pre_delete, sender=Tag)
+@receiver(pre_delete, sender=Ingredient)
+def collect_recipes_before_delete(sender, instance, **kwargs):
+    """ Remember the recipes of a tag/ingredient that is being deleted """
+    if search.is_full_text_supported():
+        instance._search_recipe_ids = list(
+            instance.recipe_set.values_list('id', flat=True)
+        )
+
+
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+def update_search_vectors_on_delete(sender, instance, **kwargs):
+    """ Refresh the search vectors of the recipes of a deleted tag/ingredient """
+    _update_search_vectors_on_commit(getattr(instance, '_search_recipe_ids', []))
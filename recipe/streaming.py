@@ -0,0 +1,34 @@
+from rest_framework.utils.encoders import JSONEncoder
+
+
+def iter_chunks(queryset, chunk_size):
+    """ Yield lists of objects from an '-id' ordered queryset, chunk by chunk """
+    # 'queryset.iterator(chunk_size=...)' would stream the rows but in Django 3.2 it
+    # silently drops 'prefetch_related', so every recipe would query its tags and ingredients again.
+    # Instead we fetch one chunk at a time with the same keyset trick as the cursor pagination
+    # (WHERE id < last_id LIMIT chunk_size) so each chunk keeps its prefetches and
+    # we never hold more than 1 chunk in memory.
+    last_id = None
+    while True:
+        chunk_queryset = queryset
+        if last_id is not None:
+            chunk_queryset = chunk_queryset.filter(id__lt=last_id)
+        chunk = list(chunk_queryset[:chunk_size])
+        if not chunk:
+            return
+
+        yield chunk
+
+        if len(chunk) < chunk_size:
+            return
+        last_id = chunk[-1].id
+
+
+def iter_ndjson(queryset, serializer_class, chunk_size, context=None):
+    """ Serialize a queryset as newline delimited JSON (1 object per line) """
+    encoder = JSONEncoder()
+    for chunk in iter_chunks(queryset, chunk_size):
+        data = serializer_class(chunk, many=True, context=context).data
+        # join the chunk into a single write so we don't send thousands of tiny packets.
+        yield ''.join(encoder.encode(item) + '\n' for item in data).encode()
+
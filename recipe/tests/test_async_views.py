@@ -0,0 +1,135 @@
+import asyncio
+import json
+import threading
+
+from asgiref.sync import async_to_sync
+
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from core.asgi import StreamingASGIHandler
+from core.asyncviews import async_view
+from core.models import Recipe, Tag
+
+from recipe import urls, views
+
+
+EXPORT_URL = reverse('recipe:recipe-export')
+
+
+class AsyncReadViewTests(TransactionTestCase):
+    """ Test the async versions of the read endpoints """
+
+    def setUp(self):
+        self.factory = APIRequestFactory()
+        self.user = get_user_model().objects.create_user(
+            'test@joeshak.com',
+            'testpass'
+        )
+
+    def _call(self, view, request, **kwargs):
+        force_authenticate(request, user=self.user)
+        return async_to_sync(view)(request, **kwargs)
+
+    def test_list_runs_in_worker_thread(self):
+        """ Test the list is served from the async view pool """
+        recipe = Recipe.objects.create(
+            user=self.user, title='Toast', time_minutes=5, price=2.00
+        )
+        threads = []
+        sync_view = views.RecipeViewSet.as_view({'get': 'list'})
+
+        def view(request, *args, **kwargs):
+            threads.append(threading.current_thread().name)
+            return sync_view(request, *args, **kwargs)
+
+        wrapped = async_view(view)
+        res = self._call(wrapped, self.factory.get('/api/recipe/recipes/'))
+
+        self.assertTrue(asyncio.iscoroutinefunction(wrapped))
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['id'] for item in res.data], [recipe.id])
+        # the response is already rendered by the worker thread.
+        self.assertTrue(res.is_rendered)
+        self.assertTrue(threads[0].startswith('async-view'))
+
+    def test_writes_not_sent_to_pool(self):
+        """ Test the other methods are still handled by the sync view """
+        view = async_view(views.TagViewSet.as_view({'post': 'create'}))
+
+        res = self._call(
+            view, self.factory.post('/api/recipe/tags/', {'name': 'Vegan'})
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertTrue(Tag.objects.filter(user=self.user, name='Vegan').exists())
+
+
+class AsyncReadUrlTests(SimpleTestCase):
+    """ Test which routes are switched to async views """
+
+    def test_only_read_routes_async(self):
+        """ Test only the list/detail read routes are replaced """
+        replaced = urls.with_async_reads(urls.router.urls)
+
+        async_names = {
+            url.name for url in replaced
+            if asyncio.iscoroutinefunction(url.callback)
+        }
+        self.assertEqual(async_names, set(urls.ASYNC_READ_URL_NAMES))
+
+
+class ASGIExportTests(TransactionTestCase):
+    """ Test streaming the export under ASGI """
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'test@joeshak.com',
+            'testpass'
+        )
+        self.token = Token.objects.create(user=self.user)
+
+    def _get(self, handler, path):
+        """ Send a GET request to an ASGI handler, return (status, body) """
+        scope = {
+            'type': 'http',
+            'method': 'GET',
+            'path': path,
+            'query_string': b'',
+            'headers': [
+                (b'host', b'testserver'),
+                (b'authorization', f'Token {self.token.key}'.encode()),
+            ],
+        }
+        messages = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+        async def send(message):
+            messages.append(message)
+
+        async_to_sync(handler)(scope, receive, send)
+        body = b''.join(message.get('body', b'') for message in messages[1:])
+        return messages[0]['status'], body
+
+    @override_settings(RECIPE_EXPORT_CHUNK_SIZE=2)
+    def test_export_runs_queries_in_a_thread(self):
+        """ Test the export chunks are fetched outside of the event loop """
+        recipes = [
+            Recipe.objects.create(
+                user=self.user, title=f'Recipe {index}', time_minutes=5, price=2.00
+            )
+            for index in range(5)
+        ]
+
+        status_code, body = self._get(StreamingASGIHandler(), EXPORT_URL)
+
+        self.assertEqual(status_code, status.HTTP_200_OK)
+        ids = [json.loads(line)['id'] for line in body.decode().splitlines()]
+        self.assertEqual(ids, [recipe.id for recipe in reversed(recipes)])
@@ -0,0 +1,147 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Tag, Ingredient, Recipe
+
+from recipe.serializers import TagSerializer
+
+
+TAGS_URL = reverse('recipe:tag-list')
+INGREDIENTS_URL = reverse('recipe:ingredient-list')
+
+
+class RecipeAttrCacheTests(TestCase):
+    """ Test the cached tag and ingredient lists """
+
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user(
+            'test@joeshak.com',
+            'testpass'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_list_served_from_cache(self):
+        """ Test an unchanged list doesn't query the database again """
+        Tag.objects.create(user=self.user, name='Vegan')
+
+        res1 = self.client.get(TAGS_URL)
+        with self.assertNumQueries(0):
+            res2 = self.client.get(TAGS_URL)
+
+        self.assertEqual(res2.status_code, status.HTTP_200_OK)
+        self.assertEqual(res1.data, res2.data)
+
+    def test_create_tag_invalidates_cache(self):
+        """ Test that creating a tag returns a fresh list """
+        Tag.objects.create(user=self.user, name='Vegan')
+        self.client.get(TAGS_URL)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(TAGS_URL, {'name': 'Dessert'})
+        res = self.client.get(TAGS_URL)
+
+        tags = Tag.objects.filter(user=self.user).order_by('-name')
+        self.assertEqual(res.data, TagSerializer(tags, many=True).data)
+
+    def test_rename_and_delete_invalidate_cache(self):
+        """ Test updating or deleting an ingredient returns a fresh list """
+        ingredient = Ingredient.objects.create(user=self.user, name='Salt')
+        self.client.get(INGREDIENTS_URL)
+
+        ingredient.name = 'Sea salt'
+        with self.captureOnCommitCallbacks(execute=True):
+            ingredient.save()
+        res = self.client.get(INGREDIENTS_URL)
+        self.assertEqual(res.data[0]['name'], 'Sea salt')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ingredient.delete()
+        res = self.client.get(INGREDIENTS_URL)
+        self.assertEqual(res.data, [])
+
+    def test_recipe_links_invalidate_assigned_only(self):
+        """ Test linking and unlinking recipes refreshes assigned_only """
+        tag = Tag.objects.create(user=self.user, name='Breakfast')
+        recipe = Recipe.objects.create(
+            user=self.user,
+            title='Pancakes',
+            time_minutes=5,
+            price=3.00
+        )
+        res = self.client.get(TAGS_URL, {'assigned_only': 1})
+        self.assertEqual(res.data, [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.tags.add(tag)
+        res = self.client.get(TAGS_URL, {'assigned_only': 1})
+        self.assertEqual(len(res.data), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.delete()
+        res = self.client.get(TAGS_URL, {'assigned_only': 1})
+        self.assertEqual(res.data, [])
+
+    def test_invalidated_after_commit(self):
+        """ Test the list is only invalidated once the change is committed """
+        Tag.objects.create(user=self.user, name='Vegan')
+        self.client.get(TAGS_URL)
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            Tag.objects.create(user=self.user, name='Dessert')
+            # until the commit, other requests could still cache the old list
+            # under the current version.
+            res = self.client.get(TAGS_URL)
+            self.assertEqual(len(res.data), 1)
+
+        for callback in callbacks:
+            callback()
+        res = self.client.get(TAGS_URL)
+        self.assertEqual(len(res.data), 2)
+
+    def test_cache_limited_to_user(self):
+        """ Test a user never gets another user's cached list """
+        Tag.objects.create(user=self.user, name='Vegan')
+        self.client.get(TAGS_URL)
+
+        user2 = get_user_model().objects.create_user(
+            'other@joeshak.com',
+            'testpass'
+        )
+        client2 = APIClient()
+        client2.force_authenticate(user2)
+        res = client2.get(TAGS_URL)
+
+        self.assertEqual(res.data, [])
+
+    def test_etag_not_modified(self):
+        """ Test a matching If-None-Match returns 304 until the data changes """
+        Tag.objects.create(user=self.user, name='Vegan')
+        res = self.client.get(TAGS_URL)
+        etag = res['ETag']
+
+        res = self.client.get(TAGS_URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Tag.objects.create(user=self.user, name='Dessert')
+        res = self.client.get(TAGS_URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(res['ETag'], etag)
+
+    def test_query_params_cached_separately(self):
+        """ Test different query params don't share cache entries """
+        Tag.objects.create(user=self.user, name='Vegan')
+
+        res1 = self.client.get(TAGS_URL)
+        res2 = self.client.get(TAGS_URL, {'assigned_only': 1})
+
+        self.assertEqual(len(res1.data), 1)
+        self.assertEqual(res2.data, [])
+        self.assertNotEqual(res1['ETag'], res2['ETag'])
@@ -0,0 +1,92 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Tag, Ingredient
+
+
+TAGS_AUTOCOMPLETE_URL = reverse('recipe:tag-autocomplete')
+INGREDIENTS_AUTOCOMPLETE_URL = reverse('recipe:ingredient-autocomplete')
+
+
+class AutocompleteTests(TestCase):
+    """ Test the tag and ingredient autocomplete """
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@joeshak.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+
+    def _names(self, url, **params):
+        res = self.client.get(url, params)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return [item['name'] for item in res.data]
+
+    def test_prefix_matches_first(self):
+        """ Test names starting with the term come before other matches """
+        for name in ['Garlic', 'Ginger', 'Green beans', 'Aubergine', 'Salt']:
+            Ingredient.objects.create(user=self.user, name=name)
+
+        names = self._names(INGREDIENTS_AUTOCOMPLETE_URL, q='gi')
+
+        self.assertEqual(names[:1], ['Ginger'])
+        self.assertIn('Aubergine', names)
+        self.assertNotIn('Salt', names)
+
+    def test_fuzzy_match(self):
+        """ Test a misspelled term still finds similar names """
+        Ingredient.objects.create(user=self.user, name='Cinnamon')
+
+        self.assertEqual(
+            self._names(INGREDIENTS_AUTOCOMPLETE_URL, q='cinamon'),
+            ['Cinnamon']
+        )
+
+    def test_limit(self):
+        """ Test only the requested number of matches is returned """
+        for i in range(5):
+            Tag.objects.create(user=self.user, name=f'Vegan {i}')
+
+        self.assertEqual(len(self._names(TAGS_AUTOCOMPLETE_URL, q='veg', limit=3)), 3)
+
+        res = self.client.get(TAGS_AUTOCOMPLETE_URL, {'q': 'veg', 'limit': 'x'})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        res = self.client.get(TAGS_AUTOCOMPLETE_URL, {'q': 'veg', 'limit': 1000})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_new_names_found(self):
+        """ Test names created after a search are suggested """
+        Tag.objects.create(user=self.user, name='Vegan')
+        self.assertEqual(self._names(TAGS_AUTOCOMPLETE_URL, q='ve'), ['Vegan'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Tag.objects.create(user=self.user, name='Vegetarian')
+
+        self.assertEqual(
+            self._names(TAGS_AUTOCOMPLETE_URL, q='ve'),
+            ['Vegan', 'Vegetarian']
+        )
+
+    def test_limited_to_user(self):
+        """ Test only the user's names are suggested """
+        user2 = get_user_model().objects.create_user(
+            'other@joeshak.com',
+            'testpass'
+        )
+        Tag.objects.create(user=user2, name='Vegan')
+
+        self.assertEqual(self._names(TAGS_AUTOCOMPLETE_URL, q='ve'), [])
+
+    def test_empty_term(self):
+        """ Test an empty term returns no suggestions """
+        Tag.objects.create(user=self.user, name='Vegan')
+
+        self.assertEqual(self._names(TAGS_AUTOCOMPLETE_URL, q=''), [])
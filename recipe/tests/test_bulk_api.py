@@ -0,0 +1,219 @@
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Tag, Ingredient, Recipe
+
+
+TAGS_BULK_URL = reverse('recipe:tag-bulk')
+INGREDIENTS_BULK_URL = reverse('recipe:ingredient-bulk')
+RECIPES_BULK_URL = reverse('recipe:recipe-bulk')
+TAGS_URL = reverse('recipe:tag-list')
+
+
+def sample_recipe(user, **params):
+    """ Create and return a sample recipe """
+    defaults = {
+        'title': 'Sample Recipe',
+        'time_minutes': 10,
+        'price': 5.00
+    }
+    defaults.update(params)
+
+    return Recipe.objects.create(user=user, **defaults)
+
+
+class BulkApiTests(TestCase):
+    """ Test the bulk create and update endpoints """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@joeshak.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_bulk_create_tags(self):
+        """ Test creating several tags in 1 request """
+        payload = [{'name': 'Vegan'}, {'name': 'Dessert'}, {'name': 'Quick'}]
+
+        res = self.client.post(TAGS_BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual([item['name'] for item in res.data], ['Vegan', 'Dessert', 'Quick'])
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 3)
+        self.assertTrue(all(item['id'] for item in res.data))
+
+    def test_bulk_create_invalidates_cached_list(self):
+        """ Test bulk created tags show up in the cached list """
+        self.client.get(TAGS_URL)
+
+        self.client.post(TAGS_BULK_URL, [{'name': 'Vegan'}], format='json')
+        res = self.client.get(TAGS_URL)
+
+        self.assertEqual([item['name'] for item in res.data], ['Vegan'])
+
+    def test_bulk_create_errors_per_item(self):
+        """ Test invalid items are reported by position and nothing is saved """
+        payload = [{'name': 'Salt'}, {'name': ''}, {'name': 'Pepper'}]
+
+        res = self.client.post(INGREDIENTS_BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(len(res.data), 3)
+        self.assertEqual(res.data[0], {})
+        self.assertIn('name', res.data[1])
+        self.assertFalse(Ingredient.objects.exists())
+
+    def test_bulk_max_batch_size(self):
+        """ Test a batch larger than the maximum is rejected """
+        payload = [{'name': f'Tag {i}'} for i in range(3)]
+
+        with self.settings(RECIPE_BULK_MAX_BATCH_SIZE=2):
+            res = self.client.post(TAGS_BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Tag.objects.exists())
+
+    def test_bulk_requires_list(self):
+        """ Test the bulk endpoints only accept a list """
+        res = self.client.post(TAGS_BULK_URL, {'name': 'Vegan'}, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_bulk_create_recipes_with_links(self):
+        """ Test creating recipes with their tags and ingredients """
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        ingredient = Ingredient.objects.create(user=self.user, name='Tofu')
+        payload = [
+            {
+                'title': 'Tofu stir fry',
+                'time_minutes': 20,
+                'price': '7.50',
+                'tags': [tag.id],
+                'ingredients': [ingredient.id, ingredient.id],
+            },
+            {
+                'title': 'Plain rice',
+                'time_minutes': 15,
+                'price': '1.00',
+                'tags': [],
+                'ingredients': [],
+            },
+        ]
+
+        res = self.client.post(RECIPES_BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(res.data[0]['title'], 'Tofu stir fry')
+        self.assertEqual(res.data[0]['tags'], [tag.id])
+        self.assertEqual(res.data[0]['ingredients'], [ingredient.id])
+        recipe = Recipe.objects.get(id=res.data[0]['id'])
+        self.assertEqual(list(recipe.tags.all()), [tag])
+        self.assertEqual(Recipe.objects.filter(user=self.user).count(), 2)
+
+    def _bulk_create_queries(self, count):
+        """ Return the number of queries of a bulk create of 'count' linked recipes """
+        tags = [Tag.objects.create(user=self.user, name=f'Tag {i}') for i in range(3)]
+        ingredients = [
+            Ingredient.objects.create(user=self.user, name=f'Ingredient {i}')
+            for i in range(3)
+        ]
+        payload = [
+            {
+                'title': f'Recipe {i}',
+                'time_minutes': 10,
+                'price': '5.00',
+                'tags': [tag.id for tag in tags],
+                'ingredients': [ingredient.id for ingredient in ingredients],
+            }
+            for i in range(count)
+        ]
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.post(RECIPES_BULK_URL, payload, format='json')
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        return len([
+            query for query in queries.captured_queries
+            if query['sql'].startswith('SELECT')
+        ])
+
+    def test_bulk_links_validated_in_constant_queries(self):
+        """ Test the tags and ingredients are looked up once for the whole batch """
+        # only the SELECTs: SQLite inserts the recipes 1 by one (see 'bulk._insert').
+        one = self._bulk_create_queries(1)
+        Tag.objects.all().delete()
+        Ingredient.objects.all().delete()
+
+        self.assertEqual(self._bulk_create_queries(10), one)
+
+    def test_bulk_links_of_other_users_rejected(self):
+        """ Test recipes can't be linked to the tags of other users in bulk """
+        user2 = get_user_model().objects.create_user(
+            'other@joeshak.com',
+            'testpass'
+        )
+        theirs = Tag.objects.create(user=user2, name='Theirs')
+        mine = Tag.objects.create(user=self.user, name='Mine')
+        payload = [
+            {'title': title, 'time_minutes': 5, 'price': '1.00', 'tags': tags, 'ingredients': []}
+            for title, tags in (('A', [mine.id]), ('B', [theirs.id]), ('C', ['abc']))
+        ]
+
+        res = self.client.post(RECIPES_BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(res.data[0], {})
+        self.assertEqual(res.data[1]['tags'][0].code, 'does_not_exist')
+        self.assertEqual(res.data[2]['tags'][0].code, 'incorrect_type')
+        self.assertFalse(Recipe.objects.exists())
+
+    def test_bulk_update_recipes(self):
+        """ Test partially updating several recipes at once """
+        recipe1 = sample_recipe(self.user, title='Old 1')
+        recipe2 = sample_recipe(self.user, title='Old 2')
+        old_tag = Tag.objects.create(user=self.user, name='Old')
+        new_tag = Tag.objects.create(user=self.user, name='New')
+        recipe2.tags.add(old_tag)
+        payload = [
+            {'id': recipe1.id, 'title': 'New 1', 'price': '9.99'},
+            {'id': recipe2.id, 'tags': [new_tag.id]},
+        ]
+
+        res = self.client.patch(RECIPES_BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        recipe1.refresh_from_db()
+        recipe2.refresh_from_db()
+        self.assertEqual(recipe1.title, 'New 1')
+        self.assertEqual(str(recipe1.price), '9.99')
+        self.assertEqual(recipe2.title, 'Old 2')
+        self.assertEqual(list(recipe2.tags.all()), [new_tag])
+
+    def test_bulk_update_other_users_recipe_not_found(self):
+        """ Test recipes of other users can't be updated in bulk """
+        user2 = get_user_model().objects.create_user(
+            'other@joeshak.com',
+            'testpass'
+        )
+        mine = sample_recipe(self.user, title='Mine')
+        theirs = sample_recipe(user2, title='Theirs')
+        payload = [
+            {'id': mine.id, 'title': 'Changed'},
+            {'id': theirs.id, 'title': 'Changed'},
+        ]
+
+        res = self.client.patch(RECIPES_BULK_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(res.data[0], {})
+        self.assertIn('id', res.data[1])
+        mine.refresh_from_db()
+        theirs.refresh_from_db()
+        self.assertEqual(mine.title, 'Mine')
+        self.assertEqual(theirs.title, 'Theirs')
@@ -0,0 +1,153 @@
+import io
+
+from unittest.mock import patch
+
+from PIL import Image
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Recipe
+
+from recipe import images
+
+
+def image_upload_url(recipe_id):
+    """ Return URL for recipe image upload """
+    return reverse('recipe:recipe-upload-image', args=[recipe_id])
+
+
+def detail_url(recipe_id):
+    """ Return recipe detail URL """
+    return reverse('recipe:recipe-detail', args=[recipe_id])
+
+
+def sample_image(size=(1000, 500), image_format='JPEG'):
+    """ Return the bytes of a sample image """
+    buffer = io.BytesIO()
+    Image.new('RGB', size, color='red').save(buffer, format=image_format)
+    return buffer.getvalue()
+
+
+class ImageVariantTests(TestCase):
+    """ Test generating the recipe image variants """
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'user@joeshak.com',
+            'testpass'
+        )
+        self.recipe = Recipe.objects.create(
+            user=self.user,
+            title='Sample Recipe',
+            time_minutes=10,
+            price=5.00
+        )
+        self.recipe.image.save('sample.jpg', ContentFile(sample_image()))
+
+    def tearDown(self):
+        self.recipe.refresh_from_db()
+        images.delete_variant_files(self.recipe.image_variants)
+        self.recipe.image.delete()
+
+    def test_generate_variants(self):
+        """ Test the variants are resized and recorded on the recipe """
+        variants = images.generate_variants(self.recipe.id, self.recipe.image.name)
+
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.image_variants, variants)
+        self.assertIn('thumbnail', variants)
+        self.assertIn('medium', variants)
+        with default_storage.open(variants['thumbnail']) as f:
+            self.assertEqual(Image.open(f).size, (200, 100))
+        with default_storage.open(variants['medium']) as f:
+            self.assertEqual(Image.open(f).size, (800, 400))
+
+    def test_stale_variants_discarded(self):
+        """ Test variants of a replaced image are not recorded """
+        old_name = self.recipe.image.name
+        self.recipe.image.save('new.jpg', ContentFile(sample_image()))
+
+        variants = images.generate_variants(self.recipe.id, old_name)
+
+        self.assertEqual(variants, {})
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.image_variants, {})
+        default_storage.delete(old_name)
+
+    def test_unsupported_formats_skipped(self):
+        """ Test variants Pillow can't encode are skipped """
+        specs = {'thumbnail': ((50, 50), 'JPEG'), 'odd': ((50, 50), 'NOPE')}
+        with self.settings(RECIPE_IMAGE_VARIANTS=specs):
+            variants = images.generate_variants(
+                self.recipe.id, self.recipe.image.name
+            )
+
+        self.assertEqual(list(variants), ['thumbnail'])
+
+    def test_variant_urls_in_detail(self):
+        """ Test the recipe detail returns the variant URLs """
+        images.generate_variants(self.recipe.id, self.recipe.image.name)
+        client = APIClient()
+        client.force_authenticate(self.user)
+
+        res = client.get(detail_url(self.recipe.id))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertTrue(
+            res.data['image_variants']['thumbnail'].startswith('http://')
+        )
+
+
+class ImageUploadSchedulingTests(TestCase):
+    """ Test uploads schedule the variants instead of generating them """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@joeshak.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+        self.recipe = Recipe.objects.create(
+            user=self.user,
+            title='Sample Recipe',
+            time_minutes=10,
+            price=5.00,
+            image_variants={'thumbnail': 'uploads/recipe/old_thumbnail.jpg'}
+        )
+
+    def tearDown(self):
+        self.recipe.refresh_from_db()
+        self.recipe.image.delete()
+
+    @patch('recipe.images._run_task')
+    def test_upload_schedules_variants(self, mock_run_task):
+        """ Test the upload returns before the variants are generated """
+        upload = ContentFile(sample_image(), name='upload.jpg')
+
+        with patch.object(images, '_get_executor') as mock_executor:
+            with self.captureOnCommitCallbacks(execute=True) as callbacks:
+                res = self.client.post(
+                    image_upload_url(self.recipe.id),
+                    {'image': upload},
+                    format='multipart'
+                )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['image_variants'], {})
+        # the variants and the search vector of the saved recipe.
+        self.assertEqual(len(callbacks), 2)
+        self.recipe.refresh_from_db()
+        mock_executor.return_value.submit.assert_called_once_with(
+            mock_run_task,
+            self.recipe.id,
+            self.recipe.image.name,
+            {'thumbnail': 'uploads/recipe/old_thumbnail.jpg'}
+        )
@@ -0,0 +1,188 @@
+import re
+
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Recipe, Tag, Ingredient
+
+from recipe.pagination import RecipeCursorPagination
+
+
+RECIPES_URL = reverse('recipe:recipe-list')
+TAGS_URL = reverse('recipe:tag-list')
+INGREDIENTS_URL = reverse('recipe:ingredient-list')
+
+
+def sample_recipe(user, **params):
+    """ Create and return a sample recipe """
+    defaults = {
+        'title': 'Sample Recipe',
+        'time_minutes': 10,
+        'price': 5.00
+    }
+    defaults.update(params)
+
+    return Recipe.objects.create(user=user, **defaults)
+
+
+def get_link(res, rel):
+    """ Return the URL for 'rel' from the response 'Link' header """
+    match = re.search(rf'<([^>]+)>; rel="{rel}"', res.get('Link', ''))
+    return match.group(1) if match else None
+
+
+class CursorPaginationTests(TestCase):
+    """ Test the cursor pagination of the list endpoints """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@joeshak.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_recipes_paginated_newest_first(self):
+        """ Test walking through recipe pages returns every recipe once """
+        recipes = [
+            sample_recipe(self.user, title=f'Recipe {i}') for i in range(5)
+        ]
+
+        seen = []
+        url = RECIPES_URL + '?page_size=2'
+        while url:
+            res = self.client.get(url)
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            self.assertLessEqual(len(res.data), 2)
+            seen.extend(item['id'] for item in res.data)
+            url = get_link(res, 'next')
+
+        self.assertEqual(seen, [recipe.id for recipe in reversed(recipes)])
+
+    def test_recipe_pages_stable_under_inserts(self):
+        """ Test new recipes don't shift or repeat items on later pages """
+        for i in range(4):
+            sample_recipe(self.user, title=f'Recipe {i}')
+
+        res1 = self.client.get(RECIPES_URL, {'page_size': 2})
+        sample_recipe(self.user, title='Inserted while paging')
+        res2 = self.client.get(get_link(res1, 'next'))
+
+        first_ids = [item['id'] for item in res1.data]
+        second_ids = [item['id'] for item in res2.data]
+        self.assertEqual(len(second_ids), 2)
+        self.assertFalse(set(first_ids) & set(second_ids))
+        self.assertLess(max(second_ids), min(first_ids))
+
+    def test_page_size_capped(self):
+        """ Test the requested page size can't exceed the maximum """
+        for i in range(3):
+            sample_recipe(self.user, title=f'Recipe {i}')
+
+        with patch.object(RecipeCursorPagination, 'max_page_size', 2):
+            res = self.client.get(RECIPES_URL, {'page_size': 500})
+
+        self.assertEqual(len(res.data), 2)
+        self.assertIsNotNone(get_link(res, 'next'))
+
+    def test_pagination_composes_with_filters(self):
+        """ Test the next page keeps the filter query parameters """
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        tagged = []
+        for i in range(3):
+            recipe = sample_recipe(self.user, title=f'Tagged {i}')
+            recipe.tags.add(tag)
+            tagged.append(recipe.id)
+        sample_recipe(self.user, title='Untagged')
+
+        res = self.client.get(RECIPES_URL, {'tags': tag.id, 'page_size': 2})
+        next_link = get_link(res, 'next')
+        self.assertIn(f'tags={tag.id}', next_link)
+        res2 = self.client.get(next_link)
+
+        ids = [item['id'] for item in res.data + res2.data]
+        self.assertEqual(sorted(ids), sorted(tagged))
+        self.assertIsNone(get_link(res2, 'next'))
+
+    def test_tags_paginated_by_name(self):
+        """ Test tags are paged by name, including duplicated names """
+        for name in ['Apple', 'Banana', 'Banana', 'Cherry']:
+            Tag.objects.create(user=self.user, name=name)
+
+        res1 = self.client.get(TAGS_URL, {'page_size': 2})
+        res2 = self.client.get(get_link(res1, 'next'))
+
+        names = [item['name'] for item in res1.data + res2.data]
+        ids = [item['id'] for item in res1.data + res2.data]
+        self.assertEqual(names, ['Cherry', 'Banana', 'Banana', 'Apple'])
+        self.assertEqual(len(set(ids)), 4)
+
+    def test_ingredients_assigned_only_paginated(self):
+        """ Test the assigned_only filter works with pagination """
+        recipe = sample_recipe(self.user)
+        for name in ['Salt', 'Pepper', 'Garlic']:
+            recipe.ingredients.add(
+                Ingredient.objects.create(user=self.user, name=name)
+            )
+        Ingredient.objects.create(user=self.user, name='Unused')
+
+        res1 = self.client.get(
+            INGREDIENTS_URL, {'assigned_only': 1, 'page_size': 2}
+        )
+        res2 = self.client.get(get_link(res1, 'next'))
+
+        names = [item['name'] for item in res1.data + res2.data]
+        self.assertEqual(names, ['Salt', 'Pepper', 'Garlic'])
+
+
+class KeysetPaginationTests(TestCase):
+    """ Test paging through orderings with many equal values """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@joeshak.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+
+    def _walk(self, url, rel='next'):
+        """ Follow the 'rel' links from 'url', return the IDs of every page """
+        ids = []
+        while url:
+            res = self.client.get(url)
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            ids.extend(item['id'] for item in res.data)
+            last = res
+            url = get_link(res, rel)
+        return ids, last
+
+    def test_more_ties_than_offset_cutoff(self):
+        """ Test more than 1000 recipes with the same value are each returned once """
+        Recipe.objects.bulk_create([
+            Recipe(user=self.user, title=f'Recipe {i}', time_minutes=10, price=5)
+            for i in range(2500)
+        ])
+        expected = list(
+            Recipe.objects.filter(user=self.user).order_by('id').values_list('id', flat=True)
+        )
+
+        ids, last = self._walk(RECIPES_URL + '?ordering=time_minutes&page_size=500')
+
+        self.assertEqual(ids, expected)
+        # and back from the last page.
+        previous_ids, _first = self._walk(get_link(last, 'prev'), rel='prev')
+        self.assertEqual(len(previous_ids), 2000)
+        self.assertEqual(sorted(previous_ids), expected[:2000])
+
+    def test_invalid_cursor(self):
+        """ Test a malformed cursor is a 404 instead of an error """
+        for cursor in ('abc', 'cD0lNUIlMjJ4JTIyJTVE', 'cD0lNUIlMjJ4JTIyJTJDMSU1RA=='):
+            res = self.client.get(RECIPES_URL, {'ordering': 'price', 'cursor': cursor})
+            self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND, cursor)
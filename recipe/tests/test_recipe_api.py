@@ -3,11 +3,14 @@
 # a temp file somewhere in the system and then you can remove that file after you've used it.
 import tempfile
 import os
+import json
 
 from PIL import Image
 
 from django.contrib.auth import get_user_model
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
 from rest_framework import status
@@ -20,6 +23,7 @@ from recipe.serializers import RecipeSerializer, RecipeDetailSerializer
 # So the 1st bit (before ":") is the app
 # and the 2nd bit is the identifier of the URL in the app "" recipe-list
 RECIPES_URL = reverse('recipe:recipe-list')
+EXPORT_URL = reverse('recipe:recipe-export')
 
 
 def image_upload_url(recipe_id):
@@ -320,3 +324,399 @@ class RecipeImageUploadTests(TestCase):
         self.assertNotIn(serializer3.data, res.data)
 
 
+
+
+class RecipeQueryCountTests(TestCase):
+    """ Test that the recipe endpoints run in a constant number of queries """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@joeshak.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+
+    def _create_recipes(self, count):
+        """ Create recipes that each have their own tags and ingredients """
+        recipes = []
+        for i in range(count):
+            recipe = sample_recipe(user=self.user, title=f'Recipe {i}')
+            recipe.tags.add(
+                sample_tag(user=self.user, name=f'Tag {i}a'),
+                sample_tag(user=self.user, name=f'Tag {i}b')
+            )
+            recipe.ingredients.add(
+                sample_ingredient(user=self.user, name=f'Ingredient {i}')
+            )
+            recipes.append(recipe)
+        return recipes
+
+    def test_list_recipes_query_count_is_constant(self):
+        """ Test listing recipes doesn't issue queries per recipe """
+        self._create_recipes(2)
+        # 1 query for the recipes + 1 per prefetched relation (tags, ingredients)
+        with self.assertNumQueries(3):
+            res = self.client.get(RECIPES_URL)
+        self.assertEqual(len(res.data), 2)
+
+        self._create_recipes(8)
+        with self.assertNumQueries(3):
+            res = self.client.get(RECIPES_URL)
+        self.assertEqual(len(res.data), 10)
+
+    def test_list_recipes_prefetched_data_matches(self):
+        """ Test the prefetched list returns the same tags and ingredients """
+        recipe = self._create_recipes(1)[0]
+
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(
+            sorted(res.data[0]['tags']),
+            sorted(recipe.tags.values_list('id', flat=True))
+        )
+        self.assertEqual(
+            res.data[0]['ingredients'],
+            list(recipe.ingredients.values_list('id', flat=True))
+        )
+
+    def test_retrieve_recipe_query_count_is_constant(self):
+        """ Test viewing a recipe detail with nested objects is constant """
+        recipe = self._create_recipes(1)[0]
+        recipe.tags.add(*[
+            sample_tag(user=self.user, name=f'Extra {i}') for i in range(5)
+        ])
+
+        with self.assertNumQueries(3):
+            res = self.client.get(detail_url(recipe.id))
+
+        self.assertEqual(res.data, RecipeDetailSerializer(recipe).data)
+
+
+class RecipeExportTests(TestCase):
+    """ Test streaming the recipe export """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@joeshak.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+
+    def _read_lines(self, res):
+        """ Consume a streaming response and parse each JSON line """
+        content = b''.join(res.streaming_content).decode()
+        return [json.loads(line) for line in content.splitlines()]
+
+    def test_export_requires_auth(self):
+        """ Test that authentication is required for the export """
+        res = APIClient().get(EXPORT_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_export_streams_all_recipes(self):
+        """ Test the export streams every recipe of the user as NDJSON """
+        tag = sample_tag(user=self.user)
+        recipes = []
+        for i in range(5):
+            recipe = sample_recipe(user=self.user, title=f'Recipe {i}')
+            recipe.tags.add(tag)
+            recipes.append(recipe)
+        other_user = get_user_model().objects.create_user(
+            'other@joeshak.com',
+            'testpass'
+        )
+        sample_recipe(user=other_user)
+
+        with self.settings(RECIPE_EXPORT_CHUNK_SIZE=2):
+            res = self.client.get(EXPORT_URL)
+
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            self.assertTrue(res.streaming)
+            self.assertEqual(res['Content-Type'], 'application/x-ndjson')
+            lines = self._read_lines(res)
+
+        expected = RecipeSerializer(reversed(recipes), many=True).data
+        self.assertEqual(lines, json.loads(json.dumps(expected)))
+
+    def test_export_queries_per_chunk_not_per_recipe(self):
+        """ Test the export runs a constant number of queries per chunk """
+        for i in range(5):
+            recipe = sample_recipe(user=self.user, title=f'Recipe {i}')
+            recipe.ingredients.add(sample_ingredient(user=self.user))
+
+        with self.settings(RECIPE_EXPORT_CHUNK_SIZE=2):
+            res = self.client.get(EXPORT_URL)
+            # 3 chunks (2 + 2 + 1 recipes) x (recipes + tags + ingredients)
+            with self.assertNumQueries(9):
+                lines = self._read_lines(res)
+
+        self.assertEqual(len(lines), 5)
+
+    def test_export_ignores_ordering(self):
+        """ Test the export returns every recipe once whatever the '?ordering=' """
+        recipes = [
+            sample_recipe(
+                user=self.user,
+                title=f'Recipe {i}',
+                price=(i * 7) % 10,
+                time_minutes=(i * 3) % 8
+            )
+            for i in range(25)
+        ]
+
+        with self.settings(RECIPE_EXPORT_CHUNK_SIZE=5):
+            for ordering in ('price', '-price', 'time_minutes', '-time_minutes'):
+                res = self.client.get(EXPORT_URL, {'ordering': ordering})
+                ids = [line['id'] for line in self._read_lines(res)]
+                self.assertEqual(ids, [recipe.id for recipe in reversed(recipes)], ordering)
+
+    def test_export_applies_filters(self):
+        """ Test the export uses the same filters as the list """
+        recipe1 = sample_recipe(user=self.user, title='Tagged')
+        sample_recipe(user=self.user, title='Not tagged')
+        tag = sample_tag(user=self.user)
+        recipe1.tags.add(tag)
+
+        res = self.client.get(EXPORT_URL, {'tags': tag.id})
+
+        lines = self._read_lines(res)
+        self.assertEqual([line['id'] for line in lines], [recipe1.id])
+
+
+class RecipeFilterTests(TestCase):
+    """ Test filtering recipes by tags and ingredients """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@joeshak.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+        self.vegan = sample_tag(user=self.user, name='Vegan')
+        self.dessert = sample_tag(user=self.user, name='Dessert')
+
+    def test_filter_any_tags_no_duplicates(self):
+        """ Test a recipe matching several tags is returned once """
+        recipe = sample_recipe(user=self.user, title='Vegan brownies')
+        recipe.tags.add(self.vegan, self.dessert)
+
+        res = self.client.get(
+            RECIPES_URL,
+            {'tags': f'{self.vegan.id},{self.dessert.id}'}
+        )
+
+        self.assertEqual([item['id'] for item in res.data], [recipe.id])
+
+    def test_filter_all_tags(self):
+        """ Test tags_mode=all only returns recipes with every tag """
+        both = sample_recipe(user=self.user, title='Vegan brownies')
+        both.tags.add(self.vegan, self.dessert)
+        vegan_only = sample_recipe(user=self.user, title='Lentil soup')
+        vegan_only.tags.add(self.vegan)
+
+        res_all = self.client.get(
+            RECIPES_URL,
+            {'tags': f'{self.vegan.id},{self.dessert.id}', 'tags_mode': 'all'}
+        )
+        res_any = self.client.get(
+            RECIPES_URL,
+            {'tags': f'{self.vegan.id},{self.dessert.id}', 'tags_mode': 'any'}
+        )
+
+        self.assertEqual([item['id'] for item in res_all.data], [both.id])
+        self.assertEqual(
+            sorted(item['id'] for item in res_any.data),
+            sorted([both.id, vegan_only.id])
+        )
+
+    def test_filter_tags_and_ingredients_no_duplicates(self):
+        """ Test combining tag and ingredient filters doesn't multiply rows """
+        cocoa = sample_ingredient(user=self.user, name='Cocoa')
+        sugar = sample_ingredient(user=self.user, name='Sugar')
+        recipe = sample_recipe(user=self.user, title='Vegan brownies')
+        recipe.tags.add(self.vegan, self.dessert)
+        recipe.ingredients.add(cocoa, sugar)
+        sample_recipe(user=self.user, title='No links')
+
+        res = self.client.get(RECIPES_URL, {
+            'tags': f'{self.vegan.id},{self.dessert.id}',
+            'ingredients': f'{cocoa.id},{sugar.id}',
+            'ingredients_mode': 'all',
+        })
+
+        self.assertEqual([item['id'] for item in res.data], [recipe.id])
+
+    def test_filter_invalid_mode(self):
+        """ Test an unknown matching mode returns a bad request """
+        res = self.client.get(
+            RECIPES_URL,
+            {'tags': f'{self.vegan.id}', 'tags_mode': 'some'}
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class RecipeRangeOrderingTests(TestCase):
+    """ Test filtering and ordering recipes by price and time """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@joeshak.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+        self.quick_cheap = sample_recipe(
+            user=self.user, title='Toast', time_minutes=5, price=2.50
+        )
+        self.quick_pricey = sample_recipe(
+            user=self.user, title='Steak', time_minutes=20, price=25.00
+        )
+        self.slow_cheap = sample_recipe(
+            user=self.user, title='Stew', time_minutes=120, price=8.00
+        )
+
+    def _ids(self, params):
+        res = self.client.get(RECIPES_URL, params)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return [item['id'] for item in res.data]
+
+    def test_filter_price_and_time(self):
+        """ Test the price range and maximum time filters """
+        self.assertEqual(
+            self._ids({'time_max': 30, 'price_max': '10'}),
+            [self.quick_cheap.id]
+        )
+        self.assertEqual(
+            sorted(self._ids({'price_min': '5', 'price_max': '25'})),
+            sorted([self.quick_pricey.id, self.slow_cheap.id])
+        )
+
+    def test_ordering(self):
+        """ Test ordering the recipes by price and time """
+        self.assertEqual(
+            self._ids({'ordering': 'price'}),
+            [self.quick_cheap.id, self.slow_cheap.id, self.quick_pricey.id]
+        )
+        self.assertEqual(
+            self._ids({'ordering': '-time_minutes'}),
+            [self.slow_cheap.id, self.quick_pricey.id, self.quick_cheap.id]
+        )
+
+    def test_ordering_paginated(self):
+        """ Test paging through an ordered list returns every recipe once """
+        same_price = sample_recipe(user=self.user, title='Soup', price=8.00)
+
+        res1 = self.client.get(RECIPES_URL, {'ordering': 'price', 'page_size': 2})
+        res2 = self.client.get(res1['Link'].split(';')[0].strip('<>'))
+
+        self.assertEqual(
+            [item['id'] for item in res1.data + res2.data],
+            [self.quick_cheap.id, self.slow_cheap.id,
+             same_price.id, self.quick_pricey.id]
+        )
+
+    def test_invalid_params(self):
+        """ Test invalid filter values return a bad request instead of an error """
+        for params in (
+            {'tags': 'abc'},
+            {'ingredients': '1,,2'},
+            {'price_min': 'cheap'},
+            {'time_max': '-1'},
+            {'price_min': '10', 'price_max': '5'},
+            {'ordering': 'title'},
+        ):
+            res = self.client.get(RECIPES_URL, params)
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST, params)
+
+
+class RecipeFieldsetTests(TestCase):
+    """ Test choosing the recipe fields with '?fields=' and '?expand=' """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@joeshak.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+        self.recipe = sample_recipe(user=self.user, title='Vegan curry', price=8.00)
+        self.tag = sample_tag(user=self.user, name='Vegan')
+        self.recipe.tags.add(self.tag)
+        self.recipe.ingredients.add(sample_ingredient(user=self.user))
+
+    def test_list_only_requested_fields(self):
+        """ Test only the requested fields are returned, loaded and prefetched """
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get(RECIPES_URL, {'fields': 'id,title'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data, [{'id': self.recipe.id, 'title': 'Vegan curry'}])
+        # no tag or ingredient prefetch, and only the needed columns.
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('"price"', queries[0]['sql'])
+        self.assertNotIn('"link"', queries[0]['sql'])
+
+    def test_list_skips_unrequested_prefetch(self):
+        """ Test only the requested relations are prefetched """
+        with self.assertNumQueries(2):
+            res = self.client.get(RECIPES_URL, {'fields': 'id,tags'})
+
+        self.assertEqual(res.data, [{'id': self.recipe.id, 'tags': [self.tag.id]}])
+
+    def test_list_expand(self):
+        """ Test '?expand=' nests the full objects in the list """
+        res = self.client.get(RECIPES_URL, {'expand': 'tags'})
+
+        self.assertEqual(res.data[0]['tags'], [{'id': self.tag.id, 'name': 'Vegan'}])
+        self.assertEqual(res.data[0]['ingredients'], [self.recipe.ingredients.get().id])
+        self.assertIn('price', res.data[0])
+
+    def test_detail_fields(self):
+        """ Test the detail can be pruned too """
+        res = self.client.get(detail_url(self.recipe.id), {'fields': 'title,tags'})
+
+        self.assertEqual(
+            res.data,
+            {'title': 'Vegan curry', 'tags': [{'id': self.tag.id, 'name': 'Vegan'}]}
+        )
+
+    def test_ordering_field_loaded(self):
+        """ Test the cursor pagination works without its ordering field in '?fields=' """
+        sample_recipe(user=self.user, title='Soup', price=3.00)
+
+        with self.assertNumQueries(1):
+            res1 = self.client.get(
+                RECIPES_URL, {'fields': 'id', 'ordering': 'price', 'page_size': 1}
+            )
+        res2 = self.client.get(res1['Link'].split(';')[0].strip('<>'))
+
+        self.assertEqual(res2.data, [{'id': self.recipe.id}])
+
+    def test_export_fields(self):
+        """ Test the export uses the requested fields """
+        res = self.client.get(EXPORT_URL, {'fields': 'id,title'})
+
+        content = b''.join(res.streaming_content).decode()
+        self.assertEqual(
+            [json.loads(line) for line in content.splitlines()],
+            [{'id': self.recipe.id, 'title': 'Vegan curry'}]
+        )
+
+    def test_writes_return_every_field(self):
+        """ Test '?fields=' doesn't change the response of a write """
+        res = self.client.patch(
+            detail_url(self.recipe.id) + '?fields=id', {'title': 'Red curry'}
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIn('title', res.data)
+
+    def test_unknown_fields_rejected(self):
+        """ Test unknown fields and expansions return a bad request """
+        for params in ({'fields': 'id,secret'}, {'expand': 'title'}):
+            res = self.client.get(RECIPES_URL, params)
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST, params)
@@ -0,0 +1,233 @@
+import importlib
+import json
+import re
+
+from unittest.mock import MagicMock, patch
+
+from django.contrib.auth import get_user_model
+from django.db.models import F, FloatField, Value
+from django.db.models.functions import Cast
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Recipe, Tag, Ingredient
+
+from recipe import search
+
+
+RECIPES_URL = reverse('recipe:recipe-list')
+EXPORT_URL = reverse('recipe:recipe-export')
+
+
+def sample_recipe(user, **params):
+    """ Create and return a sample recipe """
+    defaults = {
+        'title': 'Sample Recipe',
+        'time_minutes': 10,
+        'price': 5.00
+    }
+    defaults.update(params)
+
+    return Recipe.objects.create(user=user, **defaults)
+
+
+class RecipeSearchTests(TestCase):
+    """ Test searching recipes (the fallback used without PostgreSQL) """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@joeshak.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+
+    def _search(self, term):
+        res = self.client.get(RECIPES_URL, {'search': term})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return sorted(item['id'] for item in res.data)
+
+    def test_search_title(self):
+        """ Test searching by recipe title """
+        curry = sample_recipe(self.user, title='Thai green curry')
+        sample_recipe(self.user, title='Fish and chips')
+
+        self.assertEqual(self._search('curry'), [curry.id])
+
+    def test_search_tag_and_ingredient_names(self):
+        """ Test searching by the names of the tags and ingredients """
+        soup = sample_recipe(self.user, title='Soup')
+        soup.tags.add(Tag.objects.create(user=self.user, name='Vegan'))
+        salad = sample_recipe(self.user, title='Salad')
+        salad.ingredients.add(Ingredient.objects.create(user=self.user, name='Feta'))
+        sample_recipe(self.user, title='Steak')
+
+        self.assertEqual(self._search('vegan'), [soup.id])
+        self.assertEqual(self._search('feta'), [salad.id])
+
+    def test_search_all_words_required(self):
+        """ Test every word of the search must match """
+        recipe = sample_recipe(self.user, title='Green curry')
+        recipe.tags.add(Tag.objects.create(user=self.user, name='Spicy'))
+        sample_recipe(self.user, title='Red curry')
+
+        self.assertEqual(self._search('curry spicy'), [recipe.id])
+
+    def test_search_no_duplicates(self):
+        """ Test a recipe matching several links is returned once """
+        recipe = sample_recipe(self.user, title='Tomato pasta')
+        recipe.ingredients.add(
+            Ingredient.objects.create(user=self.user, name='Tomato'),
+            Ingredient.objects.create(user=self.user, name='Tomato puree'),
+        )
+
+        self.assertEqual(self._search('tomato'), [recipe.id])
+
+    def test_search_limited_to_user(self):
+        """ Test the search only returns the user's recipes """
+        user2 = get_user_model().objects.create_user(
+            'other@joeshak.com',
+            'testpass'
+        )
+        sample_recipe(user2, title='Curry')
+
+        self.assertEqual(self._search('curry'), [])
+
+
+class SearchVectorMaintenanceTests(TestCase):
+    """ Test the search vectors are refreshed when recipes change """
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'test@joeshak.com',
+            'testpass'
+        )
+
+    @patch('recipe.search.update_search_vectors')
+    def test_vector_refreshed_on_changes(self, mock_update):
+        """ Test saving recipes, links and renames refresh the vectors """
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe = sample_recipe(self.user)
+        mock_update.assert_called_with([recipe.id])
+
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        mock_update.reset_mock()
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.tags.add(tag)
+        mock_update.assert_called_with([recipe.id])
+
+        mock_update.reset_mock()
+        with self.captureOnCommitCallbacks(execute=True):
+            tag.recipe_set.remove(recipe)
+        mock_update.assert_called_with({recipe.id})
+
+        recipe.tags.add(tag)
+        mock_update.reset_mock()
+        tag.name = 'Plant based'
+        with self.captureOnCommitCallbacks(execute=True):
+            tag.save()
+        self.assertEqual(list(mock_update.call_args[0][0]), [recipe.id])
+
+    @patch('recipe.search.update_search_vectors')
+    def test_vector_refreshed_after_commit(self, mock_update):
+        """ Test the vectors are only refreshed once the change is committed """
+        with self.captureOnCommitCallbacks() as callbacks:
+            recipe = sample_recipe(self.user)
+        mock_update.assert_not_called()
+
+        for callback in callbacks:
+            callback()
+        mock_update.assert_called_once_with([recipe.id])
+
+
+class RankedSearchExportTests(TestCase):
+    """ Test the export of ranked search results (the PostgreSQL path) """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user('test@joeshak.com', 'testpass')
+        self.client.force_authenticate(self.user)
+
+    def test_export_ignores_search_rank(self):
+        """ Test the export returns every match once instead of paging on the rank """
+        recipes = [
+            sample_recipe(user=self.user, title=f'Curry {i}', price=(i * 7) % 10)
+            for i in range(12)
+        ]
+
+        def ranked_search(queryset, term):
+            # like the PostgreSQL search: every recipe matches with a rank.
+            return queryset.annotate(search_rank=F('price')), True
+
+        with patch.object(search, 'search_recipes', side_effect=ranked_search), \
+                self.settings(RECIPE_EXPORT_CHUNK_SIZE=5):
+            res = self.client.get(EXPORT_URL, {'search': 'curry'})
+            content = b''.join(res.streaming_content).decode()
+
+        ids = [json.loads(line)['id'] for line in content.splitlines()]
+        self.assertEqual(ids, [recipe.id for recipe in reversed(recipes)])
+
+
+class RankedSearchPaginationTests(TestCase):
+    """ Test paging through ranked search results (the PostgreSQL path) """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user('test@joeshak.com', 'testpass')
+        self.client.force_authenticate(self.user)
+
+    def test_rank_is_exact_float(self):
+        """ Test the rank is a double precision float, so the cursor keeps it exactly """
+        with patch.object(search, 'is_full_text_supported', return_value=True):
+            queryset, ranked = search.search_recipes(Recipe.objects.all(), 'curry')
+
+        self.assertTrue(ranked)
+        rank = queryset.query.annotations['search_rank']
+        self.assertIsInstance(rank, Cast)
+        self.assertIsInstance(rank.output_field, FloatField)
+
+    def test_tied_ranks_paginated(self):
+        """ Test more than 1000 matches with the same rank are each listed once """
+        Recipe.objects.bulk_create([
+            Recipe(user=self.user, title=f'Curry {i}', time_minutes=10, price=5)
+            for i in range(1100)
+        ])
+
+        def ranked_search(queryset, term):
+            # like the PostgreSQL search, with the same rank for every recipe.
+            return queryset.annotate(search_rank=Value(0.1, FloatField())), True
+
+        ids = []
+        url = RECIPES_URL + '?search=curry&page_size=500'
+        with patch.object(search, 'search_recipes', side_effect=ranked_search):
+            while url:
+                res = self.client.get(url)
+                ids.extend(item['id'] for item in res.data)
+                url = re.search(r'<([^>]+)>; rel="next"', res.get('Link', ''))
+                url = url and url.group(1)
+
+        self.assertEqual(len(ids), 1100)
+        self.assertEqual(len(set(ids)), 1100)
+
+
+class SearchVectorMigrationTests(TestCase):
+    """ Test the migration filling the search vectors """
+
+    @override_settings(RECIPE_SEARCH_CONFIG='french')
+    def test_backfill_uses_search_config(self):
+        """ Test the existing recipes are indexed with the app's language """
+        migration = importlib.import_module('core.migrations.0010_recipe_search_vector')
+        schema_editor = MagicMock()
+        schema_editor.connection.vendor = 'postgresql'
+
+        migration.create_search_index(None, schema_editor)
+
+        schema_editor.execute.assert_called_with(
+            migration.UPDATE_SEARCH_VECTORS_SQL, {'config': 'french'}
+        )
+        # the migration has its own copy of the SQL instead of importing the app's code.
+        self.assertNotIn('search', vars(migration))
+
@@ -0,0 +1,103 @@
+import io
+
+from PIL import Image
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Recipe
+
+
+def image_upload_url(recipe_id):
+    """ Return URL for recipe image upload """
+    return reverse('recipe:recipe-upload-image', args=[recipe_id])
+
+
+def sample_upload(size=(10, 10), image_format='JPEG', name='upload.jpg'):
+    """ Return an uploadable image file """
+    buffer = io.BytesIO()
+    Image.new('RGB', size).save(buffer, format=image_format)
+    return ContentFile(buffer.getvalue(), name=name)
+
+
+class BoundedImageUploadTests(TestCase):
+    """ Test the size limited and verified image uploads """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@joeshak.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+        self.recipe = Recipe.objects.create(
+            user=self.user,
+            title='Sample Recipe',
+            time_minutes=10,
+            price=5.00
+        )
+        self.url = image_upload_url(self.recipe.id)
+
+    def tearDown(self):
+        self.recipe.refresh_from_db()
+        self.recipe.image.delete()
+
+    def test_upload_valid_image(self):
+        """ Test a valid image within the limits is saved """
+        res = self.client.post(
+            self.url, {'image': sample_upload()}, format='multipart'
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.recipe.refresh_from_db()
+        self.assertTrue(self.recipe.image)
+
+    def test_upload_too_large_rejected(self):
+        """ Test uploads larger than the limit are rejected while reading """
+        # the 1st is caught while streaming, the 2nd from the request's Content-Length.
+        for size in (140 * 1024, 1024 * 1024):
+            upload = ContentFile(b'\xff' * size, name='large.jpg')
+
+            with self.settings(RECIPE_IMAGE_MAX_UPLOAD_SIZE=100 * 1024):
+                res = self.client.post(
+                    self.url, {'image': upload}, format='multipart'
+                )
+
+            self.assertEqual(
+                res.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+            )
+            self.recipe.refresh_from_db()
+            self.assertFalse(self.recipe.image)
+
+    def test_upload_not_an_image_rejected(self):
+        """ Test a file that isn't an image is rejected """
+        upload = ContentFile(b'not an image at all', name='fake.jpg')
+
+        res = self.client.post(self.url, {'image': upload}, format='multipart')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('image', res.data)
+
+    def test_upload_decompression_bomb_rejected(self):
+        """ Test images with too many pixels are rejected before decoding """
+        upload = sample_upload(size=(2000, 2000), image_format='PNG', name='bomb.png')
+
+        with self.settings(RECIPE_IMAGE_MAX_PIXELS=1000 * 1000):
+            res = self.client.post(self.url, {'image': upload}, format='multipart')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.recipe.refresh_from_db()
+        self.assertFalse(self.recipe.image)
+
+    def test_upload_unsupported_format_rejected(self):
+        """ Test images in formats that aren't allowed are rejected """
+        upload = sample_upload(image_format='BMP', name='image.bmp')
+
+        res = self.client.post(self.url, {'image': upload}, format='multipart')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,102 @@
+import warnings
+
+from PIL import Image, UnidentifiedImageError
+
+from django.conf import settings
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.utils.translation import gettext_lazy as _
+
+from rest_framework import exceptions, status
+
+from core import metrics
+
+
+class UploadTooLarge(exceptions.APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = _('The uploaded file is too large.')
+    default_code = 'upload_too_large'
+
+
+def verify_image(file, max_pixels):
+    """ Check that a file is an allowed image without decoding its pixels """
+    allowed_formats = getattr(
+        settings, 'RECIPE_IMAGE_ALLOWED_FORMATS', ('JPEG', 'PNG', 'WEBP', 'GIF')
+    )
+    try:
+        # 'Image.open' is lazy: it only reads the header (format, width, height),
+        # the pixel data is only decoded when it's actually used.
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', Image.DecompressionBombWarning)
+            with Image.open(file) as image:
+                image_format = image.format
+                width, height = image.size
+    except Image.DecompressionBombError:
+        raise exceptions.ValidationError(
+            {'image': [_('The image has too many pixels.')]}
+        )
+    except (UnidentifiedImageError, OSError, SyntaxError, ValueError):
+        raise exceptions.ValidationError(
+            {'image': [_('Upload a valid image.')]}
+        )
+    finally:
+        file.seek(0)
+
+    if image_format not in allowed_formats:
+        raise exceptions.ValidationError(
+            {'image': [_('Unsupported image format.')]}
+        )
+    # a "decompression bomb" is a tiny file (e.g. a PNG of 1 color) that would
+    # take gigabytes of memory to decode, so we check the size before anybody decodes it.
+    if width * height > max_pixels:
+        raise exceptions.ValidationError(
+            {'image': [_('The image has too many pixels.')]}
+        )
+
+
+# Django reads uploads through "upload handlers". the default ones keep small files in memory
+# and don't limit the size, so a large upload is fully received before anybody can reject it.
+# this handler always streams the file to a temporary file in small chunks
+# (so the memory of each upload stays the same no matter the file size),
+# stops as soon as the limit is passed and checks the image header when the file is complete.
+# if "FILE_UPLOAD_TEMP_DIR" is on the same volume as "MEDIA_ROOT", saving the
+# file afterwards is just a rename instead of a copy.
+class BoundedImageUploadHandler(TemporaryFileUploadHandler):
+    """ Upload handler that limits the size of uploaded images and verifies them """
+
+    def __init__(self, request=None, max_size=None, max_pixels=None):
+        super().__init__(request)
+        self.max_size = max_size or getattr(
+            settings, 'RECIPE_IMAGE_MAX_UPLOAD_SIZE', 10 * 1024 * 1024
+        )
+        self.max_pixels = max_pixels or getattr(
+            settings, 'RECIPE_IMAGE_MAX_PIXELS', 40_000_000
+        )
+        self.received = 0
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        # the request body is the file plus the multipart boundaries and the other fields,
+        # so only reject straight away when it's clearly too large.
+        if content_length and content_length > self.max_size + 64 * 1024:
+            raise UploadTooLarge()
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.received = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > self.max_size:
+            self.upload_interrupted()
+            raise UploadTooLarge()
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        metrics.UPLOADS.inc()
+        metrics.UPLOAD_BYTES.inc(file_size)
+        try:
+            verify_image(file, self.max_pixels)
+        except exceptions.ValidationError:
+            self.upload_interrupted()
+            raise
+        return file
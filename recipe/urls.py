@@ -1,6 +1,9 @@
+from django.conf import settings
 from django.urls import path, include
+from django.urls.resolvers import URLPattern
 from rest_framework.routers import DefaultRouter
 
+from core.asyncviews import async_view
 from recipe import views
 
 
@@ -11,7 +14,25 @@ router.register('recipes', views.RecipeViewSet)
 
 app_name = 'recipe'
 
+# the read endpoints that are served by async views when 'ASYNC_READ_VIEWS' is on,
+# see 'core/asyncviews.py'. (it only helps when the app is served with ASGI.)
+ASYNC_READ_URL_NAMES = ('recipe-list', 'recipe-detail', 'tag-list', 'ingredient-list')
+
+
+def with_async_reads(urls):
+    """ Replace the views of the read endpoints with async views """
+    return [
+        URLPattern(url.pattern, async_view(url.callback), url.default_args, url.name)
+        if isinstance(url, URLPattern) and url.name in ASYNC_READ_URL_NAMES
+        else url
+        for url in urls
+    ]
+
+
+router_urls = router.urls
+if getattr(settings, 'ASYNC_READ_VIEWS', False):
+    router_urls = with_async_reads(router_urls)
+
 urlpatterns = [
-    path('', include(router.urls))
+    path('', include(router_urls))
 ]
-
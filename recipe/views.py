@@ -1,12 +1,28 @@
+import functools
+
+from django.conf import settings
+from django.db.models import Prefetch
+from django.http import StreamingHttpResponse
+
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 from rest_framework import viewsets, mixins, status
-from rest_framework.authentication import TokenAuthentication
 from rest_framework.permissions import IsAuthenticated
 
+from core.authentication import CachedTokenAuthentication, SignedTokenAuthentication
 from core.models import Tag, Ingredient, Recipe
 
 from recipe import serializers
+from recipe import autocomplete
+from recipe import bulk
+from recipe import cache
+from recipe import filters
+from recipe import images
+from recipe import search
+from recipe.pagination import RecipeCursorPagination, RecipeAttrCursorPagination
+from recipe.streaming import iter_ndjson
+from recipe.uploads import BoundedImageUploadHandler
 
 
 # we can refactor this code to reduce the code duplication and
@@ -18,8 +34,9 @@ class BaseRecipeAttrViewSet(viewsets.GenericViewSet,
                             mixins.ListModelMixin,
                             mixins.CreateModelMixin):
     """ Base viewset for user owned recipe attributes """
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication, SignedTokenAuthentication)
     permission_classes = (IsAuthenticated,)
+    pagination_class = RecipeAttrCursorPagination
 
     def get_queryset(self):
         """ Return objects for the current authenticated user only """
@@ -34,6 +51,38 @@ class BaseRecipeAttrViewSet(viewsets.GenericViewSet,
             user=self.request.user
         ).order_by('-name').distinct()
 
+    # tags and ingredients are read a lot more than they change, so the list responses are
+    # cached per user. the cache key includes a per-user version that is bumped (by the
+    # signals in 'recipe/signals.py') whenever a tag/ingredient or a recipe link changes.
+    # the same key gives us an ETag so clients that already have the list get a '304 Not Modified'.
+    def list(self, request, *args, **kwargs):
+        """ List the objects, served from the cache when nothing changed """
+        cache_key = cache.list_cache_key(
+            request.user.id,
+            self.basename,
+            request.query_params
+        )
+        etag = cache.etag_for(cache_key)
+        if cache.etag_matches(etag, request.headers.get('If-None-Match')):
+            return Response(
+                status=status.HTTP_304_NOT_MODIFIED,
+                headers={'ETag': etag}
+            )
+
+        cached = cache.get_list(cache_key)
+        if cached is None:
+            response = super().list(request, *args, **kwargs)
+            headers = {}
+            if response.has_header('Link'):
+                headers['Link'] = response['Link']
+            cached = {'data': response.data, 'headers': headers}
+            cache.set_list(cache_key, cached)
+
+        return Response(
+            cached['data'],
+            headers={**cached['headers'], 'ETag': etag}
+        )
+
     # Overriding the "perform_create" so that we can assign the tag to the correct user.
     # "perform_create" function allows us to hook into the "create" process when creating an object.
     # what happens is when we do a "create" object in our viewset, this function will be invoked
@@ -42,6 +91,45 @@ class BaseRecipeAttrViewSet(viewsets.GenericViewSet,
         """ Create a new tag """
         serializer.save(user=self.request.user)
 
+    # '?q=' is what the user typed so far, '?limit=' how many suggestions to return.
+    @action(methods=['GET'], detail=False, url_path='autocomplete')
+    def autocomplete(self, request):
+        """ Suggest names matching a partial name """
+        term = request.query_params.get('q', '').strip()
+        default_limit, max_limit = autocomplete.get_limits()
+        try:
+            limit = int(request.query_params.get('limit', default_limit))
+        except ValueError:
+            raise ValidationError({'limit': 'A valid integer is required.'})
+        if not 1 <= limit <= max_limit:
+            raise ValidationError({'limit': f'Must be between 1 and {max_limit}.'})
+        if not term:
+            return Response([])
+
+        return Response(autocomplete.autocomplete(
+            self.queryset, request.user.id, self.basename, term, limit
+        ))
+
+    # import jobs create thousands of objects, the 'bulk' endpoint accepts a list
+    # and creates all of them in 1 transaction with a few big INSERTs.
+    # if any item is invalid nothing is created and the errors are returned
+    # as a list in the same order as the items (an empty dict for the valid ones).
+    @action(methods=['POST'], detail=False, url_path='bulk')
+    def bulk(self, request):
+        """ Create several objects at once """
+        bulk.check_batch(request.data)
+        serializer = self.get_serializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+        objs = bulk.create_attrs(
+            self.queryset.model,
+            request.user,
+            serializer.validated_data
+        )
+        return Response(
+            self.get_serializer(objs, many=True).data,
+            status=status.HTTP_201_CREATED
+        )
+
 class TagViewSet(BaseRecipeAttrViewSet):
     """Manage tags in the database"""
     queryset = Tag.objects.all()
@@ -56,35 +144,116 @@ class IngredientViewSet(BaseRecipeAttrViewSet):
 class RecipeViewSet(viewsets.ModelViewSet):
     """ Manage Recipes in the database """
     serializer_class = serializers.RecipeSerializer
-    queryset = Recipe.objects.all()
-    authentication_classes = (TokenAuthentication,)
+    # the search vector is only used inside the database, no need to send it to Python.
+    queryset = Recipe.objects.defer('search_vector')
+    authentication_classes = (CachedTokenAuthentication, SignedTokenAuthentication)
     permission_classes = (IsAuthenticated,)
+    pagination_class = RecipeCursorPagination
+    # set per action (see 'upload_image' and 'export'), used by 'core/throttling.py'.
+    throttle_scope = None
+    throttle_cost = 1
 
     # Python doesn't have the concept of public and private functions.
     # All functions are public functions.
     # however what you can do is to provide an '_' before the name of the function
     # this is the common convention when you wanna indicate that a function is intended to
     # be private as you will still be able to call it as a public function.
-    def _params_to_ints(self, qs):
-        """Convert a list of string IDs to a list of integers"""
-        return [int(str_id) for str_id in qs.split(',')]
+    def _get_filter_params(self):
+        """ Return the validated filter and ordering query params """
+        # cached on the view, 'get_queryset' can be called more than once per request.
+        if not hasattr(self, '_filter_params'):
+            serializer = filters.RecipeFilterSerializer(
+                data=self.request.query_params
+            )
+            serializer.is_valid(raise_exception=True)
+            self._filter_params = serializer.validated_data
+        return self._filter_params
 
     def get_queryset(self):
         """ Retrieve the recipe for the authenticated user """
-        tags = self.request.query_params.get('tags')
-        ingredients = self.request.query_params.get('ingredients')
+        params = self._get_filter_params()
         queryset = self.queryset
-        if tags:
-            tag_ids = self._params_to_ints(tags)
-            # 'tags__id__in': thi is the Django syntax for filtering on foreign key objects.
-            # '__in': this is a function called 'in' in which basically says return all of
-            # tags where the ID is in this list that we provide 'tags_ids'.
-            queryset = queryset.filter(tags__id__in=tag_ids)
-        if ingredients:
-            ingredient_ids = self._params_to_ints(ingredients)
-            queryset = queryset.filter(ingredients__id__in=ingredient_ids)
-
-        return queryset.filter(user=self.request.user)
+        # by default a recipe matches if it has any of the requested tags (?tags=1,2),
+        # '?tags_mode=all' only returns the recipes that have all of them.
+        if params.get('tags'):
+            queryset = filters.filter_by_related(
+                queryset, 'tags', params['tags'], params['tags_mode']
+            )
+        if params.get('ingredients'):
+            queryset = filters.filter_by_related(
+                queryset,
+                'ingredients',
+                params['ingredients'],
+                params['ingredients_mode']
+            )
+        # '?price_min=&price_max=&time_max=' e.g. "under 30 minutes and under $10".
+        queryset = filters.filter_by_ranges(queryset, params)
+
+        # '?search=' looks for the words in the title, tag names and ingredient names.
+        self._search_ranked = False
+        term = self.request.query_params.get('search', '').strip()
+        if term:
+            queryset, self._search_ranked = search.search_recipes(queryset, term)
+
+        ordering = self.get_pagination_ordering() or ('-id',)
+        queryset = queryset.filter(user=self.request.user).order_by(*ordering)
+
+        # '?fields=' only loads the columns of the requested fields, plus the ordering
+        # fields because the cursor pagination reads them from the last recipe of the page.
+        fields = self._get_fieldset()[0]
+        if fields is not None:
+            columns = {field.name for field in Recipe._meta.concrete_fields}
+            queryset = queryset.only(*(
+                {'id'}
+                | (set(fields) & columns)
+                | ({name.lstrip('-') for name in ordering} & columns)
+            ))
+        return self._prefetch_for_action(queryset)
+
+    def _get_fieldset(self):
+        """ Return the (fields, expand) requested with '?fields=&expand=' """
+        # only the reads can choose their fields, the writes return the whole recipe.
+        if self.action not in ('list', 'retrieve', 'export'):
+            return None, ()
+        if not hasattr(self, '_fieldset'):
+            self._fieldset = self.get_serializer_class().parse_fieldset(
+                self.request.query_params
+            )
+        return self._fieldset
+
+    def get_pagination_ordering(self):
+        """ Return the ordering of the paginated list for this request """
+        # '?ordering=' (e.g. '?ordering=price', cheapest first) wins over the search rank.
+        # the ordering must end with the unique 'id', the cursor pagination keeps the
+        # value of every field (see 'recipe/pagination.py').
+        ordering = self._get_filter_params().get('ordering')
+        if ordering:
+            return filters.RECIPE_ORDERINGS[ordering]
+        # the best matches come first when the search results are ranked.
+        if getattr(self, '_search_ranked', False):
+            return ('-search_rank', '-id')
+        return None
+
+    # Every recipe in a response needs its tags and ingredients, so without prefetching
+    # each recipe would cost 2 extra queries (N+1). 'prefetch_related' loads all of
+    # the related objects for the whole page in 1 query per relation instead.
+    # the list only needs the primary keys ('PrimaryKeyRelatedField') while
+    # the detail (and '?expand=') nests the full objects, so we only load the columns
+    # each action needs, and nothing for the fields left out by '?fields='.
+    def _prefetch_for_action(self, queryset):
+        """ Attach the related object loading plan for the current action """
+        # 'upload_image' only touches the image field so it doesn't need any related objects.
+        if self.action == 'upload_image':
+            return queryset
+        fields, expand = self._get_fieldset()
+        prefetches = []
+        for name, model in (('tags', Tag), ('ingredients', Ingredient)):
+            if fields is not None and name not in fields:
+                continue
+            nested = self.action == 'retrieve' or name in expand
+            columns = ('id', 'name') if nested else ('id',)
+            prefetches.append(Prefetch(name, queryset=model.objects.only(*columns)))
+        return queryset.prefetch_related(*prefetches)
 
     # this is a function that's called to retrieve the serializer class for a particular request.
     def get_serializer_class(self):
@@ -97,10 +266,33 @@ class RecipeViewSet(viewsets.ModelViewSet):
 
         return self.serializer_class
 
+    def get_serializer(self, *args, **kwargs):
+        """ Return the serializer with the fields requested by '?fields=&expand=' """
+        fields, expand = self._get_fieldset()
+        if fields is not None or expand:
+            kwargs.setdefault('fields', fields)
+            kwargs.setdefault('expand', expand)
+        return super().get_serializer(*args, **kwargs)
+
+    def get_serializer_context(self):
+        """ Add the tags and ingredients preloaded for a bulk request """
+        context = super().get_serializer_context()
+        if hasattr(self, '_preloaded_objects'):
+            context['preloaded_objects'] = self._preloaded_objects
+        return context
+
     def perform_create(self, serializer):
         """ Create a new recipe """
         serializer.save(user=self.request.user)
 
+    # the upload handlers must be set before the request body is read, so we do it
+    # when the request is set up, before any of the view code runs.
+    def initialize_request(self, request, *args, **kwargs):
+        """ Use the size limited upload handler for image uploads """
+        if self.action_map.get(request.method.lower()) == 'upload_image':
+            request.upload_handlers = [BoundedImageUploadHandler(request)]
+        return super().initialize_request(request, *args, **kwargs)
+
     # Now you define actions as functions in the viewset by default.
     # It has these 'get_queryset', 'get_serializer_class', and 'perform_create', these are all
     # default actions that we override so if we didn't override them then they will just perform
@@ -113,7 +305,8 @@ class RecipeViewSet(viewsets.ModelViewSet):
     # the detail is a specific recipe detail
     # 'url_path': that will be the path that is visible within the URL
     # it will be 'recipe/id/upload-image'
-    @action(methods=['POST'], detail=True, url_path='upload-image')
+    # 'throttle_scope': the uploads also have their own, lower, rate (see 'core/throttling.py').
+    @action(methods=['POST'], detail=True, url_path='upload-image', throttle_scope='uploads')
     def upload_image(self, request, pk=None):
         """ Upload an image to a recipe """
 
@@ -124,7 +317,12 @@ class RecipeViewSet(viewsets.ModelViewSet):
             data=request.data
         )
         if serializer.is_valid():
-            serializer.save()
+            old_variants = recipe.image_variants
+            # the previous variants belong to the previous image.
+            recipe = serializer.save(image_variants={})
+            # resizing and re-encoding is slow, so it's done by a background worker
+            # and the upload returns straight away.
+            images.schedule_variants(recipe, old_variants)
             return Response(
                 serializer.data,
                 status=status.HTTP_200_OK
@@ -135,3 +333,87 @@ class RecipeViewSet(viewsets.ModelViewSet):
         )
 
 
+
+    # the export is for clients that need every recipe at once (backups, imports into other apps).
+    # Instead of building 1 huge list in memory, the rows are read and sent chunk by chunk
+    # with 'StreamingHttpResponse' so the memory stays flat and the client starts
+    # receiving data before the last row is fetched.
+    # the format is NDJSON: 1 JSON recipe per line.
+    # under ASGI the chunks are queried in a thread by 'core/asgi.py', not in the event loop.
+    # reading every recipe costs about as much as 10 pages of the list, for the throttling.
+    @action(methods=['GET'], detail=False, url_path='export', throttle_cost=10)
+    def export(self, request):
+        """ Stream all of the user's recipes as newline delimited JSON """
+        chunk_size = getattr(settings, 'RECIPE_EXPORT_CHUNK_SIZE', 500)
+        fields, expand = self._get_fieldset()
+        # the chunks are fetched with 'id < last id' (see 'recipe/streaming.py'), which only
+        # works in '-id' order, so '?ordering=' and the search rank don't apply to the export.
+        content = iter_ndjson(
+            self.get_queryset().order_by('-id'),
+            functools.partial(self.get_serializer_class(), fields=fields, expand=expand),
+            chunk_size,
+            context=self.get_serializer_context()
+        )
+        response = StreamingHttpResponse(
+            content,
+            content_type='application/x-ndjson'
+        )
+        response['Content-Disposition'] = 'attachment; filename="recipes.ndjson"'
+        return response
+
+    # the bulk version of create (POST) and partial update (PATCH), see 'recipe/bulk.py'.
+    # the whole batch is saved in 1 transaction: if any item is invalid nothing is saved and
+    # the errors are returned as a list in the same order as the items.
+    @action(methods=['POST', 'PATCH'], detail=False, url_path='bulk')
+    def bulk(self, request):
+        """ Create or update several recipes at once """
+        bulk.check_batch(request.data)
+        # all the tags and ingredients of the batch are loaded in 1 query per model.
+        self._preloaded_objects = bulk.preload_links(request.user, request.data)
+        if request.method == 'PATCH':
+            recipes = self._bulk_update(request.data)
+            response_status = status.HTTP_200_OK
+        else:
+            serializer = self.get_serializer(data=request.data, many=True)
+            serializer.is_valid(raise_exception=True)
+            recipes = bulk.create_recipes(request.user, serializer.validated_data)
+            response_status = status.HTTP_201_CREATED
+
+        # load the tags and ingredients of all the recipes in 2 queries for the response.
+        ids = [recipe.id for recipe in recipes]
+        loaded = self._prefetch_for_action(Recipe.objects.filter(id__in=ids)).in_bulk(ids)
+        return Response(
+            self.get_serializer([loaded[pk] for pk in ids], many=True).data,
+            status=response_status
+        )
+
+    def _bulk_update(self, items):
+        """ Validate and apply a list of partial recipe updates """
+        ids = []
+        for item in items:
+            try:
+                ids.append(int(item['id']))
+            except (TypeError, KeyError, ValueError):
+                pass
+        recipes = Recipe.objects.filter(user=self.request.user).in_bulk(ids)
+
+        errors = []
+        updates = []
+        for item in items:
+            try:
+                recipe = recipes.get(int(item['id']))
+            except (TypeError, KeyError, ValueError):
+                recipe = None
+            if recipe is None:
+                errors.append({'id': ['Recipe not found.']})
+                continue
+            serializer = self.get_serializer(recipe, data=item, partial=True)
+            if serializer.is_valid():
+                errors.append({})
+                updates.append((recipe, serializer.validated_data))
+            else:
+                errors.append(serializer.errors)
+
+        if any(errors):
+            raise ValidationError(errors)
+        return bulk.update_recipes(self.request.user, updates)
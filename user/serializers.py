@@ -8,6 +8,13 @@ from django.utils.translation import ugettext_lazy as _
 
 from rest_framework import serializers
 
+from core import authentication
+from core import hashers
+
+
+TOKEN_TYPE_DATABASE = 'token'
+TOKEN_TYPE_SIGNED = 'signed'
+
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -38,7 +45,7 @@ class UserSerializer(serializers.ModelSerializer):
         user = super().update(instance, validated_data)
 
         if password:
-            user.set_password(password)
+            hashers.set_password(user, password)
             user.save()
 
         return user
@@ -52,6 +59,12 @@ class AuthTokenSerializer(serializers.Serializer):
         style={'input_type': 'password'},
         trim_whitespace=False
     )
+    # 'signed' returns a stateless signed token (see 'core/authentication.py')
+    # instead of the token stored in the database.
+    token_type = serializers.ChoiceField(
+        choices=(TOKEN_TYPE_DATABASE, TOKEN_TYPE_SIGNED),
+        default=TOKEN_TYPE_DATABASE
+    )
 
 
     # "validate": it's called when we validate our serializer
@@ -64,6 +77,13 @@ class AuthTokenSerializer(serializers.Serializer):
         email = attrs.get('email')
         password = attrs.get('password')
 
+        if (
+            attrs.get('token_type') == TOKEN_TYPE_SIGNED
+            and not authentication.get_signed_token_config()['ENABLED']
+        ):
+            msg = _('Signed tokens are not enabled')
+            raise serializers.ValidationError({'token_type': [msg]}, code='invalid')
+
         user = authenticate(
             # this is how you basically access the context of the request that was made.
             # so we're gonna pass this into our viewset
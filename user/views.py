@@ -1,11 +1,18 @@
-from rest_framework import generics, authentication, permissions
+from rest_framework import generics, permissions, status
 # "ObtainAuthToken": this comes with Django rest framework
 # so you're authenticated using a username and password as a standard.
 # using this by making "ObtainAuthToken directly into our URLs"
+from rest_framework.authtoken.models import Token
 from rest_framework.authtoken.views import ObtainAuthToken
+from rest_framework.response import Response
 from rest_framework.settings import api_settings
+from rest_framework.views import APIView
 
-from .serializers import UserSerializer, AuthTokenSerializer
+from core import authentication
+from core.authentication import CachedTokenAuthentication, SignedTokenAuthentication
+from core.throttling import UserTokenBucketThrottle
+
+from .serializers import UserSerializer, AuthTokenSerializer, TOKEN_TYPE_SIGNED
 
 
 class CreateUserView(generics.CreateAPIView):
@@ -16,6 +23,9 @@ class CreateUserView(generics.CreateAPIView):
 class CreateTokenView(ObtainAuthToken):
     """ Create a new auth token for user """
     serializer_class = AuthTokenSerializer
+    # 'ObtainAuthToken' isn't throttled, but every login hashes a password,
+    # so the anonymous clients get the 'anon' rate (see 'core/throttling.py').
+    throttle_classes = (UserTokenBucketThrottle,)
 
     # we can set our renderer class and
     # all this does is it sets the renderer class and
@@ -25,6 +35,35 @@ class CreateTokenView(ObtainAuthToken):
     # if you don't this, then you have to use a tool such as CURL or some other tool to basically make the HTTP POST request.
     renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES
 
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        user = serializer.validated_data['user']
+
+        if serializer.validated_data['token_type'] == TOKEN_TYPE_SIGNED:
+            return Response({
+                'token': authentication.create_signed_token(user),
+                'token_type': SignedTokenAuthentication.keyword,
+                'expires_in': authentication.get_signed_token_config()['MAX_AGE'],
+            })
+
+        token, created = Token.objects.get_or_create(user=user)
+        return Response({'token': token.key})
+
+
+class RevokeTokenView(APIView):
+    """ Revoke the token used to authenticate the request (logout) """
+    authentication_classes = (CachedTokenAuthentication, SignedTokenAuthentication)
+    permission_classes = (permissions.IsAuthenticated,)
+
+    def post(self, request, *args, **kwargs):
+        if isinstance(request.auth, Token):
+            # a new database token is created on the next login.
+            request.auth.delete()
+        else:
+            authentication.revoke_signed_token(request.auth)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
 # Authentication is the mechanism by which the authentication happens
 # so this could be cookie authentication or we're gonna use is Token Authentication
 
@@ -34,7 +73,7 @@ class CreateTokenView(ObtainAuthToken):
 class ManageUserView(generics.RetrieveUpdateAPIView):
     """ Manage the Authenticated User """
     serializer_class = UserSerializer
-    authentication_classes = (authentication.TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication, SignedTokenAuthentication)
     permission_classes = (permissions.IsAuthenticated,)
 
     # we're gonna override the "get_object" and we're just gonna return the user that is authenticated.